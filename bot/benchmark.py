@@ -0,0 +1,341 @@
+"""اندازه‌گیری سرعت مسیرهای پرکاربرد ربات روی داده‌های ساختگی بزرگ
+
+برای هر حالت ذخیره‌سازی و هر اندازه داده (تعداد آیتم‌ها و نمره‌ها) یک پوشه موقت ساخته
+می‌شود، داده‌های ساختگی با seed ثابت در آن نوشته و ربات از روی آن بارگذاری می‌شود. بعد
+متدهای WishlistBot مستقیم و handlerها با updateهای ساختگی (fakes.py) و بدون شبکه اجرا
+می‌شوند. برای هر عملیات صدک‌های زمان، حافظه گرفته شده (tracemalloc) و بایت‌های نوشته شده
+روی دیسک گزارش می‌شود و می‌شود نتیجه را با یک اجرای قبلی مقایسه کرد.
+
+    python benchmark.py --sizes 100 10000 1000000 --storage json sqlite
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json      # کد خروج 1 اگر کندتر شده باشد
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# نوشتن‌ها همزمان انجام شوند تا بایت‌های هر عملیات به خود آن نسبت داده شود
+os.environ.setdefault('PANIRBOT_SAVE_DELAY_MS', '0')
+
+SIZES = (100, 1000, 10000)
+STORAGE_MODES = ('json', 'journal', 'snapshot', 'sqlite')
+ITEMS_PER_CATEGORY = 100
+RATINGS_PER_MOVIE = 10
+BENCH_USER_ID = 1000
+WORDS = ('فیلم', 'کتاب', 'سفر', 'خرید', 'بازی', 'کافه', 'کنسرت', 'movie', 'book', 'trip', 'game', 'gift')
+# عملیات‌هایی که با اندازه داده خطی هستند کمتر تکرار می‌شوند
+HEAVY_OPS = ('save_data',)
+
+
+def percentile(values, fraction):
+    """صدک fraction از مقادیر مرتب شده (نزدیک‌ترین رتبه)"""
+    index = min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def bytes_written():
+    """کل بایت‌هایی که این پروسه تا الان نوشته (فقط لینوکس) یا None"""
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def make_dataset(size, seed=0):
+    """داده‌های ساختگی با size آیتم و size نمره، به همان قالب wishlist_data.json"""
+    rng = random.Random(seed)
+    categories = {}
+    for index in range(size):
+        cat_id = str(index // ITEMS_PER_CATEGORY + 1)
+        if cat_id not in categories:
+            categories[cat_id] = {'name': f"{rng.choice(WORDS)} {cat_id}", 'icon': '📝', 'items': []}
+        categories[cat_id]['items'].append({
+            'id': str(index + 1),
+            'text': f"{rng.choice(WORDS)} {rng.choice(WORDS)} {index + 1}",
+            'completed': rng.random() < 0.3,
+            'created_at': '2025-01-01 12:00',
+            'added_by': f"user{index % 50}"
+        })
+
+    movie_ratings = {}
+    for movie_id in range(1, max(1, size // RATINGS_PER_MOVIE) + 1):
+        ratings = [{
+            'rating': rng.randint(1, 10),
+            'comment': '',
+            'user_name': f"user{user_id}",
+            'user_id': user_id,
+            'date': f"2025-01-{rng.randint(1, 28):02d} 12:00"
+        } for user_id in range(1, RATINGS_PER_MOVIE + 1)]
+        movie_ratings[f"{rng.choice(WORDS)} {movie_id}"] = {
+            'id': movie_id,
+            'ratings': ratings,
+            'average': sum(r['rating'] for r in ratings) / len(ratings),
+            'total_ratings': len(ratings)
+        }
+
+    return {
+        'categories': categories,
+        'next_category_id': len(categories) + 1,
+        'next_item_id': size + 1,
+        'next_movie_id': len(movie_ratings) + 1,
+        'movie_ratings': movie_ratings,
+        'allowed_users': [BENCH_USER_ID]
+    }
+
+
+class Case:
+    """یک اجرای ربات روی یک اندازه داده و یک حالت ذخیره‌سازی"""
+
+    def __init__(self, panirbot, mode, size, seed):
+        self.panirbot = panirbot
+        self.mode = mode
+        self.size = size
+        self.rng = random.Random(seed)
+        self.directory = tempfile.mkdtemp(prefix=f'panirbot-bench-{mode}-{size}-')
+        self.update_ids = iter(range(1, 1 << 62))
+
+    def setup(self, data):
+        """نوشتن داده‌ها و بارگذاری یک WishlistBot تازه از روی آن‌ها؛ خروجی: زمان بارگذاری"""
+        panirbot = self.panirbot
+        os.chdir(self.directory)
+        panirbot.STORAGE_MODE = self.mode
+        storage = panirbot.create_storage(self.mode, panirbot.DATA_FILE, threading.RLock(), panirbot.DB_FILE)
+        storage.save(data)
+        storage.close()
+
+        started = time.perf_counter()
+        panirbot.bot = panirbot.WishlistBot()
+        load_seconds = time.perf_counter() - started
+        # ایندکس جستجوی داده‌های بزرگ در پس‌زمینه ساخته می‌شود
+        panirbot.bot.search_ready.wait()
+        self.search_index_seconds = time.perf_counter() - started
+        self.reset_caches()
+        self.items = [
+            (cat_id, item['id'])
+            for cat_id, category in data['categories'].items() for item in category['items']
+        ]
+        self.movies = list(data['movie_ratings'])
+        return load_seconds
+
+    def reset_caches(self):
+        panirbot = self.panirbot
+        panirbot.render_cache = panirbot.RenderCache()
+        panirbot.inline_memo = panirbot.RenderCache(panirbot.INLINE_MEMO_SIZE)
+
+    def teardown(self):
+        self.panirbot.bot.close()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def operations(self, application):
+        """نام عملیات و تابعی که یک بار آن را اجرا می‌کند (sync یا async)"""
+        from fakes import callback_update, inline_update
+        from telegram import Update
+
+        panirbot = self.panirbot
+        bot = panirbot.bot
+        rng = self.rng
+
+        def update(payload):
+            return Update.de_json(payload, application.bot)
+
+        def toggle_item():
+            bot.toggle_item(*rng.choice(self.items), "bench")
+
+        def add_movie_rating():
+            bot.add_movie_rating(rng.choice(self.movies), rng.randint(1, 10), '', "bench", rng.randint(1, 50))
+
+        async def toggle_item_button():
+            data = panirbot.router.pack("toggle_item", *rng.choice(self.items))
+            await application.process_update(update(callback_update(next(self.update_ids), BENCH_USER_ID, data)))
+
+        async def movie_stats():
+            data = panirbot.router.pack("movie_stats")
+            await application.process_update(update(callback_update(next(self.update_ids), BENCH_USER_ID, data)))
+
+        async def inline_query():
+            query = rng.choice(WORDS)
+            await application.process_update(update(inline_update(next(self.update_ids), BENCH_USER_ID, query)))
+
+        return {
+            'save_data': bot.save_data,
+            'toggle_item': toggle_item,
+            'add_movie_rating': add_movie_rating,
+            'get_movie_ratings': lambda: bot.get_movie_ratings('rating'),
+            'toggle_item_button': toggle_item_button,
+            'movie_stats': movie_stats,
+            'inline_query': inline_query,
+        }
+
+
+async def call(operation):
+    result = operation()
+    if asyncio.iscoroutine(result):
+        await result
+
+
+async def measure(operation, repeat, cold, case, trace_repeat):
+    """اجرای repeat باره یک عملیات؛ خروجی: آمار زمان، بایت‌های نوشته شده و حافظه"""
+    timings = []
+    written = 0
+    for _ in range(repeat):
+        if cold:
+            case.reset_caches()
+        before = bytes_written()
+        started = time.perf_counter()
+        await call(operation)
+        timings.append(time.perf_counter() - started)
+        after = bytes_written()
+        if before is not None:
+            written += after - before
+
+    # tracemalloc اجرا را کند می‌کند، پس حافظه در یک دور جدا اندازه گرفته می‌شود
+    allocated = []
+    tracemalloc.start()
+    try:
+        for _ in range(trace_repeat):
+            if cold:
+                case.reset_caches()
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await call(operation)
+            allocated.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'count': repeat,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'peak_alloc_kb': statistics.fmean(allocated) / 1024 if allocated else None,
+        'bytes_written': written // repeat if bytes_written() is not None else None,
+    }
+
+
+async def run_case(panirbot, mode, size, args):
+    from fakes import FakeRequest
+
+    case = Case(panirbot, mode, size, args.seed)
+    data = make_dataset(size, args.seed)
+    results = {'load': {'seconds': case.setup(data)}}
+    results['load']['search_ready_seconds'] = case.search_index_seconds
+    del data
+    application = panirbot.build_application('1:fake', request=FakeRequest(), updater=False, concurrent_updates=1)
+    await application.initialize()
+    try:
+        for name, operation in case.operations(application).items():
+            if args.ops and name not in args.ops:
+                continue
+            repeat = max(3, args.repeat // 10) if name in HEAVY_OPS else args.repeat
+            results[name] = await measure(operation, repeat, args.cold, case, min(repeat, args.trace_repeat))
+    finally:
+        await application.shutdown()
+        case.teardown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """مقایسه p50 هر عملیات با baseline؛ خروجی: لیست عملیات‌هایی که کندتر شده‌اند"""
+    regressions = []
+    print(f"\n📊 مقایسه با baseline (آستانه ×{threshold}):")
+    for key, ops in results.items():
+        for name, stats in ops.items():
+            old = baseline.get(key, {}).get(name)
+            if not old or 'p50_ms' not in stats or not old.get('p50_ms'):
+                continue
+            ratio = stats['p50_ms'] / old['p50_ms']
+            mark = '🔴' if ratio > threshold else ('🟢' if ratio < 1 / threshold else '⚪')
+            print(f"  {mark} {key:<16} {name:<20} {old['p50_ms']:9.3f} → {stats['p50_ms']:9.3f} ms  ×{ratio:.2f}")
+            if ratio > threshold:
+                regressions.append((key, name, ratio))
+    return regressions
+
+
+def print_case(key, ops):
+    load = ops['load']
+    print(f"\n▶️ {key}  (بارگذاری: {load['seconds']:.3f} ثانیه، ایندکس جستجو: {load['search_ready_seconds']:.3f} ثانیه)")
+    print(f"  {'عملیات':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KB':>10} {'bytes':>10}")
+    for name, stats in ops.items():
+        if name == 'load':
+            continue
+        alloc = f"{stats['peak_alloc_kb']:.1f}" if stats['peak_alloc_kb'] is not None else '-'
+        written = stats['bytes_written'] if stats['bytes_written'] is not None else '-'
+        print(f"  {name:<20} {stats['p50_ms']:9.3f} {stats['p95_ms']:9.3f} {stats['p99_ms']:9.3f} "
+              f"{alloc:>10} {written:>10}")
+
+
+async def run(args):
+    # panirbot هنگام import یک ربات در پوشه جاری می‌سازد، پس import در یک پوشه موقت انجام می‌شود
+    os.chdir(tempfile.mkdtemp(prefix='panirbot-bench-'))
+    import panirbot
+    logging.disable(logging.INFO)
+
+    results = {}
+    for mode in args.storage:
+        for size in args.sizes:
+            key = f"{mode}/{size}"
+            results[key] = await run_case(panirbot, mode, size, args)
+            print_case(key, results[key])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="اندازه‌گیری سرعت ربات روی داده‌های ساختگی")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="تعداد آیتم‌ها و نمره‌ها")
+    parser.add_argument('--storage', nargs='+', choices=STORAGE_MODES, default=list(STORAGE_MODES))
+    parser.add_argument('--ops', nargs='+', help="فقط این عملیات‌ها")
+    parser.add_argument('--repeat', type=int, default=200, help="تعداد اجرای هر عملیات")
+    parser.add_argument('--trace-repeat', type=int, default=20, help="تعداد اجرا با tracemalloc")
+    parser.add_argument('--cold', action='store_true', help="خالی کردن کش صفحه‌ها قبل از هر اجرا")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="ذخیره نتایج به صورت JSON")
+    parser.add_argument('--baseline', help="فایل نتایج قبلی برای مقایسه")
+    parser.add_argument('--threshold', type=float, default=1.25, help="نسبت p50 که کندتر شدن حساب می‌شود")
+    args = parser.parse_args()
+    # مسیرهای نسبی قبل از رفتن به پوشه‌های موقت کامل می‌شوند
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    results = asyncio.run(run(args))
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'seed': args.seed,
+                    'repeat': args.repeat,
+                    'cold': args.cold,
+                },
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 نتایج در {output} ذخیره شد")
+
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
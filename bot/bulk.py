@@ -0,0 +1,285 @@
+"""ورود و خروج گروهی دسته‌ها، آیتم‌ها و نمره‌ها با فایل CSV یا JSONL
+
+هر سطر فایل یک رکورد است و نوع آن در type می‌آید:
+
+    {"type": "category", "category": "کتاب", "icon": "📚"}
+    {"type": "item", "category": "کتاب", "text": "...", "completed": false, "created_at": "...", "added_by": "..."}
+    {"type": "rating", "movie": "Inception", "rating": 9, "comment": "", "user_name": "...", "user_id": 1, "date": "..."}
+
+در CSV همین کلیدها ستون‌های فایل هستند (FIELDS) و خانه خالی یعنی مقدار پیش‌فرض. دسته‌ها
+با نام پیدا و اگر نباشند ساخته می‌شوند. آیتم تکراری (همان متن در همان دسته) دوباره اضافه
+نمی‌شود و نمره هر کاربر جای نمره قبلی او به همان فیلم را می‌گیرد، پس وارد کردن دوباره یک
+فایل داده‌ها را تغییر نمی‌دهد. اول همه سطرها بررسی می‌شوند و بعد کل فایل با
+WishlistBot.batch() و یک بار نوشتن ذخیره می‌شود. رکوردها در تکه‌های IMPORT_CHUNK تایی و هر تکه
+زیر قفل داده‌ها ثبت می‌شوند؛ import_records_async بین تکه‌ها event loop را آزاد می‌کند.
+
+    python bot/bulk.py import movies.csv
+    python bot/bulk.py export backup.jsonl
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+
+FIELDS = (
+    'type', 'category', 'icon', 'text', 'completed', 'created_at', 'added_by',
+    'movie', 'rating', 'comment', 'user_name', 'user_id', 'date'
+)
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', '✅'}
+DEFAULT_USER_NAME = "ورود گروهی"
+# هر چند رکورد یک بار پیشرفت گزارش می‌شود
+PROGRESS_EVERY = 1000
+# تعداد رکوردهایی که پشت سر هم و زیر یک بار گرفتن قفل ثبت می‌شوند
+IMPORT_CHUNK = 200
+
+
+class BulkError(ValueError):
+    """فایل یا رکورد نامعتبر؛ در این حالت هیچ چیزی وارد نمی‌شود"""
+
+
+def detect_format(filename):
+    """csv یا jsonl بر اساس پسوند فایل"""
+    fmt = FORMATS.get(os.path.splitext(filename)[1].lower())
+    if fmt is None:
+        raise BulkError(f"قالب فایل {filename} پشتیبانی نمی‌شود (فقط .csv یا .jsonl)")
+    return fmt
+
+
+def _required(record, key, line_no):
+    value = record.get(key)
+    if value is None or str(value).strip() == '':
+        raise BulkError(f"سطر {line_no}: {key} خالی است")
+    return str(value).strip()
+
+
+def _integer(record, key, line_no):
+    try:
+        return int(_required(record, key, line_no))
+    except ValueError:
+        raise BulkError(f"سطر {line_no}: {key} باید عدد باشد") from None
+
+
+def _optional(record, key):
+    value = record.get(key)
+    return str(value) if value not in (None, '') else None
+
+
+def normalize_record(record, line_no):
+    """بررسی یک رکورد خوانده شده و تبدیل مقادیر آن به نوع درست"""
+    kind = record.get('type') or ('rating' if record.get('movie') else 'item')
+    if kind == 'category':
+        return {'type': kind, 'category': _required(record, 'category', line_no), 'icon': record.get('icon') or '⭐'}
+    if kind == 'item':
+        completed = record.get('completed')
+        return {
+            'type': kind,
+            'category': _required(record, 'category', line_no),
+            'text': _required(record, 'text', line_no),
+            'completed': completed if isinstance(completed, bool) else str(completed).strip().lower() in TRUE_VALUES,
+            'created_at': _optional(record, 'created_at'),
+            'added_by': _optional(record, 'added_by') or DEFAULT_USER_NAME,
+        }
+    if kind == 'rating':
+        rating = _integer(record, 'rating', line_no)
+        if not 1 <= rating <= 10:
+            raise BulkError(f"سطر {line_no}: نمره باید بین 1 و 10 باشد")
+        return {
+            'type': kind,
+            'movie': _required(record, 'movie', line_no),
+            'rating': rating,
+            'comment': record.get('comment') or '',
+            'user_name': _optional(record, 'user_name') or DEFAULT_USER_NAME,
+            'user_id': _integer(record, 'user_id', line_no),
+            'date': _optional(record, 'date'),
+        }
+    raise BulkError(f"سطر {line_no}: نوع رکورد نامعتبر: {kind}")
+
+
+def read_records(stream, fmt):
+    """رکوردهای بررسی شده یک فایل متنی، یکی یکی و بدون خواندن کل فایل در حافظه"""
+    if fmt == 'csv':
+        # سطر اول فایل CSV نام ستون‌هاست
+        for line_no, row in enumerate(csv.DictReader(stream), 2):
+            yield normalize_record({key: value for key, value in row.items() if key}, line_no)
+        return
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise BulkError(f"سطر {line_no}: JSON نامعتبر ({error.msg})") from None
+        if not isinstance(record, dict):
+            raise BulkError(f"سطر {line_no}: هر سطر باید یک شیء JSON باشد")
+        yield normalize_record(record, line_no)
+
+
+def load_records(content, fmt):
+    """همه رکوردهای محتوای یک فایل (bytes)؛ اگر یک سطر نامعتبر باشد BulkError"""
+    stream = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig', newline='')
+    try:
+        return list(read_records(stream, fmt))
+    except UnicodeDecodeError:
+        raise BulkError("فایل باید با UTF-8 ذخیره شده باشد") from None
+    except csv.Error as error:
+        raise BulkError(f"CSV نامعتبر: {error}") from None
+
+
+def _import_chunks(bot, records, stats):
+    """ثبت رکوردها تکه به تکه؛ بعد از هر تکه تعداد رکوردهای ثبت شده را yield می‌کند
+
+    قفل بین تکه‌ها آزاد است، پس دسته‌ای که در این فاصله حذف شده دوباره ساخته می‌شود.
+    """
+    # متن آیتم‌های هر دسته، فقط برای دسته‌هایی که در فایل آمده‌اند
+    texts = {}
+
+    def category_id(name, icon='⭐'):
+        cat_id = bot.find_category(name)
+        if cat_id is None:
+            cat_id = bot.add_category(name, icon)
+            stats['categories'] += 1
+        return cat_id
+
+    for start in range(0, len(records), IMPORT_CHUNK):
+        with bot.transaction():
+            for record in records[start:start + IMPORT_CHUNK]:
+                if record['type'] == 'category':
+                    created = stats['categories']
+                    category_id(record['category'], record['icon'])
+                    if stats['categories'] == created:
+                        stats['skipped'] += 1
+                elif record['type'] == 'item':
+                    cat_id = category_id(record['category'])
+                    if cat_id not in texts:
+                        texts[cat_id] = {item['text'] for item in bot.data['categories'][cat_id]['items']}
+                    if record['text'] in texts[cat_id]:
+                        stats['skipped'] += 1
+                    else:
+                        bot.add_item(cat_id, record['text'], record['added_by'],
+                                     completed=record['completed'], created_at=record['created_at'])
+                        texts[cat_id].add(record['text'])
+                        stats['items'] += 1
+                else:
+                    bot.add_movie_rating(record['movie'], record['rating'], record['comment'],
+                                         record['user_name'], record['user_id'], date=record['date'])
+                    stats['ratings'] += 1
+        yield min(start + IMPORT_CHUNK, len(records))
+
+
+def _new_stats():
+    return {'categories': 0, 'items': 0, 'ratings': 0, 'skipped': 0}
+
+
+def import_records(bot, records, progress=None):
+    """وارد کردن رکوردها با یک بار نوشتن؛ خروجی تعداد دسته‌ها، آیتم‌ها و نمره‌های اضافه شده"""
+    stats = _new_stats()
+    reported = 0
+    with bot.batch():
+        for count in _import_chunks(bot, records, stats):
+            if progress is not None and count // PROGRESS_EVERY > reported:
+                reported = count // PROGRESS_EVERY
+                progress(count)
+    return stats
+
+
+async def import_records_async(bot, records, progress=None):
+    """مثل import_records برای event loop: بعد از هر تکه به کارهای دیگر نوبت می‌دهد
+
+    progress یک coroutine function است که هر PROGRESS_EVERY رکورد با تعداد ثبت شده صدا زده می‌شود.
+    """
+    stats = _new_stats()
+    reported = 0
+    with bot.batch():
+        for count in _import_chunks(bot, records, stats):
+            if progress is not None and count // PROGRESS_EVERY > reported:
+                reported = count // PROGRESS_EVERY
+                await progress(count)
+            await asyncio.sleep(0)
+    return stats
+
+
+def export_records(data):
+    """رکوردهای همه داده‌ها: اول دسته‌ها، بعد آیتم‌ها و بعد نمره‌ها"""
+    for category in data['categories'].values():
+        yield {'type': 'category', 'category': category['name'], 'icon': category['icon']}
+    for category in data['categories'].values():
+        for item in category['items']:
+            yield {
+                'type': 'item', 'category': category['name'], 'text': item['text'],
+                'completed': item['completed'], 'created_at': item.get('created_at'), 'added_by': item.get('added_by')
+            }
+    for movie_name, movie in data.get('movie_ratings', {}).items():
+        for rating in movie['ratings']:
+            yield {
+                'type': 'rating', 'movie': movie_name, 'rating': rating['rating'], 'comment': rating['comment'],
+                'user_name': rating['user_name'], 'user_id': rating['user_id'], 'date': rating['date']
+            }
+
+
+def write_records(records, stream, fmt):
+    """نوشتن رکوردها در یک فایل متنی باز شده؛ خروجی تعداد رکوردها"""
+    count = 0
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+    for record in records:
+        record = {key: value for key, value in record.items() if value is not None}
+        if writer is not None:
+            writer.writerow(record)
+        else:
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def export_bytes(bot, fmt):
+    """محتوای فایل خروجی همه داده‌های ربات (برای ارسال در تلگرام)"""
+    stream = io.StringIO(newline='')
+    with bot.lock:
+        count = write_records(export_records(bot.data), stream, fmt)
+    return stream.getvalue().encode('utf-8'), count
+
+
+def main():
+    """ورود و خروج گروهی از خط فرمان، با همان تنظیمات ذخیره‌سازی ربات (PANIRBOT_*)"""
+    parser = argparse.ArgumentParser(description="PaNIrBot bulk import/export (CSV / JSONL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('import', "وارد کردن فایل"), ('export', "خروجی گرفتن از همه داده‌ها")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument('path')
+        subparser.add_argument('--format', choices=('csv', 'jsonl'), help="پیش‌فرض: بر اساس پسوند فایل")
+    args = parser.parse_args()
+
+    try:
+        fmt = args.format or detect_format(args.path)
+        if args.command == 'import':
+            with open(args.path, 'rb') as f:
+                records = load_records(f.read(), fmt)
+    except (BulkError, OSError) as error:
+        raise SystemExit(f"❌ {error}")
+
+    # ربات هنگام import داده‌ها را با تنظیمات فعلی بارگذاری می‌کند؛ ربات اصلی باید خاموش باشد
+    import panirbot
+    bot = panirbot.bot
+    try:
+        if args.command == 'import':
+            stats = import_records(
+                bot, records, progress=lambda count: print(f"⏳ {count:,}/{len(records):,}", file=sys.stderr)
+            )
+            print(f"✅ {stats['categories']} دسته، {stats['items']} آیتم و {stats['ratings']} نمره وارد شد"
+                  f" ({stats['skipped']} رکورد تکراری نادیده گرفته شد).")
+        else:
+            with open(args.path, 'w', encoding='utf-8', newline='') as f, bot.lock:
+                count = write_records(export_records(bot.data), f, fmt)
+            print(f"✅ {count:,} رکورد در {args.path} نوشته شد.")
+    finally:
+        bot.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""اجرای ربات در چند پروسه پشت یک webhook
+
+پروسه اصلی updateهای webhook تلگرام را می‌گیرد و بر اساس آیدی کاربر (یا چت) به یکی از
+N پروسه کارگر می‌فرستد؛ پس user_data هر کاربر (مراحل گفتگو) همیشه در یک پروسه می‌ماند.
+کارگرها داده‌ها را در یک پایگاه SQLite مشترک (حالت ذخیره‌سازی cluster) ذخیره می‌کنند.
+ترتیب تغییرات را SQLite تعیین می‌کند: هر تغییر در تراکنش نوشتن خودش یک seq در لاگ تغییرات
+می‌گیرد و کارگر قبل از بررسی و ثبت آن، تغییرات قبلی بقیه کارگرها را به ترتیب seq اعمال می‌کند.
+بعد از هر تغییر، پروسه اصلی به بقیه کارگرها خبر می‌دهد تا تغییرات جدید را به همان ترتیب از
+لاگ بخوانند؛ پس داده‌های حافظه و کش صفحه‌ها در همه کارگرها یکی می‌مانند، حتی وقتی دو کارگر
+هم‌زمان یک آیتم یا فیلم را تغییر می‌دهند. هر کارگر شناسه‌های جدید را با گام N می‌سازد.
+اگر پایگاه داده خالی باشد و داده‌های حالت json، journal یا snapshot وجود داشته باشد، داده‌ها
+قبل از شروع کارگرها یک بار به آن منتقل می‌شوند.
+
+    python cluster.py serve --workers 4 --url https://example.com/telegram
+    python cluster.py fake --workers 2 --updates 2000    # آزمایش محلی بدون تلگرام
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import SharedSqliteStorage, has_file_data, migrate_json_to_sqlite
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('PANIRBOT_WORKERS', str(os.cpu_count() or 1)))
+WEBHOOK_PORT = int(os.environ.get('PANIRBOT_WEBHOOK_PORT', '5000'))
+WEBHOOK_SECRET = os.environ.get('PANIRBOT_WEBHOOK_SECRET', '')
+READY_TIMEOUT = 60
+# همان فایل‌های panirbot (panirbot اینجا import نمی‌شود چون هنگام import داده‌ها را بارگذاری می‌کند)
+DATA_FILE = os.environ.get('PANIRBOT_DATA_FILE', "wishlist_data.json")
+DB_FILE = os.environ.get('PANIRBOT_DB_FILE', "wishlist_data.db")
+
+
+def shard_key(update):
+    """آیدی کاربر فرستنده update، یا آیدی چت اگر فرستنده نداشته باشد"""
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        user = payload.get('from')
+        if user:
+            return user['id']
+        chat = payload.get('chat')
+        if chat:
+            return chat['id']
+    return update.get('update_id', 0)
+
+
+def worker_main(index, workers, inbox, outbox, token, fake, webhook):
+    """پروسه کارگر: یک Application بدون updater که updateها را از inbox می‌گیرد"""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
+    )
+    # panirbot هنگام import داده‌ها را بارگذاری می‌کند، پس فقط در پروسه کارگر import می‌شود
+    import panirbot
+    import ratelimit
+    from telegram import Update
+
+    request = None
+    if fake:
+        from fakes import FakeRequest
+        request = FakeRequest()
+
+    bot = panirbot.bot
+    bot.set_id_stride(index, workers)
+    # خود تغییر فرستاده نمی‌شود؛ بقیه کارگرها آن را با seq از پایگاه داده می‌خوانند
+    bot.change_listeners.append(lambda change: outbox.put(('changed', index, None)))
+    # محدودیت کلی تلگرام برای کل ربات است، پس بین کارگرها تقسیم می‌شود
+    rate_limiter = None if fake else ratelimit.ApiRateLimiter(global_rate=ratelimit.GLOBAL_RATE / workers)
+    application = panirbot.build_application(
+        token or panirbot.BOT_TOKEN, request=request, updater=False, rate_limiter=rate_limiter
+    )
+    if panirbot.METRICS_PORT:
+        # هر کارگر آمار خودش را روی پورت جدا می‌دهد
+        panirbot.metrics.serve(panirbot.METRICS_PORT + index, panirbot.METRICS_HOST)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        processed = 0
+        await application.initialize()
+        await application.start()
+        if webhook:
+            await application.bot.set_webhook(allowed_updates=panirbot.ALLOWED_UPDATES, **webhook)
+        outbox.put(('ready', index, None))
+        try:
+            while True:
+                message = await loop.run_in_executor(None, inbox.get)
+                if message is None:
+                    break
+                kind, payload = message
+                if kind == 'update':
+                    await application.update_queue.put(Update.de_json(payload, application.bot))
+                    processed += 1
+                elif kind == 'changed':
+                    bot.apply_remote_changes()
+                elif kind == 'drain':
+                    # صبر تا پردازش updateهای در صف و فرستادن تغییراتشان تمام شود
+                    await application.update_queue.join()
+                    if isinstance(application.update_processor, panirbot.ChatOrderedUpdateProcessor):
+                        await application.update_processor.join()
+                    outbox.put(('drained', index, None))
+        finally:
+            await application.stop()
+            await application.shutdown()
+            # خبر آخرین تغییرات بقیه کارگرها ممکن است بعد از پیام توقف برسد
+            bot.apply_remote_changes()
+            bot.close()
+            panirbot.profiler.stop()
+        # تعداد آیتم‌ها در همه کارگرها باید یکی باشد (هماهنگی داده‌های حافظه)
+        stats = {'updates': processed, 'items': sum(len(c['items']) for c in bot.data['categories'].values())}
+        if request is not None:
+            stats['api_calls'] = sum(request.calls.values())
+        outbox.put(('stopped', index, stats))
+
+    asyncio.run(run())
+
+
+def prepare_shared_storage(json_path=DATA_FILE, db_path=DB_FILE):
+    """انتقال داده‌های حالت‌های دیگر به پایگاه داده مشترک، اگر پایگاه داده هنوز خالی باشد
+
+    لاگ تغییرات اجرای قبلی هم پاک می‌شود؛ کارگرها داده‌ها را از جدول‌ها بارگذاری می‌کنند.
+    """
+    storage = SharedSqliteStorage(db_path, threading.RLock())
+    try:
+        storage.reset_log()
+        existing, _ = storage.load()
+    finally:
+        storage.close()
+    if existing is not None or not has_file_data(json_path):
+        return
+    categories, items, ratings = migrate_json_to_sqlite(json_path, db_path)
+    logger.info("%d دسته، %d آیتم و %d نمره از %s به %s منتقل شد", categories, items, ratings, json_path, db_path)
+
+
+class Cluster:
+    """مدیریت پروسه‌های کارگر و رساندن updateها و تغییرات به آن‌ها"""
+
+    def __init__(self, workers=WORKERS, token=None, fake=False, webhook=None):
+        self.workers = workers
+        self.token = token
+        self.fake = fake
+        self.webhook = webhook
+        self.stats = {}
+        self._context = multiprocessing.get_context('spawn')
+        self._outbox = self._context.Queue()
+        self._inboxes = []
+        self._processes = []
+        self._ready = [threading.Event() for _ in range(workers)]
+        self._drained = [threading.Event() for _ in range(workers)]
+        self._relay = threading.Thread(target=self._relay_loop, name="cluster-relay", daemon=True)
+
+    def start(self):
+        """راه‌اندازی کارگرها؛ کارگر اول زودتر بالا می‌آید تا پایگاه داده را آماده کند"""
+        # همه کارگرها باید روی یک پایگاه داده مشترک بنویسند
+        prepare_shared_storage()
+        os.environ['PANIRBOT_STORAGE'] = 'cluster'
+        self._relay.start()
+        for index in range(self.workers):
+            inbox = self._context.Queue()
+            process = self._context.Process(
+                target=worker_main,
+                args=(index, self.workers, inbox, self._outbox, self.token, self.fake,
+                      self.webhook if index == 0 else None),
+                name=f"panirbot-worker-{index}",
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+            if index == 0:
+                self._wait_ready(0)
+        for index in range(1, self.workers):
+            self._wait_ready(index)
+
+    def _wait_ready(self, index):
+        process = self._processes[index]
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not self._ready[index].wait(0.5):
+            if not process.is_alive() or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"{process.name} failed to start (exit code {process.exitcode})")
+
+    def submit(self, update):
+        """فرستادن یک update (dict خام تلگرام) به کارگر مسئول کاربر آن"""
+        self._inboxes[shard_key(update) % self.workers].put(('update', update))
+
+    def _relay_loop(self):
+        while True:
+            kind, index, payload = self._outbox.get()
+            if kind == 'changed':
+                for other, inbox in enumerate(self._inboxes):
+                    if other != index:
+                        inbox.put(('changed', None))
+            elif kind == 'ready':
+                self._ready[index].set()
+            elif kind == 'drained':
+                self._drained[index].set()
+            elif kind == 'stopped':
+                self.stats[index] = payload
+            elif kind == 'exit':
+                return
+
+    def stop(self, timeout=30):
+        """پردازش updateهای در صف و بستن کارگرها"""
+        # اول همه کارگرها updateهایشان را تمام می‌کنند تا تغییرات آخر هم به بقیه برسد
+        for inbox in self._inboxes:
+            inbox.put(('drain', None))
+        for process, event in zip(self._processes, self._drained):
+            if process.is_alive() and not event.wait(timeout):
+                logger.warning("%s did not drain in %ss", process.name, timeout)
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Killing %s", process.name)
+                process.kill()
+        if self._relay.is_alive():
+            self._outbox.put(('exit', None, None))
+            self._relay.join(timeout)
+
+
+def make_webhook_handler(cluster, url_path, secret):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != f'/{url_path}':
+                self.send_error(404)
+                return
+            if secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+                self.send_error(403)
+                return
+            try:
+                update = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except ValueError:
+                self.send_error(400)
+                return
+            cluster.submit(update)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return WebhookHandler
+
+
+def serve(args):
+    """گرفتن webhook تلگرام و پخش updateها بین کارگرها"""
+    secret = args.secret or secrets.token_urlsafe(32)
+    webhook = {'url': args.url, 'secret_token': secret}
+    cluster = Cluster(args.workers, token=args.token, webhook=webhook)
+    cluster.start()
+    url_path = args.url_path or args.url.rstrip('/').rsplit('/', 1)[-1]
+    server = ThreadingHTTPServer((args.listen, args.port), make_webhook_handler(cluster, url_path, secret))
+    print(f"🚀 webhook روی {args.listen}:{args.port}/{url_path} با {args.workers} کارگر")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cluster.stop()
+
+
+def run_fake(args):
+    """اجرای cluster روی updateهای ساختگی و بدون شبکه، در یک پوشه موقت"""
+    from fakes import fake_updates, fake_user_ids
+
+    os.chdir(args.data_dir or tempfile.mkdtemp(prefix='panirbot-cluster-'))
+    with open('whitelist.json', 'w', encoding='utf-8') as f:
+        json.dump({'allowed_users': fake_user_ids(args.users)}, f)
+
+    cluster = Cluster(args.workers, token='1:fake', fake=True)
+    cluster.start()
+    started = time.perf_counter()
+    for update in fake_updates(args.updates, args.users):
+        cluster.submit(update)
+    cluster.stop()
+    elapsed = time.perf_counter() - started
+    print(f"📂 داده‌ها: {os.getcwd()}")
+    print(f"⏱️ {args.updates} update در {elapsed:.2f} ثانیه ({args.updates / elapsed:.0f} در ثانیه)")
+    for index in sorted(cluster.stats):
+        print(f"   کارگر {index}: {cluster.stats[index]}")
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description="اجرای ربات در چند پروسه")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="گرفتن webhook و پخش updateها بین کارگرها")
+    serve_parser.add_argument('--url', required=True, help="آدرس عمومی webhook")
+    serve_parser.add_argument('--url-path', help="مسیر محلی webhook (پیش‌فرض: آخرین بخش url)")
+    serve_parser.add_argument('--listen', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=WEBHOOK_PORT)
+    serve_parser.add_argument('--secret', default=WEBHOOK_SECRET)
+    serve_parser.add_argument('--token', default=os.environ.get('PANIRBOT_TOKEN'))
+    serve_parser.add_argument('--workers', type=int, default=WORKERS)
+    serve_parser.set_defaults(func=serve)
+
+    fake_parser = subparsers.add_parser('fake', help="آزمایش محلی با updateهای ساختگی")
+    fake_parser.add_argument('--workers', type=int, default=2)
+    fake_parser.add_argument('--updates', type=int, default=1000)
+    fake_parser.add_argument('--users', type=int, default=20)
+    fake_parser.add_argument('--data-dir', help="پوشه داده‌ها (پیش‌فرض: یک پوشه موقت)")
+    fake_parser.set_defaults(func=run_fake)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""جایگزین‌های آزمایشی برای تلگرام: درخواست‌های Bot API بدون شبکه و updateهای ساختگی
+
+FakeRequest به جای ارسال درخواست به تلگرام پاسخ ساختگی برمی‌گرداند و درخواست‌ها را
+می‌شمارد؛ fake_updates دنباله‌ای از پیام‌ها، دکمه‌ها و جستجوهای inline چند کاربر
+می‌سازد. با این دو می‌شود ربات (یا cluster.py) را به صورت محلی اجرا و اندازه‌گیری کرد.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+FAKE_BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'PaNIr', 'username': 'panirbot'}
+
+
+class FakeRequest(BaseRequest):
+    """پیاده‌سازی BaseRequest که به شبکه وصل نمی‌شود
+
+    latency (ثانیه) تاخیر هر درخواست را شبیه‌سازی می‌کند. calls تعداد درخواست‌ها به
+    تفکیک متد است و اگر record=True باشد پارامترهای هر درخواست هم در requests می‌ماند.
+    """
+
+    def __init__(self, latency=0.0, record=False):
+        self.latency = latency
+        self.record = record
+        self.calls = Counter()
+        self.requests = []
+        self._message_ids = itertools.count(1000)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+        if self.record:
+            self.requests.append((api_method, parameters))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, json.dumps({'ok': True, 'result': self._result(api_method, parameters)}).encode()
+
+    def _result(self, api_method, parameters):
+        if api_method == 'getMe':
+            return FAKE_BOT_USER
+        if api_method in ('sendMessage', 'editMessageText', 'sendDocument') and 'chat_id' in parameters:
+            return {
+                'message_id': parameters.get('message_id') or next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': parameters['chat_id'], 'type': 'private'},
+                'from': FAKE_BOT_USER,
+                'text': parameters.get('text', '')
+            }
+        return True
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+
+def message_update(update_id, user_id, text):
+    """update یک پیام متنی (دستورها entity مربوط به خود را می‌گیرند)"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id, user_id, data):
+    """update فشردن یک دکمه inline روی پیام قبلی ربات"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': FAKE_BOT_USER,
+                'text': '...'
+            }
+        }
+    }
+
+
+def inline_update(update_id, user_id, query, offset=''):
+    """update یک جستجوی inline"""
+    return {
+        'update_id': update_id,
+        'inline_query': {'id': str(update_id), 'from': _user(user_id), 'query': query, 'offset': offset}
+    }
+
+
+def fake_updates(count, users=10, first_user_id=1000):
+    """count update ساختگی از users کاربر؛ هر کاربر یک سناریوی ثابت را تکرار می‌کند
+
+    سناریو: اضافه کردن آیتم به دسته ۱، دیدن دسته‌ها و دسته ۱، جستجوی inline و منوی فیلم‌ها.
+    دکمه‌ها به قالب متنی قدیمی ساخته می‌شوند که به کد مسیرها وابسته نباشند.
+    """
+    scenario = (
+        lambda uid, n: message_update(n, uid, '/start add_item_1'),
+        lambda uid, n: message_update(n, uid, f'آیتم {n} از کاربر {uid}'),
+        lambda uid, n: message_update(n, uid, '/categories'),
+        lambda uid, n: callback_update(n, uid, 'view_category_1'),
+        lambda uid, n: inline_update(n, uid, 'آیتم'),
+        lambda uid, n: callback_update(n, uid, 'movie_ratings_menu'),
+        lambda uid, n: inline_update(n, uid, ''),
+    )
+    for update_id in range(1, count + 1):
+        user_index = (update_id - 1) % users
+        step = (update_id - 1) // users % len(scenario)
+        yield scenario[step](first_user_id + user_index, update_id)
+
+
+def fake_user_ids(users=10, first_user_id=1000):
+    """آیدی کاربرانی که fake_updates می‌سازد (برای اضافه کردن به وایت لیست)"""
+    return list(range(first_user_id, first_user_id + users))
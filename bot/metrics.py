@@ -0,0 +1,156 @@
+"""شمارنده‌ها و هیستوگرام زمان اجرا برای handlerها، مسیرهای دکمه‌ها و ذخیره‌سازی
+
+هر اندازه‌گیری با یک نام خانواده و چند برچسب ثبت می‌شود و خروجی در قالب متنی Prometheus
+روی یک پورت محلی (PANIRBOT_METRICS_PORT) در آدرس /metrics در دسترس است:
+
+    panirbot_handler_duration_seconds{kind="command",name="start"}     زمان هر handler
+    panirbot_route_duration_seconds{route="view_category"}             زمان هر مسیر دکمه
+    panirbot_storage_duration_seconds{op="append_batch"}               زمان نوشتن روی دیسک
+    panirbot_api_duration_seconds{endpoint="editMessageText"}          زمان درخواست‌های Bot API (با صبر در صف)
+    panirbot_*_errors_total                                            تعداد خطاها
+
+شمارش ‎_count‎ هر هیستوگرام همان تعداد اجراها (توان عملیاتی) است.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# مرزهای هیستوگرام (ثانیه)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'panirbot_handler': "Telegram update handlers by kind and name",
+    'panirbot_route': "Callback button routes",
+    'panirbot_storage': "Storage backend operations",
+    'panirbot_api': "Outgoing Bot API requests, including rate limiter wait",
+}
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'errors')
+
+    def __init__(self):
+        # counts[i] تعداد اندازه‌گیری‌های بین BUCKETS[i-1] و BUCKETS[i]؛ آخری بیشتر از همه
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds, failed):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Registry:
+    """هیستوگرام‌ها به ازای (خانواده، برچسب‌ها)؛ از event loop و thread ذخیره‌سازی صدا زده می‌شود"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, family, labels, seconds, failed=False):
+        """ثبت یک اجرا؛ labels یک tuple از جفت‌های (نام، مقدار) است"""
+        key = (family, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds, failed)
+
+    def render(self):
+        """همه اندازه‌گیری‌ها در قالب متنی Prometheus"""
+        with self._lock:
+            entries = sorted(
+                ((family, labels, list(h.counts), h.sum, h.count, h.errors)
+                 for (family, labels), h in self._histograms.items()),
+                key=lambda entry: (entry[0], entry[1])
+            )
+        lines = []
+        families = sorted({entry[0] for entry in entries})
+        for family in families:
+            rows = [entry for entry in entries if entry[0] == family]
+            lines.append(f"# HELP {family}_duration_seconds {HELP.get(family, family)}")
+            lines.append(f"# TYPE {family}_duration_seconds histogram")
+            for _, labels, counts, total, count, _ in rows:
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{family}_duration_seconds_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{family}_duration_seconds_bucket{_labels(labels, le='+Inf')} {count}")
+                lines.append(f"{family}_duration_seconds_sum{_labels(labels)} {total}")
+                lines.append(f"{family}_duration_seconds_count{_labels(labels)} {count}")
+            lines.append(f"# TYPE {family}_errors_total counter")
+            for _, labels, _, _, _, errors in rows:
+                lines.append(f"{family}_errors_total{_labels(labels)} {errors}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def instrument(kind, name, handler):
+    """handler(update, context) که زمان و خطاهای آن زیر panirbot_handler ثبت می‌شود"""
+    labels = (('kind', kind), ('name', name))
+
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(update, context)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            registry.observe('panirbot_handler', labels, time.perf_counter() - started, failed)
+    return wrapper
+
+
+def observe_route(route, seconds, failed):
+    """hook برای CallbackRouter.add_hook"""
+    registry.observe('panirbot_route', (('route', route),), seconds, failed)
+
+
+def observe_storage(op, seconds, failed):
+    """observer برای create_storage"""
+    registry.observe('panirbot_storage', (('op', op),), seconds, failed)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(port, host='127.0.0.1'):
+    """راه‌اندازی endpoint ‏/metrics در یک thread پس‌زمینه"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,286 @@
+"""مدل فشرده آیتم‌ها و نمره‌ها در حافظه
+
+هر آیتم و نمره به جای یک dict با کلیدهای تکراری یک شیء با __slots__ است. زمان‌ها به
+صورت عدد (ثانیه از epoch) و نام کاربرها یک بار (sys.intern) نگه داشته می‌شوند، شناسه
+آیتم عدد است. این اشیاء مثل dict رفتار می‌کنند (item['text']، item.get(...)، in، dict(item))
+و با همان قالب قبلی wishlist_data.json ذخیره می‌شوند، پس بقیه کد و فایل‌ها عوض نمی‌شوند.
+
+رکوردی که در داده‌های ربات است در جا تغییر نمی‌کند؛ تغییر روی copy() انجام می‌شود و رکورد
+جدید جای قبلی را می‌گیرد، تا کپی سطحی داده‌ها (storage.copy_data) بیرون از قفل ثابت بماند.
+"""
+import sys
+from collections.abc import MutableMapping
+from datetime import datetime
+from functools import lru_cache
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+@lru_cache(maxsize=8192)
+def parse_time(text):
+    """ثانیه از epoch برای یک زمان با قالب TIME_FORMAT؛ اگر برگشت‌پذیر نباشد خود متن"""
+    try:
+        value = int(datetime.strptime(text, TIME_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return text
+    # زمان‌هایی که در تغییر ساعت تابستانی وجود ندارند همان متن می‌مانند
+    return value if format_time(value) == text else text
+
+
+@lru_cache(maxsize=8192)
+def format_time(value):
+    """متن یک زمان ذخیره شده با parse_time"""
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value).strftime(TIME_FORMAT)
+    return value
+
+
+def intern_name(name):
+    return sys.intern(name) if isinstance(name, str) else name
+
+
+def pack_id(value):
+    """شناسه متنی عددی به صورت int (بدون صفر اول)، بقیه همان متن"""
+    if isinstance(value, str) and value.isascii() and value.isdigit() and (value == '0' or value[0] != '0'):
+        return int(value)
+    return value
+
+
+def unpack_id(value):
+    return str(value)
+
+
+def identity(value):
+    return value
+
+
+class Record(MutableMapping):
+    """پایه رکوردهای فشرده؛ FIELDS نام فیلدها و برای هر کدام (تبدیل ورودی، تبدیل خروجی)
+
+    فیلدهای OPTIONAL وقتی None باشند در رکورد نیستند (مثل کلیدی که در dict نیامده).
+    کلیدهای ناشناخته در extra نگه داشته می‌شوند تا در ذخیره دوباره از بین نروند.
+    """
+    __slots__ = ('extra',)
+    FIELDS = {}
+    OPTIONAL = frozenset()
+
+    def __init__(self, values=None):
+        self.extra = None
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        if values:
+            for key, value in values.items():
+                self[key] = value
+
+    def __getitem__(self, key):
+        converters = self.FIELDS.get(key)
+        if converters is None:
+            if self.extra is not None and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None and key in self.OPTIONAL:
+            raise KeyError(key)
+        return converters[1](value) if value is not None else None
+
+    def __setitem__(self, key, value):
+        converters = self.FIELDS.get(key)
+        if converters is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        else:
+            setattr(self, key, converters[0](value) if value is not None else None)
+
+    def __delitem__(self, key):
+        if key in self.FIELDS and key in self:
+            setattr(self, key, None)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key) is not None or key not in self.OPTIONAL
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if field in self:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    @classmethod
+    def from_row(cls, row):
+        """ساخت رکورد از خروجی to_row"""
+        record = cls.__new__(cls)
+        for (field, (pack, _)), value in zip(cls.FIELDS.items(), row):
+            setattr(record, field, pack(value) if value is not None else None)
+        record.extra = row[-1] if len(row) > len(cls.FIELDS) else None
+        return record
+
+    def copy(self):
+        """کپی رکورد برای تغییر دادن به جای تغییر در جا"""
+        record = type(self).__new__(type(self))
+        for field in self.FIELDS:
+            setattr(record, field, getattr(self, field))
+        record.extra = dict(self.extra) if self.extra else None
+        return record
+
+    def to_row(self):
+        """مقدار فیلدها به ترتیب FIELDS (و کلیدهای اضافه در آخر)، برای قالب‌های فشرده‌تر از dict"""
+        row = []
+        for field, (_, unpack) in self.FIELDS.items():
+            value = getattr(self, field)
+            row.append(unpack(value) if value is not None else None)
+        if self.extra:
+            row.append(self.extra)
+        return row
+
+    def to_dict(self):
+        values = {}
+        for field, (_, unpack) in self.FIELDS.items():
+            value = getattr(self, field)
+            if value is not None:
+                values[field] = unpack(value)
+            elif field not in self.OPTIONAL:
+                values[field] = None
+        if self.extra:
+            values.update(self.extra)
+        return values
+
+
+class Item(Record):
+    """یک آیتم ویش لیست"""
+    __slots__ = ('id', 'text', 'completed', 'created_at', 'added_by', 'last_modified_by', 'last_modified_at')
+    FIELDS = {
+        'id': (pack_id, unpack_id),
+        'text': (identity, identity),
+        'completed': (bool, identity),
+        'created_at': (parse_time, format_time),
+        'added_by': (intern_name, identity),
+        'last_modified_by': (intern_name, identity),
+        'last_modified_at': (parse_time, format_time),
+    }
+    OPTIONAL = frozenset(('created_at', 'added_by', 'last_modified_by', 'last_modified_at'))
+
+
+class Rating(Record):
+    """نمره یک کاربر به یک فیلم"""
+    __slots__ = ('rating', 'comment', 'user_name', 'user_id', 'date')
+    FIELDS = {
+        'rating': (identity, identity),
+        'comment': (identity, identity),
+        'user_name': (intern_name, identity),
+        'user_id': (identity, identity),
+        'date': (parse_time, format_time),
+    }
+
+
+class LazyRecord(dict):
+    """dict یک دسته یا فیلم که لیست آیتم‌ها یا نمره‌هایش (key) با اولین دسترسی خوانده می‌شود
+
+    بقیه فیلدها و stats (خلاصه‌ای که snapshot.py در ایندکس فایل می‌نویسد) از اول در حافظه‌اند.
+    read() رکورد کامل را می‌خواند؛ خواندن زیر lock انجام می‌شود تا دو thread لیست را دو بار
+    (و یکی روی تغییرات دیگری) نگذارند. پیمایش، مقایسه و json.dumps رکورد هم آن را می‌خوانند.
+    """
+
+    def __init__(self, fields, key, stats, read, lock):
+        super().__init__(fields)
+        self.key = key
+        self.stats = stats
+        self._read = read
+        self._lock = lock
+
+    @property
+    def loaded(self):
+        return dict.__contains__(self, self.key)
+
+    def __missing__(self, key):
+        if key != self.key:
+            raise KeyError(key)
+        with self._lock:
+            if not self.loaded:
+                dict.__setitem__(self, key, self._read()[key])
+            return dict.__getitem__(self, key)
+
+    def _load(self):
+        if not self.loaded:
+            self[self.key]
+        return self
+
+    def __contains__(self, key):
+        return key == self.key or dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        return dict.__iter__(self._load())
+
+    def __len__(self):
+        return dict.__len__(self._load())
+
+    def keys(self):
+        return dict.keys(self._load())
+
+    def values(self):
+        return dict.values(self._load())
+
+    def items(self):
+        return dict.items(self._load())
+
+    def __eq__(self, other):
+        if isinstance(other, LazyRecord):
+            other._load()
+        return dict.__eq__(self._load(), other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def peek(self):
+        """کپی لیست key؛ اگر هنوز خوانده نشده از فایل خوانده ولی در حافظه نگه داشته نمی‌شود"""
+        with self._lock:
+            if self.loaded:
+                return list(dict.__getitem__(self, self.key))
+        return self._read()[self.key]
+
+    def copy(self):
+        """کپی سطحی؛ رکورد خوانده نشده خوانده نشده می‌ماند"""
+        with self._lock:
+            if self.loaded:
+                return dict(self, **{self.key: list(self[self.key])})
+            return LazyRecord(dict(dict.items(self)), self.key, self.stats, self._read, self._lock)
+
+
+def compact_data(data):
+    """تبدیل آیتم‌ها و نمره‌های داده‌های بارگذاری شده به رکوردهای فشرده (در جا)
+
+    رکوردهای LazyRecord که هنوز خوانده نشده‌اند دست نمی‌خورند؛ Snapshot آن‌ها را فشرده می‌خواند.
+    """
+    for category in data['categories'].values():
+        if isinstance(category, LazyRecord) and not category.loaded:
+            continue
+        category['items'] = [item if isinstance(item, Item) else Item(item) for item in category['items']]
+    for movie in data.get('movie_ratings', {}).values():
+        if isinstance(movie, LazyRecord) and not movie.loaded:
+            continue
+        movie['ratings'] = [r if isinstance(r, Rating) else Rating(r) for r in movie['ratings']]
+    return data
+
+
+def to_json(value):
+    """default برای json.dumps تا رکوردها به همان شکل dict و مجموعه‌ها (کاربران مجاز) لیست مرتب ذخیره شوند"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,10 +1,31 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton,InlineQueryResultArticle, InputTextMessageContent
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, InlineQueryHandler
+from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, InlineQueryHandler, BaseUpdateProcessor
+import asyncio
+import bisect
+import contextvars
+import hashlib
+import io
+import itertools
 import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime
-import uuid
+from urllib.parse import urlparse
+
+import bulk
+import metrics
+from models import Item, LazyRecord, Rating, compact_data
+from profiling import profiler
+from ratelimit import ApiRateLimiter
+from search import SearchIndex, normalize
+from router import CallbackRouter, UnknownRoute
+from storage import DataLoadError, create_storage
 
 # تنظیمات لاگ
 logging.basicConfig(
@@ -16,26 +37,476 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = ""
 
 # فایل ذخیره داده‌ها
-DATA_FILE = "wishlist_data.json"
+DATA_FILE = os.environ.get('PANIRBOT_DATA_FILE', "wishlist_data.json")
 WHITELIST_FILE = "whitelist.json"
 
+# حالت ذخیره‌سازی: json (بازنویسی کل فایل)، journal (ژورنال فقط-افزودنی + snapshot) یا sqlite
+STORAGE_MODE = os.environ.get('PANIRBOT_STORAGE', "json")
+DB_FILE = os.environ.get('PANIRBOT_DB_FILE', "wishlist_data.db")
+
 # آیدی ادمین اصلی (صاحب ربات)
 ADMIN_ID = 123456  # آیدی تلگرام خود را اینجا قرار دهید
 
+# حداکثر تعداد صفحه‌های ساخته شده که در حافظه نگه داشته می‌شوند
+RENDER_CACHE_SIZE = int(os.environ.get('PANIRBOT_RENDER_CACHE_SIZE', '512'))
+
+# حداکثر تعداد نتایج جستجوی inline (در همه صفحه‌ها)
+INLINE_SEARCH_LIMIT = 200
+
+# ایندکس جستجوی داده‌های بزرگ‌تر از این تعداد سند در پس‌زمینه و تکه‌تکه ساخته می‌شود
+SEARCH_BACKGROUND_MIN = 5000
+SEARCH_BUILD_CHUNK = 2000
+
+# اندازه صفحه‌ها در نتایج inline و منوهای طولانی
+INLINE_PAGE_SIZE = 20
+INLINE_ITEMS_PREVIEW = 30
+MOVIES_PAGE_SIZE = 10
+ITEMS_PAGE_SIZE = 15
+
+# مدت کش نتایج inline در سرور تلگرام (ثانیه)؛ 0 یعنی بدون کش
+INLINE_CACHE_TIME = int(os.environ.get('PANIRBOT_INLINE_CACHE_TIME', '0'))
+# تعداد پاسخ‌های inline اخیر که در حافظه نگه داشته می‌شوند
+INLINE_MEMO_SIZE = int(os.environ.get('PANIRBOT_INLINE_MEMO_SIZE', '256'))
+
+# حالت webhook: اگر آدرس داده شود به جای long polling از webhook استفاده می‌شود
+WEBHOOK_URL = os.environ.get('PANIRBOT_WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.environ.get('PANIRBOT_WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('PANIRBOT_WEBHOOK_PORT', '5000'))
+WEBHOOK_SECRET = os.environ.get('PANIRBOT_WEBHOOK_SECRET', '')
+
+# تعداد updateهایی که هم‌زمان پردازش می‌شوند؛ updateهای یک چت همیشه به ترتیب اجرا می‌شوند
+CONCURRENT_UPDATES = int(os.environ.get('PANIRBOT_CONCURRENT_UPDATES', '16'))
+
+# اتصال‌های HTTP هم‌زمان به Bot API و مدت صبر برای یک اتصال آزاد (ثانیه)
+HTTP_POOL_SIZE = int(os.environ.get('PANIRBOT_HTTP_POOL_SIZE', '32'))
+HTTP_POOL_TIMEOUT = float(os.environ.get('PANIRBOT_HTTP_POOL_TIMEOUT', '10'))
+
+# پورت محلی endpoint ‏/metrics (قالب Prometheus)؛ 0 یعنی خاموش
+METRICS_PORT = int(os.environ.get('PANIRBOT_METRICS_PORT', '0'))
+METRICS_HOST = os.environ.get('PANIRBOT_METRICS_HOST', '127.0.0.1')
+
+# فشرده‌سازی جای آیتم‌های یک دسته وقتی tombstoneها از این تعداد و از 1/ITEM_TOMBSTONE_RATIO آیتم‌ها بیشتر شوند
+ITEM_TOMBSTONE_MIN = 64
+ITEM_TOMBSTONE_RATIO = 8
+
+# تعداد آیدی‌هایی که ‎/whitelist‎ نشان می‌دهد؛ لیست کامل با ‎/export_users‎
+WHITELIST_PREVIEW = 50
+# حداکثر حجم فایل ‎/import_users‎ (بایت)
+WHITELIST_IMPORT_MAX_BYTES = 1024 * 1024
+# حداکثر حجم فایل ورود گروهی (محدودیت دانلود Bot API)
+BULK_IMPORT_MAX_BYTES = 20 * 1024 * 1024
+# حداقل فاصله ویرایش پیام پیشرفت ورود گروهی (ثانیه)
+BULK_PROGRESS_INTERVAL = 2
+
+# فقط نوع updateهایی که handlerها استفاده می‌کنند از تلگرام گرفته می‌شوند
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """پردازش هم‌زمان updateها با حفظ ترتیب updateهای هر چت (یا هر کاربر در inline)
+
+    PTB برای هر update یک task می‌سازد و هر task قبل از رسیدن به اینجا یکی از max_pending_updates
+    جای پذیرش را می‌گیرد. اولین update یک چت جای خودش را نگه می‌دارد و updateهای بعدی همان چت را
+    به ترتیب اجرا می‌کند؛ بقیه فقط به صف آن چت اضافه می‌شوند و جایشان را بلافاصله پس می‌دهند. پس
+    هر چت حداکثر یک جای پذیرش می‌گیرد و یک چت پرپیام نمی‌تواند جلوی چت‌های دیگر را بگیرد. در هر
+    لحظه حداکثر max_concurrent_updates update اجرا می‌شود.
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates=None):
+        super().__init__(max_pending_updates or 4 * max_concurrent_updates)
+        self._running_limit = max_concurrent_updates
+        self._running = None
+        self._chat_queues = {}  # کلید چت -> deque کوروتین‌های منتظر updateهای آن چت
+        self._idle = None
+
+    async def initialize(self):
+        self._running = asyncio.BoundedSemaphore(self._running_limit)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def shutdown(self):
+        pass
+
+    async def join(self):
+        """صبر تا اجرای همه updateهایی که در صف چت‌ها هستند
+
+        update_queue.join() برای این کافی نیست: task هر update صف شده زودتر تمام می‌شود.
+        """
+        await self._idle.wait()
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+        
+        queue = self._chat_queues.get(key)
+        if queue is not None:
+            # task دیگری همین حالا updateهای این چت را اجرا می‌کند
+            queue.append(coroutine)
+            return
+        queue = self._chat_queues[key] = deque([coroutine])
+        self._idle.clear()
+        try:
+            while queue:
+                async with self._running:
+                    try:
+                        await queue[0]
+                    except Exception:
+                        # خطای یک update نباید updateهای بعدی همان چت را متوقف کند
+                        logger.exception("Error while processing an update of chat %s", key)
+                queue.popleft()
+        finally:
+            del self._chat_queues[key]
+            for pending in queue:
+                pending.close()
+            if not self._chat_queues:
+                self._idle.set()
+
+class SortedIndex:
+    """لیست مرتب نام‌ها بر اساس یک کلید، با درج و حذف تکی به جای مرتب‌سازی دوباره کل لیست"""
+
+    def __init__(self, descending=False):
+        self.descending = descending
+        self._entries = []  # (key, name) به ترتیب صعودی
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def key(self, name, default=None):
+        return self._keys.get(name, default)
+
+    def __iter__(self):
+        """نام‌ها به ترتیب نمایش، بدون ساخت لیست"""
+        entries = reversed(self._entries) if self.descending else self._entries
+        return (name for _, name in entries)
+
+    def update(self, name, key):
+        """درج یا جابجایی یک نام با کلید جدید"""
+        self.remove(name)
+        self._keys[name] = key
+        bisect.insort(self._entries, (key, name))
+
+    def remove(self, name):
+        key = self._keys.pop(name, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self._entries, (key, name))
+        del self._entries[index]
+
+    def range(self, start=0, stop=None):
+        """نام‌های بازه [start, stop) به ترتیب نمایش"""
+        size = len(self._entries)
+        stop = size if stop is None else min(stop, size)
+        start = max(start, 0)
+        if start >= stop:
+            return []
+        if self.descending:
+            return [name for _, name in reversed(self._entries[size - stop:size - start])]
+        return [name for _, name in self._entries[start:stop]]
+
+
+class ItemPositions:
+    """جای هر آیتم در لیست آیتم‌های یک دسته، برای پیدا کردن آیتم با شناسه بدون پیمایش لیست
+
+    جای‌ها نسبت به آخرین فشرده‌سازی نگه داشته می‌شوند. حذف یک آیتم فقط جای قبلی آن را به عنوان
+    tombstone ثبت می‌کند؛ جای فعلی هر آیتم، جای ثبت شده منهای تعداد tombstoneهای قبل از آن است.
+    وقتی tombstoneها زیاد شوند جای‌ها از نو ساخته می‌شوند.
+    """
+
+    def __init__(self, items=()):
+        self.rebuild(items)
+
+    def rebuild(self, items):
+        self._positions = {item['id']: index for index, item in enumerate(items)}
+        self._tombstones = []
+
+    def find(self, item_id):
+        """جای فعلی آیتم در لیست یا None"""
+        position = self._positions.get(item_id)
+        if position is None:
+            return None
+        return position - bisect.bisect_left(self._tombstones, position)
+
+    def added(self, items, index):
+        """ثبت آیتمی که در جای index لیست درج شده"""
+        if index == len(items) - 1:
+            self._positions[items[index]['id']] = index + len(self._tombstones)
+        else:
+            # درج در وسط لیست (مثلا شناسه‌های cluster.py) جای آیتم‌های بعدی را عوض می‌کند
+            self.rebuild(items)
+
+    def removed(self, items, item_id):
+        """ثبت حذف آیتم؛ items لیست بعد از حذف است"""
+        bisect.insort(self._tombstones, self._positions.pop(item_id))
+        if len(self._tombstones) > max(ITEM_TOMBSTONE_MIN, len(self._positions) // ITEM_TOMBSTONE_RATIO):
+            self.rebuild(items)
+
+
+class RenderCache:
+    """کش LRU برای صفحه‌های ساخته شده (متن و کیبورد)
+
+    هر ورودی با نسخه داده‌ای که از روی آن ساخته شده ذخیره می‌شود؛ اگر نسخه
+    فعلی فرق داشته باشد صفحه دوباره ساخته می‌شود و جای نسخه قدیمی را می‌گیرد.
+    """
+
+    def __init__(self, max_size=RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, key, version, render):
+        """صفحه کش شده برای این نسخه، یا ساخت آن با render()"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            return entry[1]
+        value = render()
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+
+class StaleChange(Exception):
+    """تغییر بر اساس وضعیتی خواسته شده که دیگر برقرار نیست (کاربر دیگری زودتر تغییرش داده)"""
+
+
 class WishlistBot:
     def __init__(self):
+        # قفل مشترک بین تغییرات داده‌ها و threadهای ذخیره‌سازی
+        self.lock = threading.RLock()
+        # نسخه هر بخش از داده‌ها؛ با هر تغییر بالا می‌رود تا صفحه‌های کش شده باطل شوند
+        self._versions = {}
+        self._version_clock = 0
+        # گام ساخت شناسه‌ها وقتی چند پروسه روی یک پایگاه داده می‌نویسند (cluster.py)
+        self.id_offset = 0
+        self.id_step = 1
+        # توابعی که بعد از ثبت هر تغییر (پایان تراکنش آن) با رکورد آن صدا زده می‌شوند
+        self.change_listeners = []
+        # تغییرات تراکنش باز (transaction())، برای صدا زدن listenerها در پایان آن
+        self._committed = None
+        # چند پروسه روی یک پایگاه داده (cluster.py)؛ ترتیب تغییرات را SQLite تعیین می‌کند
+        self.shared_storage = STORAGE_MODE == 'cluster'
+        # تغییرات بلوک batch() همین thread یا task که با هم ذخیره می‌شوند
+        self._batch = contextvars.ContextVar('batch', default=None)
+        # همه بلوک‌های batch() باز؛ بلوک می‌تواند بین تکه‌ها قفل را رها کند
+        self._open_batches = []
+        self.storage = create_storage(
+            STORAGE_MODE, DATA_FILE, self.lock, DB_FILE, observer=metrics.observe_storage
+        )
         self.data = self.load_data()
-        self.whitelist = self.load_whitelist()
+        if 'allowed_users' not in self.data:
+            self.import_whitelist_file()
         
     def load_data(self):
         """بارگذاری داده‌ها از فایل - حالا مشترک برای همه کاربران"""
-        if os.path.exists(DATA_FILE):
-            try:
-                with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return self.get_default_data()
-        return self.get_default_data()
+        try:
+            data, changes = self.storage.load()
+        except Exception as error:
+            # شروع با داده‌های پیش‌فرض، فایل خراب را با اولین تغییر بازنویسی می‌کرد
+            raise DataLoadError(
+                f"خطا در بارگذاری داده‌ها ({STORAGE_MODE}): {error}. "
+                f"فایل‌ها دست نخورده‌اند؛ آن‌ها را بررسی یا از پشتیبان بازیابی کنید."
+            ) from error
+        
+        if data is None:
+            self.data = self.get_default_data()
+        else:
+            # آیتم‌ها و نمره‌ها به رکوردهای فشرده تبدیل می‌شوند
+            self.data = compact_data(data)
+            if 'allowed_users' in self.data:
+                self.data['allowed_users'] = set(self.data['allowed_users'])
+        assigned_movie_ids = self.rebuild_indexes()
+        # اعمال تغییرات ثبت شده در ژورنال که هنوز در snapshot نیستند (ایندکس جستجو شاید در حال ساخت باشد)
+        with self.lock:
+            for change in changes:
+                self.apply_change(change)
+        if data is None or assigned_movie_ids:
+            # اولین اجرا: داده‌های پیش‌فرض ذخیره می‌شوند تا snapshot پایه تغییرات بعدی باشد؛ شناسه‌های تازه
+            # فیلم‌های داده‌های قدیمی هم باید ذخیره شوند تا دکمه‌ها بعد از اجرای دوباره معتبر بمانند
+            self.storage.save(self.data)
+        return self.data
+    
+    def rebuild_indexes(self):
+        """ساخت ایندکس‌ها و آمارهای حافظه از روی داده‌ها (بعد از بارگذاری)
+
+        دسته‌ها و فیلم‌هایی که هنوز از snapshot خوانده نشده‌اند (LazyRecord) خوانده نمی‌شوند:
+        آمار فیلم‌ها از خلاصه ایندکس snapshot ساخته می‌شود و ایندکس آیتم‌های هر دسته با اولین
+        استفاده (_index_items). خروجی تعداد فیلم‌هایی است که شناسه نداشتند و شناسه تازه گرفتند.
+        """
+        # آمار نمره‌ها: جمع نمره هر فیلم، جای نمره هر کاربر، تعداد فیلم‌های نمره داده شده هر کاربر
+        # و توزیع کلی نمره‌ها
+        self._rating_index = {}
+        self._rating_sums = {}
+        self._user_rating_counts = {}
+        self._rating_histogram = {}
+        self._ratings_count = 0
+        self._ratings_sum = 0
+        last_rated = {}
+        for movie_name, movie in self.data.get('movie_ratings', {}).items():
+            if isinstance(movie, LazyRecord) and not movie.loaded:
+                user_ids, scores, last_rated[movie_name] = movie.stats['raters'], movie.stats['scores'], movie.stats['last']
+            else:
+                user_ids = [r['user_id'] for r in movie['ratings']]
+                scores = [r['rating'] for r in movie['ratings']]
+                last_rated[movie_name] = max(r['date'] for r in movie['ratings'])
+            self._rating_index[movie_name] = {user_id: i for i, user_id in enumerate(user_ids)}
+            for user_id in self._rating_index[movie_name]:
+                self._user_rating_counts[user_id] = self._user_rating_counts.get(user_id, 0) + 1
+            self._rating_sums[movie_name] = 0
+            for score in scores:
+                self._count_rating(movie_name, score, 1)
+        
+        # شناسه عددی ثابت هر فیلم برای دکمه‌ها؛ فیلم‌های داده‌های قدیمی به ترتیب شناسه می‌گیرند
+        movies = self.data.setdefault('movie_ratings', {})
+        next_movie_id = max(
+            [self.data.get('next_movie_id', 1)] + [movie['id'] + 1 for movie in movies.values() if 'id' in movie]
+        )
+        self._movies_by_id = {}
+        assigned_movie_ids = 0
+        for movie_name, movie in movies.items():
+            if 'id' not in movie:
+                movie['id'] = next_movie_id
+                next_movie_id += 1
+                assigned_movie_ids += 1
+            self._movies_by_id[movie['id']] = movie_name
+        self.data['next_movie_id'] = next_movie_id
+        
+        # لیست‌های مرتب فیلم‌ها برای منوها (بر اساس نام، میانگین و آخرین نمره)
+        self._movies_by_name = SortedIndex()
+        self._movies_by_rating = SortedIndex()
+        self._movies_by_date = SortedIndex(descending=True)
+        for movie_name, movie in self.data.get('movie_ratings', {}).items():
+            self._index_movie(movie_name, movie, last_rated[movie_name])
+        
+        # ترتیب دسته‌ها برای صفحه‌بندی نتایج inline
+        self._category_order = list(self.data['categories'])
+        # شناسه دسته‌های هر نام به ترتیب ساخت (نام تکراری هم مجاز است)
+        self._category_names = {}
+        for cat_id, category in self.data['categories'].items():
+            self._category_names.setdefault(category['name'], []).append(cat_id)
+        # جای آیتم‌ها در هر دسته برای دسترسی مستقیم با شناسه و آیتم‌های انجام نشده و انجام شده
+        # هر دسته به ترتیب شناسه، برای صفحه‌های خلاصه؛ هر دو با اولین استفاده از دسته ساخته می‌شوند
+        self._item_positions = {}
+        self._item_partitions = {}
+        
+        # ایندکس جستجو روی نام دسته‌ها، متن آیتم‌ها و نام فیلم‌ها
+        self.search_index = SearchIndex()
+        categories = list(self.data['categories'].items())
+        movie_names = list(self.data.get('movie_ratings', {}))
+        size = len(categories) + len(movie_names) + sum(self.item_counts(cat_id)[1] for cat_id, _ in categories)
+        documents = self._search_documents(categories, movie_names)
+        # کلیدهایی که تا پایان ساخت ایندکس در پس‌زمینه حذف شده‌اند
+        self._search_removed = None
+        self.search_ready = threading.Event()
+        if size < SEARCH_BACKGROUND_MIN:
+            for key, text in documents:
+                self.search_index.add(key, text)
+            self.search_ready.set()
+        else:
+            # ربات بدون صبر برای ایندکس جواب می‌دهد؛ تا آن موقع نتایج جستجو ناقص است
+            self._search_removed = set()
+            threading.Thread(
+                target=self._build_search_index, args=(documents,), name="search-index", daemon=True
+            ).start()
+        return assigned_movie_ids
+    
+    def _search_documents(self, categories, movie_names):
+        """(کلید، متن) اسناد ایندکس جستجو
+        
+        آیتم‌های دسته‌ای که هنوز از snapshot خوانده نشده فقط برای ایندکس خوانده و نگه داشته نمی‌شوند.
+        لیست آیتم‌ها کپی می‌شود چون ساخت در پس‌زمینه بین تکه‌ها قفل را رها می‌کند.
+        """
+        for cat_id, category in categories:
+            yield ('category', cat_id), category['name']
+            items = category.peek() if isinstance(category, LazyRecord) else list(category['items'])
+            for item in items:
+                yield ('item', cat_id, item['id']), item['text']
+        for movie_name in movie_names:
+            yield ('movie', movie_name), movie_name
+    
+    def _build_search_index(self, documents):
+        """ساخت ایندکس جستجو در تکه‌های کوچک تا قفل داده‌ها مدت زیادی گرفته نشود"""
+        started = time.perf_counter()
+        count = 0
+        while True:
+            with self.lock:
+                chunk = list(itertools.islice(documents, SEARCH_BUILD_CHUNK))
+                for key, text in chunk:
+                    if key not in self._search_removed:
+                        self.search_index.add(key, text)
+            if not chunk:
+                break
+            count += len(chunk)
+        with self.lock:
+            self._search_removed = None
+            # پاسخ‌های inline کش شده با ایندکس ناقص باطل می‌شوند
+            self._touch(('search',))
+        self.search_ready.set()
+        logger.info("ایندکس جستجو با %d سند در %.1f ثانیه ساخته شد", count, time.perf_counter() - started)
+    
+    def _index_items(self, category_id):
+        """ساخت ایندکس آیتم‌های یک دسته در اولین استفاده؛ False اگر دسته نباشد
+        
+        آیتم‌های دسته‌ای که از snapshot خوانده نشده (LazyRecord) همین‌جا خوانده می‌شوند.
+        """
+        if category_id in self._item_positions:
+            return True
+        with self.lock:
+            category = self.data['categories'].get(category_id)
+            if category is None:
+                return False
+            if category_id not in self._item_positions:
+                items = category['items']
+                partitions = (SortedIndex(), SortedIndex())
+                for item in items:
+                    partitions[item['completed']].update(item['id'], int(item['id']))
+                # جای آیتم‌ها آخر ثبت می‌شود چون خواننده‌های بدون قفل فقط آن را بررسی می‌کنند
+                self._item_partitions[category_id] = partitions
+                self._item_positions[category_id] = ItemPositions(items)
+        return True
+    
+    def _remove_from_search(self, key):
+        self.search_index.remove(key)
+        if self._search_removed is not None:
+            self._search_removed.add(key)
+    
+    def _index_movie(self, movie_name, movie, last_rated):
+        """به‌روزرسانی جای فیلم در لیست‌های مرتب"""
+        if movie_name not in self._movies_by_name:
+            self._movies_by_name.update(movie_name, movie_name)
+        self._movies_by_rating.update(movie_name, -movie['average'])
+        self._movies_by_date.update(movie_name, last_rated)
+    
+    def _unindex_movie(self, movie_name):
+        self._movies_by_name.remove(movie_name)
+        self._movies_by_rating.remove(movie_name)
+        self._movies_by_date.remove(movie_name)
+    
+    def _count_rating(self, movie_name, score, sign):
+        """اضافه (sign=1) یا کم (sign=-1) کردن یک نمره از آمارها"""
+        self._rating_sums[movie_name] += sign * score
+        self._ratings_sum += sign * score
+        self._ratings_count += sign
+        count = self._rating_histogram.get(score, 0) + sign
+        if count:
+            self._rating_histogram[score] = count
+        else:
+            self._rating_histogram.pop(score, None)
     
     def get_default_data(self):
         """داده‌های پیش‌فرض مشترک"""
@@ -46,55 +517,348 @@ class WishlistBot:
             },
             'next_category_id': 3,
             'next_item_id': 1,
+            'next_movie_id': 1,
             'movie_ratings': {} 
         }
     
     def save_data(self):
-        """ذخیره داده‌ها در فایل"""
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        """ذخیره کامل داده‌ها در فایل"""
+        # بدون قفل داده‌ها: ذخیره در thread ذخیره‌سازی انجام می‌شود و backend خودش قفل را می‌گیرد
+        self.storage.save(self.data)
+    
+    def commit(self, change):
+        """اعمال یک تغییر روی داده‌ها و ثبت آن در حافظه دائمی"""
+        with self.transaction():
+            self.apply_change(change)
+            batch = self._batch.get()
+            if batch is not None:
+                batch.append(change)
+            else:
+                # تغییرات batch()های باز زودتر اعمال شده‌اند، پس قبل از این تغییر ذخیره می‌شوند
+                self._flush_open_batches()
+                self.storage.append(change, self.data)
+            self._committed.append(change)
+    
+    @contextmanager
+    def transaction(self):
+        """قفل داده‌ها برای خواندن، بررسی و ثبت تغییرات؛ متدهای تغییر داده‌ها داخل این بلوک کار می‌کنند
+
+        با پایگاه داده مشترک (حالت cluster) تراکنش نوشتن SQLite هم باز می‌شود و اول تغییراتی که
+        پروسه‌های دیگر ثبت کرده‌اند به ترتیب seq اعمال می‌شوند. پس بررسی‌ها (مثل compare-and-set در
+        toggle_item) روی آخرین داده‌ها انجام می‌شوند و همه پروسه‌ها تغییرات را به یک ترتیب اعمال
+        می‌کنند. بلوک‌های تو در تو همان تراکنش بیرونی را ادامه می‌دهند. listenerها بعد از پایان
+        تراکنش بیرونی صدا زده می‌شوند، وقتی تغییرات برای پروسه‌های دیگر خواندنی هستند.
+        """
+        with self.lock:
+            if self._committed is not None:
+                yield
+                return
+            committed = self._committed = []
+            try:
+                if self.shared_storage:
+                    for change in self.storage.begin():
+                        self.apply_change(change)
+                    try:
+                        yield
+                    finally:
+                        # تغییرات اعمال شده در حافظه حتی اگر بعد از آن خطایی رخ دهد ثبت می‌شوند
+                        self.storage.end()
+                else:
+                    yield
+            finally:
+                self._committed = None
+                for change in committed:
+                    for listener in self.change_listeners:
+                        listener(change)
+    
+    def _flush_open_batches(self):
+        for changes in self._open_batches:
+            if changes:
+                self.storage.append_batch(changes[:], self.data)
+                changes.clear()
+    
+    @contextmanager
+    def batch(self):
+        """commit()های داخل این بلوک در پایان با یک append_batch (یک بار نوشتن) ذخیره می‌شوند
+
+        قفل در طول بلوک نگه داشته نمی‌شود و بلوک می‌تواند بین تکه‌های کار await کند؛ فقط
+        commit()های همین thread یا task جمع می‌شوند. اگر کس دیگری در این فاصله تغییری ثبت کند،
+        تغییرات جمع شده اول ذخیره می‌شوند تا ترتیب ذخیره همان ترتیب اعمال بماند.
+        """
+        if self._batch.get() is not None or self.shared_storage:
+            # با پایگاه داده مشترک هر تغییر باید در تراکنش خودش seq بگیرد
+            yield
+            return
+        changes = []
+        token = self._batch.set(changes)
+        with self.lock:
+            self._open_batches.append(changes)
+        try:
+            yield
+        finally:
+            self._batch.reset(token)
+            with self.lock:
+                self._open_batches = [batch for batch in self._open_batches if batch is not changes]
+                if changes:
+                    self.storage.append_batch(changes, self.data)
+    
+    def apply_remote_changes(self):
+        """اعمال تغییراتی که پروسه‌های دیگر در پایگاه داده مشترک ثبت کرده‌اند، به ترتیب seq"""
+        with self.lock:
+            for change in self.storage.read_changes():
+                self.apply_change(change)
+    
+    def set_id_stride(self, offset, step):
+        """این پروسه فقط شناسه‌های offset، offset + step، ... را بسازد"""
+        self.id_offset = offset
+        self.id_step = step
+    
+    def _next_id(self, key):
+        """اولین شناسه آزاد این پروسه برای next_category_id، next_item_id یا next_movie_id"""
+        value = self.data[key]
+        return value + (self.id_offset - value) % self.id_step
+    
+    def close(self):
+        """بستن لایه ذخیره‌سازی هنگام خاموش شدن ربات"""
+        self.storage.close()
+    
+    def apply_change(self, change):
+        """اعمال یک رکورد تغییر روی داده‌های حافظه (بدون ذخیره)"""
+        getattr(self, f"_apply_{change['op']}")(change)
+        if 'category_id' in change:
+            self._touch(('category', change['category_id']), ('categories',))
+        if 'movie_name' in change:
+            self._touch(('movie', change['movie_name']), ('movies',))
+    
+    def _touch(self, *scopes):
+        """بالا بردن نسخه بخش‌های تغییر کرده"""
+        self._version_clock += 1
+        for scope in scopes:
+            self._versions[scope] = self._version_clock
+    
+    def version(self, *scope):
+        """نسخه فعلی یک بخش از داده‌ها، مثلا version('category', '1') یا version('movies')"""
+        return self._versions.get(scope, 0)
+    
+    @property
+    def data_version(self):
+        """نسخه کل داده‌ها؛ با هر تغییری بالا می‌رود"""
+        return self._version_clock
+    
+    # اعمال تغییرات باید تکرارپذیر باشد: snapshot ممکن است تغییری را که هنوز در ژورنال
+    # نوشته نشده شامل شود و آن تغییر هنگام بارگذاری دوباره اعمال شود
+    def _apply_add_category(self, change):
+        cat_id = change['category_id']
+        if cat_id in self.data['categories']:
+            return
+        self.data['categories'][cat_id] = {
+            'name': change['name'],
+            'icon': change['icon'],
+            'items': []
+        }
+        self.data['next_category_id'] = max(self.data['next_category_id'], int(cat_id) + 1)
+        self._category_order.append(cat_id)
+        self._category_names.setdefault(change['name'], []).append(cat_id)
+        self._item_positions[cat_id] = ItemPositions()
+        self._item_partitions[cat_id] = (SortedIndex(), SortedIndex())
+        self.search_index.add(('category', cat_id), change['name'])
+    
+    def _apply_delete_category(self, change):
+        cat_id = change['category_id']
+        category = self.data['categories'].pop(cat_id, None)
+        if category is None:
+            return
+        self._category_order.remove(cat_id)
+        same_name = self._category_names[category['name']]
+        same_name.remove(cat_id)
+        if not same_name:
+            del self._category_names[category['name']]
+        self._item_positions.pop(cat_id, None)
+        self._item_partitions.pop(cat_id, None)
+        self._remove_from_search(('category', cat_id))
+        for item in category['items']:
+            self._remove_from_search(('item', cat_id, item['id']))
+    
+    def _apply_add_item(self, change):
+        category = self.data['categories'].get(change['category_id'])
+        if category is None:
+            return
+        item = Item(change['item'])
+        # آیتم‌ها به ترتیب شناسه اضافه می‌شوند، پس جستجوی دودویی کافی است
+        self._index_items(change['category_id'])
+        items = category['items']
+        index = bisect.bisect_left(items, int(item['id']), key=lambda it: int(it['id']))
+        if index < len(items) and items[index]['id'] == item['id']:
+            return
+        items.insert(index, item)
+        self._item_positions[change['category_id']].added(items, index)
+        self._item_partitions[change['category_id']][item['completed']].update(item['id'], int(item['id']))
+        self.search_index.add(('item', change['category_id'], item['id']), item['text'])
+        self.data['next_item_id'] = max(self.data['next_item_id'], int(item['id']) + 1)
+    
+    def _apply_toggle_item(self, change):
+        if not self._index_items(change['category_id']):
+            return
+        positions = self._item_positions[change['category_id']]
+        index = positions.find(change['item_id'])
+        if index is None:
+            return
+        items = self.data['categories'][change['category_id']]['items']
+        # رکورد جدید جای قبلی را می‌گیرد؛ کپی‌ای که ذخیره‌سازی بیرون از قفل می‌نویسد دست نمی‌خورد
+        item = items[index].copy()
+        partitions = self._item_partitions[change['category_id']]
+        partitions[item['completed']].remove(item['id'])
+        item['completed'] = change['completed']
+        item['last_modified_by'] = change['user_name']
+        item['last_modified_at'] = change['at']
+        items[index] = item
+        partitions[item['completed']].update(item['id'], int(item['id']))
+    
+    def _apply_delete_item(self, change):
+        if not self._index_items(change['category_id']):
+            return
+        positions = self._item_positions[change['category_id']]
+        index = positions.find(change['item_id'])
+        if index is None:
+            return
+        items = self.data['categories'][change['category_id']]['items']
+        self._item_partitions[change['category_id']][items[index]['completed']].remove(change['item_id'])
+        del items[index]
+        positions.removed(items, change['item_id'])
+        self._remove_from_search(('item', change['category_id'], change['item_id']))
+    
+    def _apply_add_movie_rating(self, change):
+        movie_name = change['movie_name']
+        rating_data = Rating(change['rating'])
+        movie_ratings = self.data.setdefault('movie_ratings', {})
+        
+        if movie_name not in movie_ratings:
+            movie_id = change.get('movie_id') or self.data['next_movie_id']
+            movie_ratings[movie_name] = {
+                'id': movie_id,
+                'ratings': [],
+                'average': 0.0,
+                'total_ratings': 0
+            }
+            self.data['next_movie_id'] = max(self.data['next_movie_id'], movie_id + 1)
+            self._movies_by_id[movie_id] = movie_name
+            self._rating_index[movie_name] = {}
+            self._rating_sums[movie_name] = 0
+            self.search_index.add(('movie', movie_name), movie_name)
+        elif change.get('movie_id') and change['movie_id'] < movie_ratings[movie_name]['id']:
+            # دو کارگر cluster.py هم‌زمان برای یک فیلم جدید شناسه ساخته‌اند؛ همه روی کوچک‌ترین توافق می‌کنند
+            # (مثل SQLite). شناسه قبلی هم تا اجرای بعدی به همین فیلم اشاره می‌کند تا دکمه‌های فرستاده شده کار کنند
+            movie_id = change['movie_id']
+            movie_ratings[movie_name]['id'] = movie_id
+            self.data['next_movie_id'] = max(self.data['next_movie_id'], movie_id + 1)
+            self._movies_by_id[movie_id] = movie_name
+        movie = movie_ratings[movie_name]
+        ratings = movie['ratings']
+        user_index = self._rating_index[movie_name]
+        
+        # بررسی اینکه آیا این کاربر قبلا نمره داده یا نه
+        existing_index = user_index.get(rating_data['user_id'])
+        last_rated = self._movies_by_date.key(movie_name, '')
+        replaced_last = False
+        if existing_index is not None:
+            # اپدیت نمره قبلی
+            previous = ratings[existing_index]
+            self._count_rating(movie_name, previous['rating'], -1)
+            replaced_last = previous['date'] == last_rated
+            ratings[existing_index] = rating_data
+        else:
+            # اضافه کردن نمره جدید
+            user_index[rating_data['user_id']] = len(ratings)
+            ratings.append(rating_data)
+            user_id = rating_data['user_id']
+            self._user_rating_counts[user_id] = self._user_rating_counts.get(user_id, 0) + 1
+        self._count_rating(movie_name, rating_data['rating'], 1)
+        
+        # محاسبه میانگین جدید از جمع نگه‌داری شده
+        movie['average'] = self._rating_sums[movie_name] / len(ratings)
+        movie['total_ratings'] = len(ratings)
+        if replaced_last and rating_data['date'] < last_rated:
+            # نمره‌ای که آخرین تاریخ را داشت با تاریخ قدیمی‌تری عوض شد (مثلا در ورود گروهی)
+            last_rated = max(r['date'] for r in ratings)
+        else:
+            last_rated = max(last_rated, rating_data['date'])
+        self._index_movie(movie_name, movie, last_rated)
     
-    def load_whitelist(self):
-        """بارگذاری وایت لیست از فایل"""
+    def _apply_delete_movie_rating(self, change):
+        movie_name = change['movie_name']
+        movie = self.data.get('movie_ratings', {}).pop(movie_name, None)
+        if movie is None:
+            return
+        for r in movie['ratings']:
+            self._count_rating(movie_name, r['rating'], -1)
+        for user_id in self._rating_index.pop(movie_name):
+            if self._user_rating_counts[user_id] > 1:
+                self._user_rating_counts[user_id] -= 1
+            else:
+                del self._user_rating_counts[user_id]
+        del self._rating_sums[movie_name]
+        self._movies_by_id.pop(movie['id'], None)
+        self._unindex_movie(movie_name)
+        self._remove_from_search(('movie', movie_name))
+    
+    def _apply_allow_users(self, change):
+        self.data.setdefault('allowed_users', set()).update(change['user_ids'])
+        self._touch(('whitelist',))
+    
+    def _apply_disallow_users(self, change):
+        self.data.setdefault('allowed_users', set()).difference_update(change['user_ids'])
+        self._touch(('whitelist',))
+    
+    @property
+    def whitelist(self):
+        """مجموعه آیدی کاربران مجاز (بخشی از داده‌ها، با همان ذخیره‌سازی)"""
+        return self.data['allowed_users']
+    
+    def import_whitelist_file(self):
+        """انتقال یک‌باره whitelist.json قدیمی به داده‌ها؛ بعد از آن فایل دیگر خوانده نمی‌شود"""
+        user_ids = []
         if os.path.exists(WHITELIST_FILE):
             try:
                 with open(WHITELIST_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('allowed_users', [])
-            except:
-                return []
-        return []
-    
-    def save_whitelist(self):
-        """ذخیره وایت لیست در فایل"""
-        with open(WHITELIST_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'allowed_users': self.whitelist}, f, ensure_ascii=False, indent=2)
+                    user_ids = json.load(f).get('allowed_users', [])
+            except (OSError, ValueError, AttributeError) as error:
+                logger.warning("خطا در خواندن %s: %s", WHITELIST_FILE, error)
+        with self.lock:
+            self.data.setdefault('allowed_users', set())
+            if user_ids:
+                self.add_users_to_whitelist(user_ids)
     
     def is_user_allowed(self, user_id):
         """بررسی اجازه دسترسی کاربر"""
-        return user_id == ADMIN_ID or user_id in self.whitelist
+        return user_id == ADMIN_ID or user_id in self.data['allowed_users']
+    
+    def add_users_to_whitelist(self, user_ids):
+        """اضافه کردن چند کاربر با یک تغییر؛ خروجی: آیدی‌هایی که تازه اضافه شدند"""
+        with self.transaction():
+            added = sorted({int(user_id) for user_id in user_ids} - self.whitelist)
+            if added:
+                self.commit({'op': 'allow_users', 'user_ids': added})
+        return added
     
     def add_user_to_whitelist(self, user_id):
         """اضافه کردن کاربر به وایت لیست"""
-        if user_id not in self.whitelist:
-            self.whitelist.append(user_id)
-            self.save_whitelist()
-            return True
-        return False
+        return bool(self.add_users_to_whitelist([user_id]))
     
     def remove_user_from_whitelist(self, user_id):
         """حذف کاربر از وایت لیست"""
-        if user_id in self.whitelist:
-            self.whitelist.remove(user_id)
-            self.save_whitelist()
-            return True
-        return False
+        with self.transaction():
+            if user_id not in self.whitelist:
+                return False
+            self.commit({'op': 'disallow_users', 'user_ids': [user_id]})
+        return True
     
     def get_whitelist_info(self):
         """دریافت اطلاعات وایت لیست"""
+        with self.lock:
+            users = sorted(self.whitelist)
         return {
-            'users': self.whitelist,
-            'count': len(self.whitelist)
+            'users': users,
+            'count': len(users)
         }
     
     def get_shared_data(self):
@@ -103,154 +867,220 @@ class WishlistBot:
     
     def add_category(self, name, icon='⭐'):
         """اضافه کردن دسته‌بندی جدید به داده‌های مشترک"""
-        cat_id = str(self.data['next_category_id'])
-        self.data['categories'][cat_id] = {
-            'name': name,
-            'icon': icon,
-            'items': []
-        }
-        self.data['next_category_id'] += 1
-        self.save_data()
+        with self.transaction():
+            cat_id = str(self._next_id('next_category_id'))
+            self.commit({'op': 'add_category', 'category_id': cat_id, 'name': name, 'icon': icon})
         return cat_id
     
-    def add_item(self, category_id, text, user_name="نامشخص"):
+    def add_item(self, category_id, text, user_name="نامشخص", completed=False, created_at=None):
         """اضافه کردن آیتم جدید به داده‌های مشترک"""
-        if category_id in self.data['categories']:
-            item_id = str(self.data['next_item_id'])
+        with self.transaction():
+            if category_id not in self.data['categories']:
+                return False
             item = {
-                'id': item_id,
+                'id': str(self._next_id('next_item_id')),
                 'text': text,
-                'completed': False,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'completed': completed,
+                'created_at': created_at or datetime.now().strftime('%Y-%m-%d %H:%M'),
                 'added_by': user_name
             }
-            self.data['categories'][category_id]['items'].append(item)
-            self.data['next_item_id'] += 1
-            self.save_data()
-            return True
-        return False
+            self.commit({'op': 'add_item', 'category_id': category_id, 'item': item})
+        return True
     
-    def toggle_item(self, category_id, item_id, user_name="نامشخص"):
-        """تغییر وضعیت آیتم"""
-        if category_id in self.data['categories']:
-            for item in self.data['categories'][category_id]['items']:
-                if item['id'] == item_id:
-                    item['completed'] = not item['completed']
-                    item['last_modified_by'] = user_name
-                    item['last_modified_at'] = datetime.now().strftime('%Y-%m-%d %H:%M')
-                    self.save_data()
-                    return True
-        return False
+    def get_item(self, category_id, item_id):
+        """آیتم با این شناسه در دسته یا None"""
+        if not self._index_items(category_id):
+            return None
+        index = self._item_positions[category_id].find(item_id)
+        if index is None:
+            return None
+        return self.data['categories'][category_id]['items'][index]
+    
+    def item_counts(self, category_id):
+        """(تعداد انجام شده، تعداد کل) آیتم‌های یک دسته"""
+        category = self.data['categories'][category_id]
+        if isinstance(category, LazyRecord) and not category.loaded:
+            # دسته هنوز از snapshot خوانده نشده و خلاصه ایندکس فایل معتبر است
+            return category.stats['completed'], category.stats['total']
+        self._index_items(category_id)
+        incomplete, completed = self._item_partitions[category_id]
+        return len(completed), len(incomplete) + len(completed)
+    
+    def partition_items(self, category_id, completed, limit, last=False):
+        """حداکثر limit آیتم اول (یا آخر) از آیتم‌های انجام شده یا نشده یک دسته، به ترتیب لیست"""
+        self._index_items(category_id)
+        partition = self._item_partitions[category_id][completed]
+        item_ids = partition.range(len(partition) - limit) if last else partition.range(0, limit)
+        return [self.get_item(category_id, item_id) for item_id in item_ids]
+    
+    def toggle_item(self, category_id, item_id, user_name="نامشخص", expected=None):
+        """تغییر وضعیت آیتم
+        
+        اگر expected داده شود وضعیت فقط وقتی عوض می‌شود که هنوز expected باشد (compare-and-set)؛
+        در غیر این صورت StaleChange، تا دو کاربری که هم‌زمان یک دکمه را می‌زنند کار هم را خنثی نکنند.
+        """
+        with self.transaction():
+            item = self.get_item(category_id, item_id)
+            if item is None:
+                return False
+            if expected is not None and item['completed'] != expected:
+                raise StaleChange(item_id)
+            self.commit({
+                'op': 'toggle_item',
+                'category_id': category_id,
+                'item_id': item_id,
+                'completed': not item['completed'],
+                'user_name': user_name,
+                'at': datetime.now().strftime('%Y-%m-%d %H:%M')
+            })
+        return True
     
     def delete_item(self, category_id, item_id):
         """حذف آیتم"""
-        if category_id in self.data['categories']:
-            items = self.data['categories'][category_id]['items']
-            self.data['categories'][category_id]['items'] = [
-                item for item in items if item['id'] != item_id
-            ]
-            self.save_data()
-            return True
-        return False
+        with self.transaction():
+            if self.get_item(category_id, item_id) is None:
+                return False
+            self.commit({'op': 'delete_item', 'category_id': category_id, 'item_id': item_id})
+        return True
     
     def delete_category(self, category_id):
         """حذف دسته‌بندی"""
-        if category_id in self.data['categories']:
-            del self.data['categories'][category_id]
-            self.save_data()
-            return True
+        with self.transaction():
+            if category_id in self.data['categories']:
+                self.commit({'op': 'delete_category', 'category_id': category_id})
+                return True
         return False
-    def add_movie_rating(self, movie_name, rating, comment, user_name, user_id):
+
+    def add_movie_rating(self, movie_name, rating, comment, user_name, user_id, date=None):
         """اضافه کردن نمره فیلم"""
-        if 'movie_ratings' not in self.data:
-            self.data['movie_ratings'] = {}
-        
-        if movie_name not in self.data['movie_ratings']:
-            self.data['movie_ratings'][movie_name] = {
-                'ratings': [],
-                'average': 0.0,
-                'total_ratings': 0
-            }
-        
-        # اضافه کردن نمره جدید
         rating_data = {
             'rating': rating,
             'comment': comment,
             'user_name': user_name,
             'user_id': user_id,
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M')
+            'date': date or datetime.now().strftime('%Y-%m-%d %H:%M')
         }
-        
-        # بررسی اینکه آیا این کاربر قبلا نمره داده یا نه
-        existing_index = None
-        for i, r in enumerate(self.data['movie_ratings'][movie_name]['ratings']):
-            if r['user_id'] == user_id:
-                existing_index = i
-                break
-        
-        if existing_index is not None:
-            # اپدیت نمره قبلی
-            self.data['movie_ratings'][movie_name]['ratings'][existing_index] = rating_data
-        else:
-            # اضافه کردن نمره جدید
-            self.data['movie_ratings'][movie_name]['ratings'].append(rating_data)
-        
-        # محاسبه میانگین جدید
-        ratings = self.data['movie_ratings'][movie_name]['ratings']
-        total = sum(r['rating'] for r in ratings)
-        self.data['movie_ratings'][movie_name]['average'] = total / len(ratings)
-        self.data['movie_ratings'][movie_name]['total_ratings'] = len(ratings)
-        
-        self.save_data()
+        with self.transaction():
+            # شناسه فیلم در رکورد تغییر ثبت می‌شود تا بعد از بارگذاری دوباره عوض نشود
+            movie_id = self.get_movie_id(movie_name) or self._next_id('next_movie_id')
+            self.commit({
+                'op': 'add_movie_rating', 'movie_name': movie_name,
+                'movie_id': movie_id, 'rating': rating_data
+            })
         return True
 
-    def get_movie_ratings(self, sort_by='name'):
-        """دریافت لیست فیلم‌های نمره‌دهی شده"""
-        if 'movie_ratings' not in self.data:
-            return {}
-        
-        movies = self.data['movie_ratings'].copy()
-        
+    def _movie_index(self, sort_by):
         if sort_by == 'rating':
             # مرتب‌سازی بر اساس میانگین نمره (نازل)
-            return dict(sorted(movies.items(), key=lambda x: x[1]['average'], reverse=True))
+            return self._movies_by_rating
         elif sort_by == 'date':
             # مرتب‌سازی بر اساس آخرین نمره داده شده
-            return dict(sorted(movies.items(), 
-                              key=lambda x: max(r['date'] for r in x[1]['ratings']), 
-                              reverse=True))
-        else:
-            # مرتب‌سازی بر اساس نام (الفبایی)
-            return dict(sorted(movies.items()))
-    
+            return self._movies_by_date
+        # مرتب‌سازی بر اساس نام (الفبایی)
+        return self._movies_by_name
+
+    def get_movie_ratings(self, sort_by='name'):
+        """دریافت لیست فیلم‌های نمره‌دهی شده"""
+        return dict(self.get_movies_range(sort_by))
+
+    def get_movies_range(self, sort_by='name', start=0, stop=None):
+        """فیلم‌های بازه [start, stop) از لیست مرتب، به صورت (نام، داده)"""
+        movies = self.data.get('movie_ratings', {})
+        return [(name, movies[name]) for name in self._movie_index(sort_by).range(start, stop)]
+
+    def get_top_movies(self, k, sort_by='rating'):
+        """k فیلم اول بر اساس ترتیب خواسته شده"""
+        return self.get_movies_range(sort_by, 0, k)
+
+    def get_movie(self, movie_name):
+        """داده‌های یک فیلم یا None"""
+        return self.data.get('movie_ratings', {}).get(movie_name)
+
+    def get_movie_id(self, movie_name):
+        """شناسه عددی فیلم یا None"""
+        movie = self.get_movie(movie_name)
+        return movie['id'] if movie is not None else None
+
+    def get_movie_name(self, movie_id):
+        """نام فیلم با این شناسه یا None"""
+        return self._movies_by_id.get(movie_id)
+
+    def find_category(self, name):
+        """شناسه اولین دسته‌ای که این نام را دارد یا None"""
+        cat_ids = self._category_names.get(name)
+        return cat_ids[0] if cat_ids else None
+
+    def get_category_ids(self, start=0, stop=None):
+        """شناسه دسته‌ها در بازه [start, stop) به ترتیب ساخت"""
+        return self._category_order[start:stop]
+
+    def count_movies(self):
+        """تعداد فیلم‌های نمره‌دهی شده"""
+        return len(self._movies_by_name)
+
+    def count_unrated_movies(self, user_id):
+        """تعداد فیلم‌هایی که کاربر هنوز نمره نداده"""
+        return self.count_movies() - self._user_rating_counts.get(user_id, 0)
+
+    def get_unrated_movies(self, user_id, start=0, stop=None):
+        """نام فیلم‌های بازه [start, stop) از فیلم‌هایی که کاربر نمره نداده، به ترتیب نام
+
+        لیستی برای هر کاربر نگه داشته نمی‌شود؛ لیست مرتب نام‌ها پیمایش و فیلم‌هایی که
+        کاربر جزو نمره‌دهندگانشان است رد می‌شوند.
+        """
+        names = []
+        position = 0
+        for movie_name in self._movies_by_name:
+            if stop is not None and position >= stop:
+                break
+            if user_id in self._rating_index.get(movie_name, ()):
+                continue
+            if position >= start:
+                names.append(movie_name)
+            position += 1
+        return names
+
     def delete_movie_rating(self, movie_name):
         """حذف فیلم از لیست نمره‌دهی"""
-        if 'movie_ratings' not in self.data:
-            return False
-        
-        if movie_name in self.data['movie_ratings']:
-            del self.data['movie_ratings'][movie_name]
-            self.save_data()
-            return True
+        with self.transaction():
+            if movie_name in self.data.get('movie_ratings', {}):
+                self.commit({'op': 'delete_movie_rating', 'movie_name': movie_name})
+                return True
         return False
 
     def get_user_movie_rating(self, movie_name, user_id):
         """دریافت نمره کاربر خاص برای فیلم"""
-        if 'movie_ratings' not in self.data:
-            return None
-        
-        if movie_name not in self.data['movie_ratings']:
+        index = self._rating_index.get(movie_name, {}).get(user_id)
+        if index is None:
             return None
-        
-        for rating in self.data['movie_ratings'][movie_name]['ratings']:
-            if rating['user_id'] == user_id:
-                return rating
-        return None
+        return self.data['movie_ratings'][movie_name]['ratings'][index]
+
+    def search(self, query, limit=INLINE_SEARCH_LIMIT):
+        """جستجو در دسته‌ها، آیتم‌ها و فیلم‌ها؛ خروجی کلیدهای ایندکس به ترتیب امتیاز"""
+        # تا ساخته شدن ایندکس در پس‌زمینه، thread دیگری (زیر همین قفل) postingها را تغییر می‌دهد
+        with self.lock:
+            return self.search_index.search(query, limit)
+
+    def get_movie_stats(self):
+        """آمار کلی نمره‌ها از روی آمارهای نگه‌داری شده (بدون پیمایش نمره‌ها)"""
+        count = self._ratings_count
+        return {
+            'total_movies': len(self.data.get('movie_ratings', {})),
+            'total_ratings': count,
+            'average': self._ratings_sum / count if count else 0,
+            'distribution': dict(self._rating_histogram)
+        }
 
 
 
 # ایجاد instance از کلاس ربات
 bot = WishlistBot()
+render_cache = RenderCache()
+# پاسخ‌های inline اخیر به ازای (عبارت یکسان‌سازی شده، offset)، معتبر تا تغییر بعدی داده‌ها
+inline_memo = RenderCache(INLINE_MEMO_SIZE)
+# جدول مسیرهای دکمه‌ها؛ مسیرها پایین‌تر کنار button_handler ثبت می‌شوند
+router = CallbackRouter()
+router.add_hook(metrics.observe_route)
 
 def check_access(func):
     """دکوریتر برای بررسی دسترسی"""
@@ -384,14 +1214,18 @@ async def admin_whitelist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if whitelist_info['users']:
         text += "👥 **کاربران مجاز:**\n"
-        for user_id in whitelist_info['users']:
+        for user_id in whitelist_info['users'][:WHITELIST_PREVIEW]:
             text += f"• `{user_id}`\n"
+        if whitelist_info['count'] > WHITELIST_PREVIEW:
+            text += f"… و {whitelist_info['count'] - WHITELIST_PREVIEW} کاربر دیگر (`/export_users`)\n"
     else:
         text += "📝 هیچ کاربری در لیست نیست.\n"
     
     text += "\n🔧 **دستورات:**\n"
     text += "• `/add_user [user_id]` - اضافه کردن کاربر\n"
     text += "• `/remove_user [user_id]` - حذف کاربر\n"
+    text += "• `/import_users [user_id ...]` - اضافه کردن گروهی (یا در پاسخ به یک فایل)\n"
+    text += "• `/export_users` - دریافت فایل کاربران مجاز\n"
     text += "• `/whitelist` - مشاهده این لیست\n"
     
     await update.message.reply_text(text, parse_mode='Markdown')
@@ -442,9 +1276,185 @@ async def admin_remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(f"⚠️ کاربر `{target_user_id}` در لیست موجود نیست!", parse_mode='Markdown')
 
-@check_access
-async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش دسته‌بندی‌ها"""
+def parse_user_ids(text):
+    """آیدی‌های عددی داخل یک متن (خروجی ‎/export_users‎، CSV یا یک آیدی در هر خط)"""
+    return [int(match) for match in re.findall(r'-?\d+', text)]
+
+async def admin_import_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """اضافه کردن گروهی کاربران از آرگومان‌ها یا فایلی که به آن پاسخ داده شده"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند کاربر اضافه کند!")
+        return
+    
+    text = ' '.join(context.args or [])
+    reply = update.message.reply_to_message
+    if reply is not None and reply.document is not None:
+        if (reply.document.file_size or 0) > WHITELIST_IMPORT_MAX_BYTES:
+            await update.message.reply_text("❌ حجم فایل بیشتر از حد مجاز است!")
+            return
+        file = await context.bot.get_file(reply.document.file_id)
+        content = await file.download_as_bytearray()
+        text += '\n' + content.decode('utf-8', errors='replace')
+    
+    user_ids = parse_user_ids(text)
+    if not user_ids:
+        await update.message.reply_text(
+            "❌ هیچ آیدی‌ای پیدا نشد!\n\n"
+            "مثال: `/import_users 123456789 987654321` یا پاسخ با `/import_users` به یک فایل",
+            parse_mode='Markdown'
+        )
+        return
+    
+    added = bot.add_users_to_whitelist(user_ids)
+    skipped = len(set(user_ids)) - len(added)
+    await update.message.reply_text(f"✅ {len(added)} کاربر اضافه شد، {skipped} کاربر قبلاً در لیست بودند.")
+
+async def admin_export_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ارسال لیست کامل کاربران مجاز به صورت فایل (قابل استفاده در ‎/import_users‎)"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند لیست کاربران را دریافت کند!")
+        return
+    
+    whitelist_info = bot.get_whitelist_info()
+    content = json.dumps({'allowed_users': whitelist_info['users']}, indent=2).encode()
+    await update.message.reply_document(
+        document=io.BytesIO(content),
+        filename=WHITELIST_FILE,
+        caption=f"👥 {whitelist_info['count']} کاربر مجاز"
+    )
+
+async def import_data_document(update: Update, context: ContextTypes.DEFAULT_TYPE, document):
+    """وارد کردن یک فایل CSV/JSONL با یک بار ذخیره و گزارش مرحله به مرحله"""
+    try:
+        fmt = bulk.detect_format(document.file_name or '')
+    except bulk.BulkError as error:
+        await update.message.reply_text(f"❌ {error}")
+        return
+    if (document.file_size or 0) > BULK_IMPORT_MAX_BYTES:
+        await update.message.reply_text("❌ حجم فایل بیشتر از حد مجاز است!")
+        return
+    
+    status = await update.message.reply_text("⏳ در حال دریافت فایل...")
+    file = await context.bot.get_file(document.file_id)
+    content = await file.download_as_bytearray()
+    await status.edit_text("⏳ در حال بررسی رکوردها...")
+    try:
+        # خواندن و بررسی فایل بیرون از event loop؛ داده‌ها هنوز دست نخورده‌اند
+        records = await asyncio.to_thread(bulk.load_records, bytes(content), fmt)
+    except bulk.BulkError as error:
+        await status.edit_text(f"❌ {error}\n\nهیچ رکوردی وارد نشد.")
+        return
+    
+    await status.edit_text(f"⏳ ثبت {len(records):,} رکورد...")
+    last_report = time.monotonic()
+    
+    async def report(count):
+        nonlocal last_report
+        if time.monotonic() - last_report < BULK_PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        try:
+            await status.edit_text(f"⏳ ثبت رکوردها: {count:,} از {len(records):,}")
+        except TelegramError as error:
+            # پیام پیشرفت مهم نیست؛ ورود ادامه پیدا می‌کند
+            logger.warning("ویرایش پیام پیشرفت ورود گروهی ناموفق بود: %s", error)
+    
+    # ثبت تکه به تکه؛ بین تکه‌ها قفل آزاد است و بقیه updateها پاسخ می‌گیرند
+    stats = await bulk.import_records_async(bot, records, progress=report)
+    await status.edit_text(
+        f"✅ ورود گروهی انجام شد:\n\n"
+        f"📂 {stats['categories']} دسته جدید\n"
+        f"📝 {stats['items']} آیتم\n"
+        f"🎬 {stats['ratings']} نمره\n"
+        f"⏭️ {stats['skipped']} رکورد تکراری"
+    )
+
+async def admin_import_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """وارد کردن دسته‌ها، آیتم‌ها و نمره‌ها از فایلی که به آن پاسخ داده شده"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند داده وارد کند!")
+        return
+    
+    reply = update.message.reply_to_message
+    if reply is None or reply.document is None:
+        await update.message.reply_text(
+            "📥 یک فایل `.csv` یا `.jsonl` بفرستید، یا با `/import_data` به آن پاسخ دهید.\n\n"
+            "قالب فایل همان خروجی `/export_data` است.",
+            parse_mode='Markdown'
+        )
+        return
+    await import_data_document(update, context, reply.document)
+
+async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """فایل CSV/JSONL فرستاده شده توسط ادمین مستقیم وارد می‌شود"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند داده وارد کند!")
+        return
+    await import_data_document(update, context, update.message.document)
+
+async def admin_export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ارسال همه دسته‌ها، آیتم‌ها و نمره‌ها به صورت فایل CSV یا JSONL"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند از داده‌ها خروجی بگیرد!")
+        return
+    
+    fmt = context.args[0].lower() if context.args else 'jsonl'
+    if fmt not in ('csv', 'jsonl'):
+        await update.message.reply_text("❌ قالب باید csv یا jsonl باشد!\n\nمثال: `/export_data csv`", parse_mode='Markdown')
+        return
+    
+    content, count = bulk.export_bytes(bot, fmt)
+    await update.message.reply_document(
+        document=io.BytesIO(content),
+        filename=f"panirbot-export.{fmt}",
+        caption=f"📦 {count:,} رکورد"
+    )
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """روشن و خاموش کردن پروفایل handlerها و نوشتن نتیجه روی دیسک"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ فقط ادمین می‌تواند پروفایل را کنترل کند!")
+        return
+    
+    action = context.args[0] if context.args else ''
+    if action == 'on':
+        profiler.reset()
+        profiler.enabled = True
+        await update.message.reply_text(f"🔬 پروفایل روشن شد ({profiler.rate:.0%} از اجراها)")
+    elif action in ('off', 'dump'):
+        if action == 'off':
+            profiler.enabled = False
+        path = profiler.dump()
+        if path:
+            await update.message.reply_text(f"💾 {profiler.samples} نمونه در `{path}` ذخیره شد", parse_mode='Markdown')
+        else:
+            await update.message.reply_text("📝 هنوز نمونه‌ای جمع نشده است!")
+    else:
+        status = "روشن" if profiler.enabled else "خاموش"
+        await update.message.reply_text(
+            f"🔬 پروفایل: {status} - {profiler.samples} نمونه\n\nمثال: `/profile on`، `/profile off`، `/profile dump`",
+            parse_mode='Markdown'
+        )
+
+def page_count(total, page_size):
+    """تعداد صفحه‌ها (حداقل یک صفحه)"""
+    return max(1, -(-total // page_size))
+
+def clamp_page(page, total, page_size):
+    """محدود کردن شماره صفحه به بازه معتبر"""
+    return min(max(page, 0), page_count(total, page_size) - 1)
+
+def pagination_row(route, page, pages, *args):
+    """دکمه‌های صفحه قبل و بعد؛ شماره صفحه آخرین آرگومان مسیر route است"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("⬅️ قبلی", callback_data=router.pack(route, *args, page - 1)))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("بعدی ➡️", callback_data=router.pack(route, *args, page + 1)))
+    return row
+
+def render_categories(bot_username):
+    """ساخت متن و کیبورد صفحه دسته‌بندی‌ها"""
     shared_data = bot.get_shared_data()
     
     keyboard = []
@@ -454,35 +1464,26 @@ async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += "❌ هیچ دسته‌بندی‌ای وجود ندارد!\n\n"
         text += "برای شروع، یک دسته‌بندی جدید اضافه کنید."
         keyboard = [[
-            InlineKeyboardButton("➕ دسته جدید", url=f"https://t.me/{context.bot.username}?start=add_category")
+            InlineKeyboardButton("➕ دسته جدید", url=f"https://t.me/{bot_username}?start=add_category")
         ]]
     else:
         for cat_id, category in shared_data['categories'].items():
-            total_items = len(category['items'])
-            completed_items = sum(1 for item in category['items'] if item['completed'])
+            completed_items, total_items = bot.item_counts(cat_id)
             
             text += f"{category['icon']} **{category['name']}**\n"
             text += f"   📊 {completed_items}/{total_items} انجام شده\n"
             
             # نمایش ۵ آیتم آخر
-            items = category['items']
-            if items:
-                # فیلتر کردن آیتم‌ها: اول غیرتکمیل‌شده‌ها، سپس تکمیل‌شده‌ها
-                incomplete_items = [item for item in items if not item['completed']]
-                completed_items_list = [item for item in items if item['completed']]
-                
-                # انتخاب ۵ آیتم آخر
-                if incomplete_items:
-                    display_items = incomplete_items[-5:]
-                else:
-                    display_items = completed_items_list[-5:]
+            if total_items:
+                # اول غیرتکمیل‌شده‌ها، اگر نبودند تکمیل‌شده‌ها
+                display_items = bot.partition_items(cat_id, completed_items == total_items, 5, last=True)
                 
                 for item in display_items:
                     status = "✅" if item['completed'] else "⭕"
                     text += f"      {status} {item['text'][:30]}{'...' if len(item['text']) > 30 else ''}\n"
                 
-                if len(items) > 5:
-                    text += f"      📝 و {len(items) - 5} آیتم دیگر...\n"
+                if total_items > 5:
+                    text += f"      📝 و {total_items - 5} آیتم دیگر...\n"
             else:
                 text += "      📝 هیچ آیتمی وجود ندارد\n"
             
@@ -490,36 +1491,39 @@ async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
             keyboard.append([
                 InlineKeyboardButton(
                     f"{category['icon']} {category['name']} ({total_items})",
-                    callback_data=f"view_category_{cat_id}"
+                    callback_data=router.pack("view_category", cat_id)
                 )
             ])
                     
         keyboard.append([
-            InlineKeyboardButton("➕ دسته جدید", url=f"https://t.me/{context.bot.username}?start=add_category"),
-            InlineKeyboardButton("🗑️ حذف دسته", callback_data="delete_category_menu")
+            InlineKeyboardButton("➕ دسته جدید", url=f"https://t.me/{bot_username}?start=add_category"),
+            InlineKeyboardButton("🗑️ حذف دسته", callback_data=router.pack("delete_category_menu"))
         ])
 
         keyboard.append([
-            InlineKeyboardButton("🎬 نمره‌دهی فیلم‌ها", callback_data="movie_ratings_menu")
+            InlineKeyboardButton("🎬 نمره‌دهی فیلم‌ها", callback_data=router.pack("movie_ratings_menu"))
         ])
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return text, InlineKeyboardMarkup(keyboard)
+
+@check_access
+async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش دسته‌بندی‌ها"""
+    text, reply_markup = render_cache.get(
+        ('categories',), bot.version('categories'),
+        lambda: render_categories(context.bot.username)
+    )
     
     if update.message:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def view_category(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str):
-    """نمایش آیتم‌های یک دسته"""
-    shared_data = bot.get_shared_data()
-    
-    if category_id not in shared_data['categories']:
-        await update.callback_query.answer("❌ دسته‌بندی پیدا نشد!")
-        return
-    
-    category = shared_data['categories'][category_id]
+def render_category(bot_username, category_id, page=0):
+    """ساخت متن و کیبورد یک صفحه از آیتم‌های یک دسته"""
+    category = bot.get_shared_data()['categories'][category_id]
     items = category['items']
+    pages = page_count(len(items), ITEMS_PAGE_SIZE)
     
     text = f"{category['icon']} **{category['name']}**\n\n"
     
@@ -527,19 +1531,19 @@ async def view_category(update: Update, context: ContextTypes.DEFAULT_TYPE, cate
         text += "📝 هیچ آیتمی وجود ندارد!\n\n"
         keyboard = [
             [
-                InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{context.bot.username}?start=add_item_{category_id}")
+                InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{bot_username}?start=add_item_{category_id}")
             ],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")]
+            [InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("back_to_categories"))]
         ]
     else:
-        completed_count = sum(1 for item in items if item['completed'])
-        total_count = len(items)
+        completed_count, total_count = bot.item_counts(category_id)
         progress = int((completed_count / total_count) * 10) if total_count > 0 else 0
         
         text += f"📊 **پیشرفت:** {completed_count}/{total_count}\n"
         text += f"{'🟩' * progress}{'⬜' * (10 - progress)}\n\n"
         
-        for item in items:
+        start = page * ITEMS_PAGE_SIZE
+        for item in items[start:start + ITEMS_PAGE_SIZE]:
             status = "✅" if item['completed'] else "⭕"
             text += f"{status} {item['text']}\n"
             text += f"   📅 {item['created_at']}"
@@ -547,19 +1551,38 @@ async def view_category(update: Update, context: ContextTypes.DEFAULT_TYPE, cate
                 text += f" • 👤 {item['added_by']}"
             text += "\n\n"
         
+        if pages > 1:
+            text += f"📄 صفحه {page + 1} از {pages}"
+        
         keyboard = [
             [
-                InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{context.bot.username}?start=add_item_{category_id}"),
-                InlineKeyboardButton("✏️ ویرایش", callback_data=f"edit_menu_{category_id}")
+                InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{bot_username}?start=add_item_{category_id}"),
+                InlineKeyboardButton("✏️ ویرایش", callback_data=router.pack("edit_menu", category_id, page))
             ],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")]
+            [InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("back_to_categories"))]
         ]
+        nav = pagination_row("view_category", page, pages, category_id)
+        if nav:
+            keyboard.insert(1, nav)
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-#    print("debug2: " , update)
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def view_category(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str, page: int = 0):
+    """نمایش آیتم‌های یک دسته"""
+    categories = bot.get_shared_data()['categories']
+    if category_id not in categories:
+        await update.callback_query.answer("❌ دسته‌بندی پیدا نشد!")
+        return
+    await update.callback_query.answer()
+    
+    page = clamp_page(page, len(categories[category_id]['items']), ITEMS_PAGE_SIZE)
+    text, reply_markup = render_cache.get(
+        ('category', category_id, page), bot.version('category', category_id),
+        lambda: render_category(context.bot.username, category_id, page)
+    )
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str):
+async def edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str, page: int = 0):
     """منوی ویرایش آیتم‌ها"""
     shared_data = bot.get_shared_data()
     
@@ -573,27 +1596,35 @@ async def edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, category
         
         keyboard = [
             [InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{context.bot.username}?start=add_item_{category_id}")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data=f"view_category_{category_id}")]
+            [InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("view_category", category_id))]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
         return
     
+    pages = page_count(len(items), ITEMS_PAGE_SIZE)
+    page = clamp_page(page, len(items), ITEMS_PAGE_SIZE)
     text = f"✏️ **ویرایش آیتم‌های {category['name']}:**\n\n"
+    if pages > 1:
+        text += f"📄 صفحه {page + 1} از {pages}"
     
     keyboard = []
-    for item in items:
+    start = page * ITEMS_PAGE_SIZE
+    for item in items[start:start + ITEMS_PAGE_SIZE]:
         status = "✅" if item['completed'] else "⭕"
         keyboard.append([
             InlineKeyboardButton(
                 f"{status} {item['text'][:20]}{'...' if len(item['text']) > 20 else ''}",
-                callback_data=f"edit_item_{category_id}_{item['id']}"
+                callback_data=router.pack("edit_item", category_id, item['id'])
             )
         ])
     
+    nav = pagination_row("edit_menu", page, pages, category_id)
+    if nav:
+        keyboard.append(nav)
     keyboard.append([
-        InlineKeyboardButton("🔙 بازگشت", callback_data=f"view_category_{category_id}")
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("view_category", category_id, page))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -601,14 +1632,12 @@ async def edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, category
 
 async def edit_item_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str, item_id: str):
     """منوی ویرایش یک آیتم خاص"""
-    shared_data = bot.get_shared_data()
-    
-    category = shared_data['categories'][category_id]
-    item = next((item for item in category['items'] if item['id'] == item_id), None)
+    item = bot.get_item(category_id, item_id)
     
     if not item:
         await update.callback_query.answer("❌ آیتم پیدا نشد!")
         return
+    await update.callback_query.answer()
     
     status = "✅ انجام شده" if item['completed'] else "⭕ انجام نشده"
     text = f"✏️ **ویرایش آیتم:**\n\n"
@@ -628,14 +1657,14 @@ async def edit_item_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, cat
         [
             InlineKeyboardButton(
                 "✅ تکمیل" if not item['completed'] else "⭕ عدم تکمیل",
-                callback_data=f"toggle_item_{category_id}_{item_id}"
+                callback_data=router.pack("toggle_item", category_id, item_id, int(item['completed']))
             )
         ],
         [
-            InlineKeyboardButton("🗑️ حذف", callback_data=f"delete_item_{category_id}_{item_id}")
+            InlineKeyboardButton("🗑️ حذف", callback_data=router.pack("delete_item", category_id, item_id))
         ],
         [
-            InlineKeyboardButton("🔙 بازگشت", callback_data=f"edit_menu_{category_id}")
+            InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("edit_menu", category_id))
         ]
     ]
     
@@ -643,22 +1672,20 @@ async def edit_item_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, cat
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 
-@check_access
-async def movie_ratings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """منوی اصلی نمره‌دهی فیلم‌ها"""
-    movies = bot.get_movie_ratings()
+def render_movie_ratings_menu(bot_username):
+    """ساخت متن و کیبورد منوی نمره‌دهی فیلم‌ها"""
+    movie_count = bot.count_movies()
     
     text = "🎬 **نمره‌دهی فیلم‌ها** ⭐\n\n"
     
-    if not movies:
+    if not movie_count:
         text += "📝 هیچ فیلمی نمره‌دهی نشده است!\n\n"
         text += "برای شروع، یک فیلم نمره‌دهی کنید."
     else:
-        text += f"📊 تعداد فیلم‌های نمره‌دهی شده: {len(movies)}\n\n"
+        text += f"📊 تعداد فیلم‌های نمره‌دهی شده: {movie_count}\n\n"
         
         # نمایش 5 فیلم برتر
-        sorted_movies = bot.get_movie_ratings('rating')
-        top_movies = list(sorted_movies.items())[:5]
+        top_movies = bot.get_top_movies(5)
         
         text += "🏆 **برترین فیلم‌ها:**\n"
         for i, (movie, data) in enumerate(top_movies, 1):
@@ -666,41 +1693,47 @@ async def movie_ratings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
             text += f"{i}. {movie} - {data['average']:.1f}/10 {stars}\n"
             text += f"   👥 {data['total_ratings']} نمره\n"
         
-        if len(movies) > 5:
-            text += f"\n... و {len(movies) - 5} فیلم دیگر"
+        if movie_count > 5:
+            text += f"\n... و {movie_count - 5} فیلم دیگر"
     
     keyboard = [
         [
-            InlineKeyboardButton("➕ نمره‌دهی جدید", url=f"https://t.me/{context.bot.username}?start=add_movie"),
-            InlineKeyboardButton("📋 همه فیلم‌ها", callback_data="view_all_movies")
+            InlineKeyboardButton("➕ نمره‌دهی جدید", url=f"https://t.me/{bot_username}?start=add_movie"),
+            InlineKeyboardButton("📋 همه فیلم‌ها", callback_data=router.pack("view_all_movies"))
         ],
         [
-            InlineKeyboardButton("📊 آمار", callback_data="movie_stats")
+            InlineKeyboardButton("📊 آمار", callback_data=router.pack("movie_stats"))
         ],
         [
-            InlineKeyboardButton("🔙 منوی اصلی", callback_data="back_to_categories")
+            InlineKeyboardButton("🔙 منوی اصلی", callback_data=router.pack("back_to_categories"))
         ]
     ]
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return text, InlineKeyboardMarkup(keyboard)
+
+@check_access
+async def movie_ratings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """منوی اصلی نمره‌دهی فیلم‌ها"""
+    text, reply_markup = render_cache.get(
+        ('movie_ratings_menu',), bot.version('movies'),
+        lambda: render_movie_ratings_menu(context.bot.username)
+    )
     
     if update.message:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def view_all_movies(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش همه فیلم‌های نمره‌دهی شده"""
-    movies = bot.get_movie_ratings()
-    
-    if not movies:
-        await update.callback_query.answer("هیچ فیلمی نمره‌دهی نشده!")
-        return
+def render_all_movies(page=0):
+    """ساخت متن و کیبورد یک صفحه از لیست همه فیلم‌ها"""
+    pages = page_count(bot.count_movies(), MOVIES_PAGE_SIZE)
+    start = page * MOVIES_PAGE_SIZE
+    movies = bot.get_movies_range('name', start, start + MOVIES_PAGE_SIZE)
     
     text = "🎬 **همه فیلم‌های نمره‌دهی شده:**\n\n"
     
     keyboard = []
-    for movie, data in movies.items():
+    for movie, data in movies:
         stars = "⭐" * int(data['average'])
         text += f"🎬 {movie}\n"
         text += f"   📊 {data['average']:.1f}/10 {stars}\n"
@@ -709,27 +1742,38 @@ async def view_all_movies(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([
             InlineKeyboardButton(
                 f"🎬 {movie[:20]}{'...' if len(movie) > 20 else ''} ({data['average']:.1f}/10)",
-                callback_data=f"view_movie_{movie}"
+                callback_data=router.pack("view_movie", bot.get_movie_id(movie))
             )
     ])
     
+    if pages > 1:
+        text += f"📄 صفحه {page + 1} از {pages}"
+    nav = pagination_row("view_all_movies", page, pages)
+    if nav:
+        keyboard.append(nav)
     keyboard.append([
-        InlineKeyboardButton("🔙 بازگشت", callback_data="movie_ratings_menu")
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("movie_ratings_menu"))
     ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    return text, InlineKeyboardMarkup(keyboard)
 
-async def view_movie_details(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str):
-    """نمایش جزئیات یک فیلم"""
-    movies = bot.get_movie_ratings()
-    
-    if movie_name not in movies:
-        await update.callback_query.answer("فیلم پیدا نشد!")
+async def view_all_movies(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """نمایش همه فیلم‌های نمره‌دهی شده"""
+    if not bot.count_movies():
+        await update.callback_query.answer("هیچ فیلمی نمره‌دهی نشده!")
         return
+    await update.callback_query.answer()
     
-    movie_data = movies[movie_name]
-    user_id = update.effective_user.id
+    page = clamp_page(page, bot.count_movies(), MOVIES_PAGE_SIZE)
+    text, reply_markup = render_cache.get(
+        ('all_movies', page), bot.version('movies'),
+        lambda: render_all_movies(page)
+    )
+    await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+def render_movie_details(movie_name):
+    """ساخت متن جزئیات یک فیلم (کیبورد آن به کاربر بستگی دارد)"""
+    movie_data = bot.get_movie(movie_name)
     
     text = f"🎬 **{movie_name}**\n\n"
     text += f"📊 **میانگین نمره:** {movie_data['average']:.1f}/10\n"
@@ -744,6 +1788,90 @@ async def view_movie_details(update: Update, context: ContextTypes.DEFAULT_TYPE,
         if rating['comment']:
             text += f"   💬 {rating['comment']}\n"
         text += f"   📅 {rating['date']}\n\n"
+    return text
+
+async def show_unrated_movies(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """نمایش صفحه‌ای از فیلم‌هایی که کاربر هنوز نمره نداده"""
+    user_id = update.effective_user.id
+    unrated_count = bot.count_unrated_movies(user_id)
+    pages = page_count(unrated_count, MOVIES_PAGE_SIZE)
+    page = clamp_page(page, unrated_count, MOVIES_PAGE_SIZE)
+    
+    text = "🎬 **فیلم‌های نمره داده نشده:**\n\n"
+    keyboard = []
+    
+    if unrated_count:
+        start = page * MOVIES_PAGE_SIZE
+        for movie in bot.get_unrated_movies(user_id, start, start + MOVIES_PAGE_SIZE):
+            data = bot.get_movie(movie)
+            stars = "⭐" * int(data['average'])
+            text += f"• {movie}\n"
+            text += f"  📊 میانگین: {data['average']:.1f}/10 {stars}\n"
+            text += f"  👥 تعداد نمره‌ها: {data['total_ratings']}\n\n"
+            keyboard.append([
+                InlineKeyboardButton(f"نمره دادن به {movie[:20]}{'...' if len(movie) > 20 else ''}", 
+                                   callback_data=router.pack("rate_movie", bot.get_movie_id(movie)))
+            ])
+        if pages > 1:
+            text += f"📄 صفحه {page + 1} از {pages}"
+        nav = pagination_row("show_unrated_movies", page, pages)
+        if nav:
+            keyboard.append(nav)
+    else:
+        text += "✅ شما به همه فیلم‌ها نمره داده‌اید!\n\n"
+        text += "برای اضافه کردن فیلم جدید از دکمه زیر استفاده کنید."
+    
+    keyboard.append([
+        InlineKeyboardButton("➕ افزودن فیلم جدید", url=f"https://t.me/{context.bot.username}?start=add_movie")
+    ])
+    keyboard.append([
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("movie_ratings_menu"))
+    ])
+    
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+# شناسه ۰ در دکمه‌ها یعنی فیلمی که کاربر تازه نامش را نوشته و هنوز نمره‌ای ندارد (temp_movie_name)
+DRAFT_MOVIE_ID = 0
+
+def movie_button_ref(context, movie_name):
+    """شناسه فیلم برای ساخت دکمه؛ برای فیلم جدید DRAFT_MOVIE_ID"""
+    movie_id = bot.get_movie_id(movie_name)
+    if movie_id is not None:
+        return movie_id
+    context.user_data['temp_movie_name'] = movie_name
+    return DRAFT_MOVIE_ID
+
+def movie_route(handler):
+    """تبدیل آرگومان فیلم دکمه به نام فیلم قبل از صدا زدن handler(update, context, movie_name, ...)
+
+    آرگومان فیلم بدون تبدیل ثبت می‌شود: شناسه عددی در دکمه‌های فشرده یا نام فیلم در دکمه‌های قدیمی.
+    """
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, ref, *args):
+        if isinstance(ref, str):
+            movie_name = ref
+        elif ref == DRAFT_MOVIE_ID:
+            movie_name = context.user_data.get('temp_movie_name')
+        else:
+            movie_name = bot.get_movie_name(ref)
+        if movie_name is None:
+            await update.callback_query.answer("فیلم پیدا نشد!")
+            return
+        await handler(update, context, movie_name, *args)
+    return wrapper
+
+async def view_movie_details(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str):
+    """نمایش جزئیات یک فیلم"""
+    if bot.get_movie(movie_name) is None:
+        await update.callback_query.answer("فیلم پیدا نشد!")
+        return
+    await update.callback_query.answer()
+    
+    user_id = update.effective_user.id
+    text = render_cache.get(
+        ('movie', movie_name), bot.version('movie', movie_name),
+        lambda: render_movie_details(movie_name)
+    )
     
     # دکمه‌ها
     keyboard = []
@@ -753,16 +1881,16 @@ async def view_movie_details(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     if user_rating:
         keyboard.append([
-            InlineKeyboardButton("✏️ ویرایش نمره من", callback_data=f"edit_my_rating_{movie_name}")
+            InlineKeyboardButton("✏️ ویرایش نمره من", callback_data=router.pack("edit_my_rating", bot.get_movie_id(movie_name)))
         ])
     else:
         keyboard.append([
-            InlineKeyboardButton("➕ نمره‌دهی", callback_data=f"rate_movie_{movie_name}")
+            InlineKeyboardButton("➕ نمره‌دهی", callback_data=router.pack("rate_movie", bot.get_movie_id(movie_name)))
         ])
     
     keyboard.append([
-        InlineKeyboardButton("🗑️ حذف فیلم", callback_data=f"delete_movie_{movie_name}"),
-        InlineKeyboardButton("🔙 بازگشت", callback_data="view_all_movies")
+        InlineKeyboardButton("🗑️ حذف فیلم", callback_data=router.pack("delete_movie", bot.get_movie_id(movie_name))),
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("view_all_movies"))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -774,16 +1902,17 @@ async def rate_movie_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, mo
     text += "لطفاً نمره خود را انتخاب کنید (1-10):"
     
     keyboard = []
+    movie_ref = movie_button_ref(context, movie_name)
     
     # ساخت دکمه‌های نمره 1 تا 10
     for i in range(1, 11):
         stars = "⭐" * i
         keyboard.append([
-            InlineKeyboardButton(f"{i}/10 {stars}", callback_data=f"set_rating_{movie_name}_{i}")
+            InlineKeyboardButton(f"{i}/10 {stars}", callback_data=router.pack("set_rating", movie_ref, i))
         ])
     
     keyboard.append([
-        InlineKeyboardButton("🔙 بازگشت", callback_data=f"view_movie_{movie_name}")
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("view_movie", movie_ref))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -791,6 +1920,7 @@ async def rate_movie_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, mo
     if update.message:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
+        await update.callback_query.answer()
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def ask_for_comment(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str, rating: int):
@@ -799,370 +1929,387 @@ async def ask_for_comment(update: Update, context: ContextTypes.DEFAULT_TYPE, mo
     text += "💬 نظر خود را درباره فیلم بنویسید یا روی SKIP کلیک کنید."
     
     keyboard = [[
-        InlineKeyboardButton("⏩ SKIP", callback_data=f"skip_comment_{movie_name}_{rating}")
+        InlineKeyboardButton("⏩ SKIP", callback_data=router.pack("skip_comment", movie_button_ref(context, movie_name), rating))
     ]]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def movie_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش آمار فیلم‌ها"""
-    movies = bot.get_movie_ratings()
-    if not movies:
-        await update.callback_query.answer("هیچ فیلمی نمره‌دهی نشده!")
-        return
+def render_movie_stats():
+    """ساخت متن و کیبورد صفحه آمار فیلم‌ها"""
+    stats = bot.get_movie_stats()
     text = "📊 **آمار فیلم‌ها:**\n\n"
-    total_movies = len(movies)
-    total_ratings = sum(data['total_ratings'] for data in movies.values())
-    if total_ratings > 0:
-        overall_average = sum(data['average'] * data['total_ratings'] for data in movies.values()) / total_ratings
-    else:
-        overall_average = 0
-    text += f"🎬 تعداد فیلم‌ها: {total_movies}\n"
-    text += f"📊 تعداد کل نمره‌ها: {total_ratings}\n"
-    text += f"⭐ میانگین کلی: {overall_average:.1f}/10\n\n"
-    if movies:
-        best_movie = max(movies.items(), key=lambda x: x[1]['average'])
+    text += f"🎬 تعداد فیلم‌ها: {stats['total_movies']}\n"
+    text += f"📊 تعداد کل نمره‌ها: {stats['total_ratings']}\n"
+    text += f"⭐ میانگین کلی: {stats['average']:.1f}/10\n\n"
+    top_movies = bot.get_top_movies(1)
+    if top_movies:
+        best_movie = top_movies[0]
         text += f"🏆 **بهترین فیلم:**\n"
         text += f"   🎬 {best_movie[0]}\n"
         text += f"   ⭐ {best_movie[1]['average']:.1f}/10\n\n"
-    rating_distribution = {}
-    for movie_data in movies.values():
-        for rating in movie_data['ratings']:
-            score = rating['rating']
-            rating_distribution[score] = rating_distribution.get(score, 0) + 1
+    rating_distribution = stats['distribution']
     if rating_distribution:
         text += "📈 **توزیع نمره‌ها:**\n"
         for score in sorted(rating_distribution.keys(), reverse=True):
             count = rating_distribution[score]
             bars = "█" * min(count, 10)
             text += f"   {score}/10: {bars} ({count})\n"
-    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="movie_ratings_menu")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("movie_ratings_menu"))]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def movie_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش آمار فیلم‌ها"""
+    if not bot.count_movies():
+        await update.callback_query.answer("هیچ فیلمی نمره‌دهی نشده!")
+        return
+    await update.callback_query.answer()
+    text, reply_markup = render_cache.get(('movie_stats',), bot.version('movies'), render_movie_stats)
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def inline_query(update: Update, context):
-    query = update.inline_query.query
-    user_id = update.effective_user.id
+def inline_result_id(*parts):
+    """شناسه ثابت نتیجه inline از شناسه موجودیت و نسخه داده‌اش (حداکثر ۶۴ بایت)
+
+    تا وقتی داده تغییر نکرده شناسه یکسان می‌ماند و تلگرام می‌تواند نتیجه را از کش خودش بدهد.
+    """
+    result_id = ":".join(str(part) for part in parts)
+    if len(result_id.encode()) > 64:
+        result_id = hashlib.sha1(result_id.encode()).hexdigest()
+    return result_id
+
+def render_inline_movies():
+    """ساخت نتیجه inline لیست برترین فیلم‌ها"""
+    # اضافه کردن دستور Film_Rate
+    movie_text = '🎬 **لیست برترین فیلم‌ها**\n\n'
     
-    results = []
+    # انتخاب 5 فیلم برتر
+    top_movies = bot.get_top_movies(5)
     
-    if not query:
-        # اضافه کردن دستور Film_Rate
-        movied = bot.get_movie_ratings('rating')  # دریافت فیلم‌ها به صورت مرتب شده
-        movie_text = '🎬 **لیست برترین فیلم‌ها**\n\n'
-        
-        # انتخاب 5 فیلم برتر
-        top_movies = list(movied.items())[:5]
-        
-        if top_movies:
-            for i, (movie, data) in enumerate(top_movies, 1):
-                stars = "⭐" * int(data['average'])
-                movie_text += f"{'═' * 35}\n"
-                movie_text += f"**{i}. {movie}**\n"
-                movie_text += f"📊 میانگین: {data['average']:.1f}/10 {stars}\n"
-                movie_text += f"👥 تعداد نمره‌ها: {data['total_ratings']}\n\n"
-                movie_text += "**نمره‌های کاربران:**\n"
-                
-                # مرتب‌سازی نمره‌ها بر اساس تاریخ (جدیدترین اول)
-                sorted_ratings = sorted(data['ratings'], key=lambda x: x['date'], reverse=True)
-                
-                for rating in sorted_ratings:
-                    user_stars = "⭐" * rating['rating']
-                    movie_text += f"• {rating['user_name']}: {rating['rating']}/10 {user_stars}\n"
-                    if rating['comment']:
-                        movie_text += f"  💬 {rating['comment']}\n"
-                movie_text += "\n"
-            
+    if top_movies:
+        for i, (movie, data) in enumerate(top_movies, 1):
+            stars = "⭐" * int(data['average'])
             movie_text += f"{'═' * 35}\n"
-            movie_text += "\n📝 برای مشاهده همه فیلم‌ها از دکمه‌های زیر استفاده کنید."
-        else:
-            movie_text = "هیچ فیلمی هنوز نمره‌دهی نشده است!"
-
-        # دکمه‌های مربوط به فیلم
-        movie_keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ نمره‌دهی جدید", callback_data="show_unrated_movies"),
-             InlineKeyboardButton("📋 همه فیلم‌ها", callback_data="view_all_movies")],
-            [InlineKeyboardButton("📊 آمار", callback_data="movie_stats")]
-        ])
-        
-        results.append(InlineQueryResultArticle(
-            id=str(uuid.uuid4()),
-            title="🎬 نمایش لیست فیلم‌ها و نمرات",
-            description="کلیک کنید تا لیست همه فیلم‌ها و نمرات آنها را ببینید",
-            input_message_content=InputTextMessageContent(
-                message_text=movie_text,
-                parse_mode='Markdown'
-            ),
-            reply_markup=movie_keyboard
-        ))
-        
-        # اضافه کردن همه دسته‌بندی‌ها
-        shared_data = bot.get_shared_data()
-        categories = shared_data['categories']
-        
-        for cat_id, category in categories.items():
-            # فیلتر کردن آیتم‌های تیک نخورده
-            uncompleted_items = [item for item in category['items'] if not item['completed']]
-            total_items = len(category['items'])
-            uncompleted_count = len(uncompleted_items)
+            movie_text += f"**{i}. {movie}**\n"
+            movie_text += f"📊 میانگین: {data['average']:.1f}/10 {stars}\n"
+            movie_text += f"👥 تعداد نمره‌ها: {data['total_ratings']}\n\n"
+            movie_text += "**نمره‌های کاربران:**\n"
             
-            text = f"{category['icon']} **{category['name']}**\n\n"
-            text += f"📊 وضعیت: {total_items - uncompleted_count}/{total_items} تکمیل شده\n\n"
+            # مرتب‌سازی نمره‌ها بر اساس تاریخ (جدیدترین اول)
+            sorted_ratings = sorted(data['ratings'], key=lambda x: x['date'], reverse=True)
             
-            if uncompleted_items:
-                text += "📝 **آیتم‌های انجام نشده:**\n\n"
-                for item in uncompleted_items:
-                    text += f"⭕ {item['text']}\n"
-                    text += f"📅 {item['created_at']}"
-                    if 'added_by' in item:
-                        text += f" • 👤 {item['added_by']}"
-                    text += "\n\n"
-            else:
-                text += "✅ همه آیتم‌ها تکمیل شده‌اند!"
+            for rating in sorted_ratings:
+                user_stars = "⭐" * rating['rating']
+                movie_text += f"• {rating['user_name']}: {rating['rating']}/10 {user_stars}\n"
+                if rating['comment']:
+                    movie_text += f"  💬 {rating['comment']}\n"
+            movie_text += "\n"
+        
+        movie_text += f"{'═' * 35}\n"
+        movie_text += "\n📝 برای مشاهده همه فیلم‌ها از دکمه‌های زیر استفاده کنید."
+    else:
+        movie_text = "هیچ فیلمی هنوز نمره‌دهی نشده است!"
 
-            # دکمه‌های مربوط به هر دسته‌بندی
-            category_keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{context.bot.username}?start=add_item_{cat_id}"),
-                 InlineKeyboardButton("✏️ ویرایش", callback_data=f"edit_menu_{cat_id}")],
-                [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")]
-            ])
-            
-            results.append(InlineQueryResultArticle(
-                id=str(uuid.uuid4()),
-                title=f"{category['icon']} {category['name']} ({len(uncompleted_items)} آیتم)",
-                description=f"تکمیل شده: {total_items - uncompleted_count}/{total_items}",
-                input_message_content=InputTextMessageContent(
-                    message_text=text,
-                    parse_mode='Markdown'
-                ),
-                reply_markup=category_keyboard
-            ))
+    # دکمه‌های مربوط به فیلم
+    movie_keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("➕ نمره‌دهی جدید", callback_data=router.pack("show_unrated_movies")),
+         InlineKeyboardButton("📋 همه فیلم‌ها", callback_data=router.pack("view_all_movies"))],
+        [InlineKeyboardButton("📊 آمار", callback_data=router.pack("movie_stats"))]
+    ])
     
-    elif query.strip():  # اگر کوئری خالی نباشد
-        shared_data = bot.get_shared_data()
-        categories = shared_data['categories']
-        
-        # جستجو در دسته‌بندی‌ها
-        for cat_id, category in categories.items():
-            if query.lower() in category['name'].lower():
-                # فیلتر کردن آیتم‌های تیک نخورده
-                uncompleted_items = [item for item in category['items'] if not item['completed']]
-                
-                if uncompleted_items:
-                    text = f"{category['icon']} **{category['name']}**\n\n"
-                    text += "📝 **آیتم‌های انجام نشده:**\n\n"
-                    
-                    for item in uncompleted_items:
-                        text += f"⭕ {item['text']}\n"
-                        text += f"📅 {item['created_at']}"
-                        if 'added_by' in item:
-                            text += f" • 👤 {item['added_by']}"
-                        text += "\n\n"
-
-                    # دکمه‌های مربوط به دسته‌بندی
-                    category_keyboard = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{context.bot.username}?start=add_item_{cat_id}"),
-                         InlineKeyboardButton("✏️ ویرایش", callback_data=f"edit_menu_{cat_id}")],
-                        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")]
-                    ])
-                    
-                    results.append(InlineQueryResultArticle(
-                        id=str(uuid.uuid4()),
-                        title=f"{category['icon']} {category['name']} ({len(uncompleted_items)} آیتم)",
-                        description=f"نمایش {len(uncompleted_items)} آیتم انجام نشده",
-                        input_message_content=InputTextMessageContent(
-                            message_text=text,
-                            parse_mode='Markdown'
-                        ),
-                        reply_markup=category_keyboard
-                    ))
-
-    await update.inline_query.answer(results, cache_time=0)
-        
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """مدیریت دکمه‌ها"""
-    query = update.callback_query
-    user_id = update.effective_user.id
-    user_name = update.effective_user.first_name or "کاربر"
+    return InlineQueryResultArticle(
+        id=inline_result_id('movies', bot.version('movies')),
+        title="🎬 نمایش لیست فیلم‌ها و نمرات",
+        description="کلیک کنید تا لیست همه فیلم‌ها و نمرات آنها را ببینید",
+        input_message_content=InputTextMessageContent(
+            message_text=movie_text,
+            parse_mode='Markdown'
+        ),
+        reply_markup=movie_keyboard
+    )
+
+def render_item_preview(items, total):
+    """متن حداکثر INLINE_ITEMS_PREVIEW آیتم (از total آیتم) برای پیام‌های inline"""
+    text = ""
+    for item in items[:INLINE_ITEMS_PREVIEW]:
+        text += f"⭕ {item['text']}\n"
+        text += f"📅 {item['created_at']}"
+        if 'added_by' in item:
+            text += f" • 👤 {item['added_by']}"
+        text += "\n\n"
+    if total > INLINE_ITEMS_PREVIEW:
+        text += f"➕ و {total - INLINE_ITEMS_PREVIEW} آیتم دیگر..."
+    return text
+
+def inline_category_keyboard(bot_username, cat_id):
+    """دکمه‌های مربوط به هر دسته‌بندی در نتایج inline"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("➕ آیتم جدید", url=f"https://t.me/{bot_username}?start=add_item_{cat_id}"),
+         InlineKeyboardButton("✏️ ویرایش", callback_data=router.pack("edit_menu", cat_id))],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("back_to_categories"))]
+    ])
+
+def render_inline_category(bot_username, cat_id):
+    """ساخت نتیجه inline یک دسته با وضعیت تکمیل"""
+    category = bot.get_shared_data()['categories'][cat_id]
+    completed_count, total_items = bot.item_counts(cat_id)
+    uncompleted_count = total_items - completed_count
     
-    # بررسی دسترسی
-    if not bot.is_user_allowed(user_id):
-        await query.answer("❌ شما مجاز به استفاده از این ربات نیستید!")
-        return
+    text = f"{category['icon']} **{category['name']}**\n\n"
+    text += f"📊 وضعیت: {completed_count}/{total_items} تکمیل شده\n\n"
     
-    await query.answer()
+    if uncompleted_count:
+        text += "📝 **آیتم‌های انجام نشده:**\n\n"
+        text += render_item_preview(bot.partition_items(cat_id, False, INLINE_ITEMS_PREVIEW), uncompleted_count)
+    else:
+        text += "✅ همه آیتم‌ها تکمیل شده‌اند!"
+
+    return InlineQueryResultArticle(
+        id=inline_result_id('category', cat_id, bot.version('category', cat_id)),
+        title=f"{category['icon']} {category['name']} ({uncompleted_count} آیتم)",
+        description=f"تکمیل شده: {completed_count}/{total_items}",
+        input_message_content=InputTextMessageContent(
+            message_text=text,
+            parse_mode='Markdown'
+        ),
+        reply_markup=inline_category_keyboard(bot_username, cat_id)
+    )
+
+def render_inline_search_category(bot_username, cat_id):
+    """ساخت نتیجه جستجوی inline برای یک دسته (None اگر آیتم انجام نشده‌ای نداشته باشد)"""
+    category = bot.get_shared_data()['categories'][cat_id]
+    completed_count, total_items = bot.item_counts(cat_id)
+    uncompleted_count = total_items - completed_count
     
-    data = query.data
+    if not uncompleted_count:
+        return None
     
-    print(f"DEBUG: Button pressed: {data}")  # برای دیباگ
+    text = f"{category['icon']} **{category['name']}**\n\n"
+    text += "📝 **آیتم‌های انجام نشده:**\n\n"
+    text += render_item_preview(bot.partition_items(cat_id, False, INLINE_ITEMS_PREVIEW), uncompleted_count)
+
+    return InlineQueryResultArticle(
+        id=inline_result_id('category', cat_id, bot.version('category', cat_id)),
+        title=f"{category['icon']} {category['name']} ({uncompleted_count} آیتم)",
+        description=f"نمایش {uncompleted_count} آیتم انجام نشده",
+        input_message_content=InputTextMessageContent(
+            message_text=text,
+            parse_mode='Markdown'
+        ),
+        reply_markup=inline_category_keyboard(bot_username, cat_id)
+    )
+
+def render_inline_search_item(cat_id, item_id):
+    """ساخت نتیجه جستجوی inline برای یک آیتم"""
+    category = bot.get_shared_data()['categories'][cat_id]
+    item = bot.get_item(cat_id, item_id)
+    status = "✅" if item['completed'] else "⭕"
+    
+    text = f"{status} **{item['text']}**\n\n"
+    text += f"📂 دسته: {category['icon']} {category['name']}\n"
+    text += f"📅 {item['created_at']}"
+    if 'added_by' in item:
+        text += f" • 👤 {item['added_by']}"
     
-    if data == "back_to_categories":
-        await show_categories(update, context)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("✏️ ویرایش", callback_data=router.pack("edit_item", cat_id, item_id)),
+         InlineKeyboardButton(f"{category['icon']} مشاهده دسته", callback_data=router.pack("view_category", cat_id))]
+    ])
     
-    elif data.startswith("view_category_"):
-        category_id = data.split("_")[-1]
-        await view_category(update, context, category_id)
+    return InlineQueryResultArticle(
+        id=inline_result_id('item', cat_id, item_id, bot.version('category', cat_id)),
+        title=f"{status} {item['text']}",
+        description=f"{category['icon']} {category['name']}",
+        input_message_content=InputTextMessageContent(
+            message_text=text,
+            parse_mode='Markdown'
+        ),
+        reply_markup=keyboard
+    )
+
+def render_inline_search_movie(movie_name):
+    """ساخت نتیجه جستجوی inline برای یک فیلم"""
+    movie_data = bot.get_movie(movie_name)
     
-    elif data.startswith("edit_menu_"):
-        category_id = data.split("_")[-1]
-        await edit_menu(update, context, category_id)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎬 نمایش فیلم", callback_data=router.pack("view_movie", movie_data['id'])),
+         InlineKeyboardButton("📋 همه فیلم‌ها", callback_data=router.pack("view_all_movies"))]
+    ])
     
-    elif data.startswith("edit_item_"):
-        parts = data.split("_")
-        category_id = parts[2]
-        item_id = parts[3]
-        await edit_item_menu(update, context, category_id, item_id)
+    return InlineQueryResultArticle(
+        id=inline_result_id('movie', movie_name, bot.version('movie', movie_name)),
+        title=f"🎬 {movie_name} ({movie_data['average']:.1f}/10)",
+        description=f"👥 {movie_data['total_ratings']} نمره",
+        input_message_content=InputTextMessageContent(
+            message_text=render_movie_details(movie_name),
+            parse_mode='Markdown'
+        ),
+        reply_markup=keyboard
+    )
+
+def render_inline_search_result(bot_username, key):
+    """نتیجه inline کش شده برای یک کلید ایندکس جستجو"""
+    kind = key[0]
+    if kind == 'category':
+        return render_cache.get(
+            ('inline_search_category', key[1]), bot.version('category', key[1]),
+            lambda: render_inline_search_category(bot_username, key[1])
+        )
+    if kind == 'item':
+        return render_cache.get(
+            ('inline_search_item', key[2]), bot.version('category', key[1]),
+            lambda: render_inline_search_item(key[1], key[2])
+        )
+    return render_cache.get(
+        ('inline_search_movie', key[1]), bot.version('movie', key[1]),
+        lambda: render_inline_search_movie(key[1])
+    )
+
+def build_inline_answer(bot_username, query, offset):
+    """نتایج یک صفحه inline و next_offset آن"""
+    end = offset + INLINE_PAGE_SIZE
+    results = []
+    has_more = False
     
-    elif data.startswith("toggle_item_"):
-        parts = data.split("_")
-        category_id = parts[2]
-        item_id = parts[3]
+    if not query:
+        # صفحه اول با فیلم‌ها شروع می‌شود و بعد از آن دسته‌ها می‌آیند
+        if offset == 0:
+            results.append(render_cache.get(('inline_movies',), bot.version('movies'), render_inline_movies))
         
-        success = bot.toggle_item(category_id, item_id, user_name)
-        if success:
-            await query.answer("✅ وضعیت تغییر کرد!")
-            await edit_item_menu(update, context, category_id, item_id)
-        else:
-            await query.answer("❌ خطا در تغییر وضعیت!")
+        cat_ids = bot.get_category_ids(max(offset - 1, 0), end)
+        has_more = len(cat_ids) > end - max(offset, 1)
+        for cat_id in cat_ids[:end - max(offset, 1)]:
+            results.append(render_cache.get(
+                ('inline_category', cat_id), bot.version('category', cat_id),
+                lambda: render_inline_category(bot_username, cat_id)
+            ))
     
-    elif data.startswith("delete_item_"):
-        parts = data.split("_")
-        category_id = parts[2]
-        item_id = parts[3]
+    else:
+        # جستجو در دسته‌بندی‌ها، آیتم‌ها و فیلم‌ها از روی ایندکس
+        keys = bot.search(query, min(end + 1, INLINE_SEARCH_LIMIT))
+        has_more = len(keys) > end
+        for key in keys[offset:end]:
+            result = render_inline_search_result(bot_username, key)
+            if result is not None:
+                results.append(result)
+    
+    return results, str(end) if has_more else ""
+
+async def inline_query(update: Update, context):
+    query = normalize(update.inline_query.query)
+    bot_username = context.bot.username
+    # offset شماره اولین نتیجه صفحه فعلی است؛ تلگرام آن را از next_offset قبلی برمی‌گرداند
+    offset = int(update.inline_query.offset) if update.inline_query.offset.isdigit() else 0
+    
+    # پاسخ تا تغییر بعدی داده‌ها (که فقط از متدهای WishlistBot انجام می‌شود) معتبر است
+    results, next_offset = inline_memo.get(
+        (query, offset), bot.data_version,
+        lambda: build_inline_answer(bot_username, query, offset)
+    )
+    
+    # نتایج به کاربر بستگی ندارند (memo هم کلید کاربر ندارد)، پس تلگرام می‌تواند یک پاسخ را به همه بدهد
+    await update.inline_query.answer(
+        results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset
+    )
         
-        success = bot.delete_item(category_id, item_id)
-        if success:
-            await query.answer("✅ آیتم حذف شد!")
-            await edit_menu(update, context, category_id)
-        else:
-            await query.answer("❌ خطا در حذف آیتم!")
-    
-    elif data.startswith("add_item_"):
-        category_id = data.split("_")[-1]
-        context.user_data['waiting_for_item'] = category_id
-        await query.edit_message_text("📝 متن آیتم جدید را بنویسید:")
-    
-    elif data == "add_category":
-        context.user_data['waiting_for_category'] = True
-        await query.edit_message_text("📝 نام دسته‌بندی جدید را بنویسید:")
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """مدیریت دکمه‌ها"""
+    query = update.callback_query
+    user_id = update.effective_user.id
     
-    elif data == "delete_category_menu":
-        await delete_category_menu(update, context)
+    # بررسی دسترسی
+    if not bot.is_user_allowed(user_id):
+        await query.answer("❌ شما مجاز به استفاده از این ربات نیستید!")
+        return
     
-    elif data.startswith("confirm_delete_category_"):
-        category_id = data.split("_")[-1]
-        success = bot.delete_category(category_id)
-        if success:
-            await query.answer("✅ دسته‌بندی حذف شد!")
-            await show_categories(update, context)
-        else:
-            await query.answer("❌ خطا در حذف دسته‌بندی!")
-
-    elif data == "movie_ratings_menu":
-        await movie_ratings_menu(update, context)
+    try:
+        # پاسخ خالی قبل از کار مسیر تا چرخش دکمه زود تمام شود؛ مسیرهای answers خودشان پاسخ می‌دهند
+        await router.dispatch(update, context, query.data, before=query.answer)
+    except UnknownRoute:
+        await query.answer("❌ دکمه ناشناخته!")
+        logger.warning("Unknown button: %s", query.data)
+    except Exception:
+        # اگر مسیر قبل از پاسخ دادن خطا بدهد؛ پاسخ تکراری را ApiRateLimiter نمی‌فرستد
+        await query.answer()
+        raise
 
-    elif data == "add_movie_rating":
-        context.user_data['waiting_for_movie_name'] = True
-        await query.edit_message_text("🎬 نام فیلم را وارد کنید:")
+async def toggle_item_button(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str, item_id: str,
+                             completed: int = None):
+    """تغییر وضعیت یک آیتم از منوی ویرایش؛ completed وضعیتی است که کاربر روی صفحه دیده"""
+    user_name = update.effective_user.first_name or "کاربر"
+    expected = bool(completed) if completed is not None else None
+    try:
+        success = bot.toggle_item(category_id, item_id, user_name, expected)
+    except StaleChange:
+        await update.callback_query.answer("⚠️ این آیتم همین الان توسط کاربر دیگری تغییر کرد!")
+        await edit_item_menu(update, context, category_id, item_id)
+        return
+    if success:
+        await update.callback_query.answer("✅ وضعیت تغییر کرد!")
+        await edit_item_menu(update, context, category_id, item_id)
+    else:
+        await update.callback_query.answer("❌ خطا در تغییر وضعیت!")
 
-    elif data == "view_all_movies":
-        await view_all_movies(update, context)
+async def delete_item_button(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str, item_id: str):
+    """حذف یک آیتم از منوی ویرایش"""
+    success = bot.delete_item(category_id, item_id)
+    if success:
+        await update.callback_query.answer("✅ آیتم حذف شد!")
+        await edit_menu(update, context, category_id)
+    else:
+        await update.callback_query.answer("❌ خطا در حذف آیتم!")
 
-    elif data.startswith("view_movie_"):
-        movie_name = data[11:]  # حذف "view_movie_"
-        await view_movie_details(update, context, movie_name)
+async def add_item_button(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str):
+    """درخواست متن آیتم جدید"""
+    context.user_data['waiting_for_item'] = category_id
+    await update.callback_query.edit_message_text("📝 متن آیتم جدید را بنویسید:")
 
-    elif data.startswith("rate_movie_"):
-        movie_name = data[11:]  # حذف "rate_movie_"
-        await rate_movie_menu(update, context, movie_name)
+async def add_category_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """درخواست نام دسته‌بندی جدید"""
+    context.user_data['waiting_for_category'] = True
+    await update.callback_query.edit_message_text("📝 نام دسته‌بندی جدید را بنویسید:")
 
-    elif data.startswith("set_rating_"):
-        parts = data.split("_")
-        movie_name = "_".join(parts[2:-1])  # نام فیلم
-        rating = int(parts[-1])  # نمره
-        
-        await ask_for_comment(update, context, movie_name, rating)
-        await query.answer(f"⭐ نمره {rating} انتخاب شد!")
-        return
+async def confirm_delete_category_button(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str):
+    """حذف دسته‌بندی بعد از انتخاب در منوی حذف"""
+    success = bot.delete_category(category_id)
+    if success:
+        await update.callback_query.answer("✅ دسته‌بندی حذف شد!")
+        await show_categories(update, context)
+    else:
+        await update.callback_query.answer("❌ خطا در حذف دسته‌بندی!")
 
-    elif data.startswith("delete_movie_"):
-        movie_name = data[13:]  # حذف "delete_movie_"
-        success = bot.delete_movie_rating(movie_name)
-        if success:
-            await query.answer("✅ فیلم حذف شد!")
-            await view_all_movies(update, context)
-        else:
-            await query.answer("❌ خطا در حذف فیلم!")
+async def add_movie_rating_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """درخواست نام فیلم جدید"""
+    context.user_data['waiting_for_movie_name'] = True
+    await update.callback_query.edit_message_text("🎬 نام فیلم را وارد کنید:")
 
-    elif data.startswith("edit_my_rating_"):
-        movie_name = data[15:]  # حذف "edit_my_rating_"
-        await rate_movie_menu(update, context, movie_name)
+async def set_rating_button(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str, rating: int):
+    """انتخاب نمره و رفتن به مرحله نظر"""
+    await update.callback_query.answer(f"⭐ نمره {rating} انتخاب شد!")
+    await ask_for_comment(update, context, movie_name, rating)
 
-    elif data == "movie_stats":
-        await movie_stats(update, context)
-        
-    elif data == "show_unrated_movies":
-        user_id = update.effective_user.id
-        movied = bot.get_movie_ratings()
-        
-        # پیدا کردن فیلم‌هایی که کاربر هنوز نمره نداده
-        unrated_movies = []
-        for movie_name, data in movied.items():
-            user_rating = bot.get_user_movie_rating(movie_name, user_id)
-            if not user_rating:
-                unrated_movies.append((movie_name, data))
-        
-        text = "🎬 **فیلم‌های نمره داده نشده:**\n\n"
-        keyboard = []
-        
-        if unrated_movies:
-            for movie, data in unrated_movies:
-                stars = "⭐" * int(data['average'])
-                text += f"• {movie}\n"
-                text += f"  📊 میانگین: {data['average']:.1f}/10 {stars}\n"
-                text += f"  👥 تعداد نمره‌ها: {data['total_ratings']}\n\n"
-                keyboard.append([
-                    InlineKeyboardButton(f"نمره دادن به {movie[:20]}{'...' if len(movie) > 20 else ''}", 
-                                       callback_data=f"rate_movie_{movie}")
-                ])
-        else:
-            text += "✅ شما به همه فیلم‌ها نمره داده‌اید!\n\n"
-            text += "برای اضافه کردن فیلم جدید از دکمه زیر استفاده کنید."
-        
-        keyboard.append([
-            InlineKeyboardButton("➕ افزودن فیلم جدید", url=f"https://t.me/{context.bot.username}?start=add_movie")
-        ])
-        keyboard.append([
-            InlineKeyboardButton("🔙 بازگشت", callback_data="movie_ratings_menu")
-        ])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    elif data.startswith("sort_movies_"):
-        sort_type = data[12:]  # name یا rating
-        movies = bot.get_movie_ratings(sort_type)
+async def delete_movie_button(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str):
+    """حذف فیلم و همه نمره‌هایش"""
+    success = bot.delete_movie_rating(movie_name)
+    if success:
+        await update.callback_query.answer("✅ فیلم حذف شد!")
         await view_all_movies(update, context)
-    
-    elif data.startswith("skip_comment_"):
-        parts = data.split("_")
-        movie_name = parts[2]
-        rating = int(parts[3])
-        
-        success = bot.add_movie_rating(movie_name, rating, "", user_name, user_id)
-        
-        if success:
-            await query.answer("✅ نظر رد شد!")
-            await view_movie_details(update, context, movie_name)
-        else:
-            await query.answer("❌ خطا در رد کردن نظر!")
-    
     else:
-        await query.answer("❌ دکمه ناشناخته!")
-        print(f"UNKNOWN BUTTON: {data}")
+        await update.callback_query.answer("❌ خطا در حذف فیلم!")
 
+async def sort_movies_button(update: Update, context: ContextTypes.DEFAULT_TYPE, sort_by: str = ""):
+    """دکمه قدیمی مرتب‌سازی؛ حالا همان لیست همه فیلم‌ها"""
+    await view_all_movies(update, context)
 
+async def skip_comment_button(update: Update, context: ContextTypes.DEFAULT_TYPE, movie_name: str, rating: int):
+    """ثبت نمره بدون نظر"""
+    user = update.effective_user
+    success = bot.add_movie_rating(movie_name, rating, "", user.first_name or "کاربر", user.id)
+    
+    if success:
+        await update.callback_query.answer("✅ نظر رد شد!")
+        await view_movie_details(update, context, movie_name)
+    else:
+        await update.callback_query.answer("❌ خطا در رد کردن نظر!")
 
 async def delete_category_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """منوی حذف دسته‌بندی"""
@@ -1172,28 +2319,56 @@ async def delete_category_menu(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.callback_query.answer("❌ هیچ دسته‌بندی‌ای برای حذف وجود ندارد!")
         await show_categories(update, context)
         return
+    await update.callback_query.answer()
     
     text = "🗑️ **حذف دسته‌بندی:**\n\n⚠️ توجه: با حذف دسته‌بندی، تمام آیتم‌های آن نیز حذف خواهند شد!\n\n"
     text += "کدام دسته‌بندی را می‌خواهید حذف کنید؟\n\n"
     
     keyboard = []
     for cat_id, category in shared_data['categories'].items():
-        item_count = len(category['items'])
+        item_count = bot.item_counts(cat_id)[1]
         keyboard.append([
             InlineKeyboardButton(
                 f"🗑️ {category['icon']} {category['name']} ({item_count} آیتم)",
-                callback_data=f"confirm_delete_category_{cat_id}"
+                callback_data=router.pack("confirm_delete_category", cat_id)
             )
         ])
     
     keyboard.append([
-        InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")
+        InlineKeyboardButton("🔙 بازگشت", callback_data=router.pack("back_to_categories"))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 
+# مسیرهای دکمه‌ها: نام مسیر، handler، نوع آرگومان‌ها و کد شکل فشرده.
+# کدها در دکمه‌های پیام‌های قبلی ذخیره شده‌اند و نباید عوض یا دوباره استفاده شوند.
+# مسیرهای answers=True خودشان به callback پاسخ می‌دهند (متن نتیجه یا خطا، و در غیر این صورت
+# پاسخ خالی قبل از کار کند)؛ به بقیه button_handler قبل از اجرا پاسخ خالی می‌دهد.
+router.register("back_to_categories", show_categories, code=1)
+router.register("view_category", view_category, str, int, code=2, answers=True)
+router.register("edit_menu", edit_menu, str, int, code=3)
+router.register("edit_item", edit_item_menu, str, str, code=4, answers=True)
+router.register("toggle_item", toggle_item_button, str, str, int, code=5, answers=True)
+router.register("delete_item", delete_item_button, str, str, code=6, answers=True)
+router.register("add_item", add_item_button, str, code=7)
+router.register("add_category", add_category_button, code=8)
+router.register("delete_category_menu", delete_category_menu, code=9, answers=True)
+router.register("confirm_delete_category", confirm_delete_category_button, str, code=10, answers=True)
+router.register("movie_ratings_menu", movie_ratings_menu, code=11)
+router.register("add_movie_rating", add_movie_rating_button, code=12)
+router.register("view_all_movies", view_all_movies, int, code=13, answers=True)
+router.register("view_movie", movie_route(view_movie_details), None, code=14, answers=True)
+router.register("rate_movie", movie_route(rate_movie_menu), None, code=15, answers=True)
+router.register("set_rating", movie_route(set_rating_button), None, int, code=16, answers=True)
+router.register("delete_movie", movie_route(delete_movie_button), None, code=17, answers=True)
+router.register("edit_my_rating", movie_route(rate_movie_menu), None, code=18, answers=True)
+router.register("movie_stats", movie_stats, code=19, answers=True)
+router.register("show_unrated_movies", show_unrated_movies, int, code=20)
+router.register("sort_movies", sort_movies_button, str, answers=True)
+router.register("skip_comment", movie_route(skip_comment_button), None, int, code=21, answers=True)
+
 @check_access
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """مدیریت پیام‌های متنی"""
@@ -1215,8 +2390,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             category = shared_data['categories'][category_id]
             
             keyboard = [[
-                InlineKeyboardButton("👁️ مشاهده دسته", callback_data=f"view_category_{category_id}"),
-                InlineKeyboardButton("📂 همه دسته‌ها", callback_data="back_to_categories")
+                InlineKeyboardButton("👁️ مشاهده دسته", callback_data=router.pack("view_category", category_id)),
+                InlineKeyboardButton("📂 همه دسته‌ها", callback_data=router.pack("back_to_categories"))
             ]]
             
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1243,8 +2418,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         del context.user_data['waiting_for_category']
         
         keyboard = [[
-            InlineKeyboardButton("👁️ مشاهده دسته", callback_data=f"view_category_{cat_id}"),
-            InlineKeyboardButton("📂 همه دسته‌ها", callback_data="back_to_categories")
+            InlineKeyboardButton("👁️ مشاهده دسته", callback_data=router.pack("view_category", cat_id)),
+            InlineKeyboardButton("📂 همه دسته‌ها", callback_data=router.pack("back_to_categories"))
         ]]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1265,8 +2440,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"⚠️ شما قبلاً برای فیلم '{movie_name}' نمره {user_rating['rating']}/10 داده‌اید!\n\n"
                 f"آیا می‌خواهید نمره خود را تغییر دهید؟",
                 reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("✅ بله", callback_data=f"rate_movie_{movie_name}"),
-                    InlineKeyboardButton("❌ خیر", callback_data="movie_ratings_menu")
+                    InlineKeyboardButton("✅ بله", callback_data=router.pack("rate_movie", bot.get_movie_id(movie_name))),
+                    InlineKeyboardButton("❌ خیر", callback_data=router.pack("movie_ratings_menu"))
                 ]])
             )
         else:
@@ -1290,8 +2465,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"⭐ نمره: {rating}/10\n"
                 f"💬 نظر: {comment if comment else 'بدون نظر'}",
                 reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎬 نمایش فیلم", callback_data=f"view_movie_{movie_name}"),
-                    InlineKeyboardButton("📋 همه فیلم‌ها", callback_data="view_all_movies")
+                    InlineKeyboardButton("🎬 نمایش فیلم", callback_data=router.pack("view_movie", bot.get_movie_id(movie_name))),
+                    InlineKeyboardButton("📋 همه فیلم‌ها", callback_data=router.pack("view_all_movies"))
                 ]])
             )
         else:
@@ -1317,6 +2492,61 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(help_text)
 
+def build_application(token=BOT_TOKEN, request=None, updater=True, concurrent_updates=CONCURRENT_UPDATES,
+                      rate_limiter=None):
+    """ساخت Application با همه handlerها
+
+    request (مثلا FakeRequest) جایگزین اتصال HTTP به تلگرام می‌شود. با updater=False
+    updateها از بیرون به update_queue داده می‌شوند (webhook جدا یا cluster.py).
+    rate_limiter پیش‌فرض ApiRateLimiter است؛ برای request ساختگی بدون محدودیت سرعت، ولی
+    پاسخ‌های تکراری به callback همچنان حذف می‌شوند.
+    """
+    builder = Application.builder().token(token)
+    if concurrent_updates > 1:
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(concurrent_updates))
+    if rate_limiter is None:
+        rate_limiter = ApiRateLimiter() if request is None else ApiRateLimiter(0, 0, 0)
+    builder = builder.rate_limiter(rate_limiter)
+    if request is not None:
+        builder = builder.request(request)
+    else:
+        # به جای 256 اتصال پیش‌فرض که در هجوم درخواست‌ها هر کدام handshake جدا می‌خواهند،
+        # چند اتصال ماندگار؛ سطل‌های ApiRateLimiter بیشتر از این هم‌زمانی لازم ندارند
+        builder = builder.connection_pool_size(HTTP_POOL_SIZE).pool_timeout(HTTP_POOL_TIMEOUT)
+    if not updater:
+        builder = builder.updater(None)
+    elif request is not None:
+        builder = builder.get_updates_request(request)
+    application = builder.build()
+    
+    # اضافه کردن handlers (همه با زمان‌سنجی metrics و قابل پروفایل)
+    def wrap(kind, name, callback):
+        return metrics.instrument(kind, name, profiler.track(f"{kind}:{name}", callback))
+    
+    def command(name, callback):
+        return CommandHandler(name, wrap("command", name, callback))
+    
+    application.add_handler(command("start", start))
+    application.add_handler(command("help", help_command))
+    application.add_handler(command("categories", show_categories))
+    application.add_handler(command("add_category", lambda update, context: context.user_data.update({'waiting_for_category': True}) or update.message.reply_text("📝 نام دسته‌بندی جدید را بنویسید:")))
+    application.add_handler(command("movies", movie_ratings_menu))
+    # handlers ادمین
+    application.add_handler(command("whitelist", admin_whitelist))
+    application.add_handler(command("add_user", admin_add_user))
+    application.add_handler(command("remove_user", admin_remove_user))
+    application.add_handler(command("import_users", admin_import_users))
+    application.add_handler(command("export_users", admin_export_users))
+    application.add_handler(command("import_data", admin_import_data))
+    application.add_handler(command("export_data", admin_export_data))
+    application.add_handler(command("profile", admin_profile))
+    application.add_handler(InlineQueryHandler(wrap("inline", "inline_query", inline_query)))
+    application.add_handler(CallbackQueryHandler(wrap("callback", "button", button_handler)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, wrap("message", "text", message_handler)))
+    bulk_files = filters.Document.FileExtension("csv") | filters.Document.FileExtension("jsonl")
+    application.add_handler(MessageHandler(bulk_files, wrap("message", "document", document_handler)))
+    return application
+
 def main():
     """شروع ربات"""
     print("🚀 ربات مدیریت ویش لیست مشترک در حال راه‌اندازی...")
@@ -1327,22 +2557,10 @@ def main():
         print("⚠️ هشدار: لطفاً آیدی ادمین را در متغیر ADMIN_ID تنظیم کنید!")
         print("💡 برای دریافت آیدی تلگرام خود، به ربات @userinfobot پیام دهید")
     
-    # ایجاد application
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # اضافه کردن handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("categories", show_categories))
-    application.add_handler(CommandHandler("add_category", lambda update, context: context.user_data.update({'waiting_for_category': True}) or update.message.reply_text("📝 نام دسته‌بندی جدید را بنویسید:")))
-    application.add_handler(CommandHandler("movies", movie_ratings_menu))
-    # handlers ادمین
-    application.add_handler(CommandHandler("whitelist", admin_whitelist))
-    application.add_handler(CommandHandler("add_user", admin_add_user))
-    application.add_handler(CommandHandler("remove_user", admin_remove_user))
-    application.add_handler(InlineQueryHandler(inline_query))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    application = build_application()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT, METRICS_HOST)
+        print(f"📈 آمار اجرا: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
     
     print("✅ ربات آماده است!")
     print("\n📋 دستورات کاربران:")
@@ -1354,6 +2572,11 @@ def main():
     print("   /whitelist - مدیریت کاربران مجاز")
     print("   /add_user [user_id] - اضافه کردن کاربر")
     print("   /remove_user [user_id] - حذف کاربر")
+    print("   /import_users [user_id ...] - اضافه کردن گروهی کاربران")
+    print("   /export_users - دریافت فایل کاربران مجاز")
+    print("   /import_data - ورود گروهی از فایل CSV/JSONL")
+    print("   /export_data [csv|jsonl] - خروجی همه داده‌ها")
+    print("   /profile on|off|dump - پروفایل handlerها")
     print("\n🤝 ویژگی‌ها:")
     print("   • سیستم وایت لیست برای کنترل دسترسی")
     print("   • ویش لیست مشترک بین کاربران مجاز")
@@ -1361,7 +2584,21 @@ def main():
     print("   • مدیریت کامل توسط ادمین")
     
     # شروع ربات
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        if WEBHOOK_URL:
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=urlparse(WEBHOOK_URL).path.lstrip('/'),
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        bot.close()
+        profiler.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,170 @@
+"""پروفایل نمونه‌برداری از handlerها و پایش گیر کردن event loop
+
+حالت پروفایل (PANIRBOT_PROFILE=1 یا دستور ادمین ‎/profile on‎) درصدی از اجراهای handlerها
+(PANIRBOT_PROFILE_RATE) را انتخاب می‌کند. تا وقتی یکی از آن‌ها در حال اجراست، یک thread
+هر PANIRBOT_PROFILE_INTERVAL_MS میلی‌ثانیه پشته thread ‏event loop را برمی‌دارد. پشته‌ها
+شمرده می‌شوند و به قالب folded (هر خط: «تابع;تابع;تابع تعداد») در PANIRBOT_PROFILE_DIR
+نوشته می‌شوند که مستقیم به flamegraph.pl یا speedscope داده می‌شود.
+
+اگر PANIRBOT_LOOP_LAG_MS تنظیم شود، یک تپش در event loop و یک thread ناظر اجرا می‌شوند.
+وقتی loop بیشتر از این مدت جواب ندهد، نام handler در حال اجرا و پشته فعلی loop در لاگ
+نوشته می‌شود.
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENABLED = os.environ.get('PANIRBOT_PROFILE', '') == '1'
+PROFILE_RATE = float(os.environ.get('PANIRBOT_PROFILE_RATE', '0.1'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PANIRBOT_PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PANIRBOT_PROFILE_DIR', 'profiles')
+# بعد از این مدت (ثانیه) پشته‌های جمع شده روی دیسک نوشته می‌شوند
+PROFILE_FLUSH_SECONDS = 60
+LOOP_LAG_MS = int(os.environ.get('PANIRBOT_LOOP_LAG_MS', '0'))
+
+
+def fold_stack(frame):
+    """پشته یک frame به شکل folded، از بیرونی‌ترین تابع به درونی‌ترین"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profiler:
+    """پروفایلر نمونه‌برداری و ناظر event loop برای handlerهای ثبت شده با track()"""
+
+    def __init__(self, enabled=PROFILE_ENABLED, rate=PROFILE_RATE, interval_ms=PROFILE_INTERVAL_MS,
+                 directory=PROFILE_DIR, lag_ms=LOOP_LAG_MS):
+        self.enabled = enabled
+        self.rate = rate
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.lag = lag_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        # تعداد اجراهای انتخاب شده‌ای که هنوز تمام نشده‌اند
+        self._sampled = 0
+        # نام handler هر task در حال اجرا، برای گزارش ناظر loop
+        self._running = {}
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat = time.monotonic()
+        self._stopping = threading.Event()
+        self._active = threading.Event()
+        self._lock = threading.Lock()
+
+    def track(self, name, handler):
+        """handler(update, context) که در پروفایل و گزارش گیر کردن loop با نام name دیده می‌شود"""
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            if self._loop is None:
+                self._attach()
+            task = asyncio.current_task()
+            previous = self._running.get(task)
+            self._running[task] = name
+            sampled = self.enabled and random.random() < self.rate
+            if sampled:
+                self._sampled += 1
+                self._active.set()
+            try:
+                return await handler(update, context)
+            finally:
+                if sampled:
+                    self._sampled -= 1
+                    if not self._sampled:
+                        self._active.clear()
+                if previous is None:
+                    self._running.pop(task, None)
+                else:
+                    self._running[task] = previous
+        return wrapper
+
+    def _attach(self):
+        """شروع threadها در اولین اجرای handler، وقتی loop و thread آن معلوم است"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        threading.Thread(target=self._sample_loop, name="profiler", daemon=True).start()
+        if self.lag:
+            self._loop.create_task(self._heartbeat())
+            threading.Thread(target=self._watch_loop, name="loop-lag-watchdog", daemon=True).start()
+
+    def _loop_frame(self):
+        return sys._current_frames().get(self._loop_thread_id)
+
+    def _sample_loop(self):
+        last_flush = time.monotonic()
+        while not self._stopping.is_set():
+            # تا وقتی اجرای انتخاب شده‌ای نیست thread منتظر می‌ماند
+            if self._active.wait(1) and self._sampled:
+                frame = self._loop_frame()
+                if frame is not None:
+                    stack = fold_stack(frame)
+                    with self._lock:
+                        self.stacks[stack] += 1
+                        self.samples += 1
+                self._stopping.wait(self.interval)
+            if self.stacks and time.monotonic() - last_flush > PROFILE_FLUSH_SECONDS:
+                self.dump()
+                last_flush = time.monotonic()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.lag / 4)
+
+    def _watch_loop(self):
+        reported_beat = None
+        while not self._stopping.wait(self.lag / 4):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.lag or beat == reported_beat:
+                continue
+            # هر بار گیر کردن فقط یک بار گزارش می‌شود
+            reported_beat = beat
+            task = asyncio.current_task(self._loop)
+            frame = self._loop_frame()
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            logger.warning(
+                "event loop has been blocked for %.0f ms in handler %s\n%s",
+                blocked * 1000, self._running.get(task, 'unknown'), stack
+            )
+
+    def dump(self):
+        """نوشتن پشته‌های جمع شده در فایل folded این پروسه؛ خروجی: مسیر فایل یا None"""
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in self.stacks.most_common()]
+        if not lines:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"panirbot-{os.getpid()}.folded")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, path)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def stop(self):
+        """توقف threadها و نوشتن پشته‌های باقی‌مانده"""
+        self._stopping.set()
+        return self.dump()
+
+
+profiler = Profiler()
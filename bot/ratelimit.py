@@ -0,0 +1,231 @@
+"""زمان‌بندی درخواست‌های خروجی Bot API با سطل توکن
+
+ApiRateLimiter به جای این که صبر کند تلگرام خطای 429 بدهد، درخواست‌هایی را که به یک چت
+فرستاده می‌شوند (پیام، ویرایش، فایل) از پیش پخش می‌کند:
+
+    سطل کلی        PANIRBOT_RATE_LIMIT_GLOBAL درخواست در ثانیه برای کل ربات (پیش‌فرض 30)
+    سطل هر چت      PANIRBOT_RATE_LIMIT_CHAT در ثانیه برای چت خصوصی (پیش‌فرض 1، با چند درخواست پشت سر هم)
+                   و PANIRBOT_RATE_LIMIT_GROUP در دقیقه برای گروه‌ها (پیش‌فرض 20)
+
+ویرایش‌هایی از یک پیام که هنوز منتظر نوبت هستند یکی می‌شوند و فقط آخرین محتوا فرستاده
+می‌شود. پاسخ دوم به یک callback query (که تلگرام رد می‌کند) فرستاده نمی‌شود. اگر با این
+حال خطای RetryAfter برسد، همان چت (یا کل ربات) تا پایان زمان خواسته شده متوقف و درخواست
+دوباره فرستاده می‌شود. مقدار 0 برای هر سطل یعنی بدون محدودیت.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.environ.get('PANIRBOT_RATE_LIMIT_GLOBAL', '30'))
+CHAT_RATE = float(os.environ.get('PANIRBOT_RATE_LIMIT_CHAT', '1'))
+GROUP_RATE = float(os.environ.get('PANIRBOT_RATE_LIMIT_GROUP', '20')) / 60
+# تعداد درخواست‌هایی که یک چت می‌تواند پشت سر هم و بدون صبر بفرستد
+CHAT_BURST = 3
+MAX_RETRIES = 2
+# حداکثر تعداد سطل‌های چت و شناسه‌های callback پاسخ داده شده که در حافظه می‌مانند
+MAX_CHAT_BUCKETS = 10000
+MAX_ANSWERED_QUERIES = 10000
+
+EDIT_ENDPOINTS = frozenset(('editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'))
+
+
+class TokenBucket:
+    """rate توکن در ثانیه تا حداکثر capacity؛ منتظرها به ترتیب رسیدن نوبت می‌گیرند"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until', '_lock')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self):
+        return self._lock.locked()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        """توقف سطل بعد از RetryAfter"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class ApiRateLimiter(BaseRateLimiter):
+    """rate limiter برای Application.builder().rate_limiter()
+
+    نرخ‌ها در هر پروسه جدا حساب می‌شوند؛ cluster.py نرخ کلی را بین کارگرها تقسیم می‌کند.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, group_rate=GROUP_RATE,
+                 max_retries=MAX_RETRIES):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(global_rate, 1)) if global_rate else None
+        self._chats = OrderedDict()
+        # ویرایش‌های منتظر نوبت: کلید پیام -> [آخرین درخواست، future نتیجه]
+        self._edits = {}
+        # شناسه callbackهایی که پاسخشان با موفقیت فرستاده شده، و پاسخ‌های در حال ارسال
+        self._answered = OrderedDict()
+        self._answering = {}
+        self.coalesced = 0
+        self.dropped = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chats.clear()
+        self._answered.clear()
+
+    def _chat_bucket(self, chat_id):
+        # شناسه منفی یا @username یعنی گروه یا کانال
+        group = not isinstance(chat_id, int) or chat_id < 0
+        rate = self.group_rate if group else self.chat_rate
+        if not rate:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(rate, CHAT_BURST)
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                # سطل‌های قدیمی که کسی منتظرشان نیست کنار گذاشته می‌شوند
+                oldest = next(iter(self._chats))
+                if not self._chats[oldest].busy:
+                    del self._chats[oldest]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _throttle(self, chat_id):
+        # فقط درخواست‌هایی که به یک چت فرستاده می‌شوند؛ پاسخ به callback و inline منتظر نمی‌مانند
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            if bucket is not None:
+                await bucket.acquire()
+            if self._global is not None:
+                await self._global.acquire()
+
+    async def _send(self, chat_id, call, throttled=False):
+        """اجرای درخواست بعد از گرفتن نوبت، با تلاش دوباره بعد از RetryAfter"""
+        attempt = 0
+        while True:
+            if not throttled:
+                await self._throttle(chat_id)
+            throttled = False
+            try:
+                return await call()
+            except RetryAfter as error:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                delay = error.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning("flood control for chat %s: waiting %.0f s (retry %d)", chat_id, delay, attempt)
+                bucket = (self._chat_bucket(chat_id) or self._global) if chat_id is not None else None
+                if bucket is not None:
+                    # درخواست‌های بعدی همین چت هم تا آن موقع صبر می‌کنند
+                    bucket.block(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def _coalesce(self, key, chat_id, call):
+        """ویرایش یک پیام؛ اگر ویرایش قبلی همان پیام هنوز منتظر است فقط محتوای جدید فرستاده می‌شود"""
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending[0] = call
+            self.coalesced += 1
+            return await asyncio.shield(pending[1])
+
+        future = asyncio.get_running_loop().create_future()
+        pending = self._edits[key] = [call, future]
+        try:
+            try:
+                await self._throttle(chat_id)
+            finally:
+                # ویرایش‌هایی که از این به بعد برسند دور بعدی را شروع می‌کنند
+                del self._edits[key]
+            result = await self._send(chat_id, pending[0], throttled=True)
+        except BaseException as error:
+            if isinstance(error, Exception):
+                future.set_exception(error)
+                # اگر منتظر دیگری نباشد خطا فقط به همین فراخواننده می‌رسد
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        future.set_result(result)
+        return result
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await self._process(functools.partial(callback, *args, **kwargs), endpoint, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.registry.observe(
+                'panirbot_api', (('endpoint', endpoint),), time.perf_counter() - started, failed
+            )
+
+    async def _answer(self, query_id, call):
+        """پاسخ به callback query؛ فقط بعد از ارسال موفق پاسخ‌های بعدی همان query حذف می‌شوند"""
+        while query_id not in self._answered:
+            pending = self._answering.get(query_id)
+            if pending is None:
+                break
+            # پاسخ دیگری در حال ارسال است؛ اگر ناموفق بماند این یکی فرستاده می‌شود
+            await asyncio.wait((pending,))
+        else:
+            self.dropped += 1
+            return True
+
+        future = self._answering[query_id] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._send(None, call)
+            self._answered[query_id] = None
+            if len(self._answered) > MAX_ANSWERED_QUERIES:
+                self._answered.popitem(last=False)
+            return result
+        finally:
+            del self._answering[query_id]
+            future.set_result(None)
+
+    async def _process(self, call, endpoint, data):
+        if endpoint == 'answerCallbackQuery':
+            # تلگرام فقط اولین پاسخ به هر callback query را می‌پذیرد
+            return await self._answer(data.get('callback_query_id'), call)
+
+        chat_id = data.get('chat_id')
+        if endpoint in EDIT_ENDPOINTS:
+            message = data.get('inline_message_id') or (chat_id, data.get('message_id'))
+            return await self._coalesce((endpoint, message), chat_id, call)
+        return await self._send(chat_id, call)
@@ -0,0 +1,226 @@
+"""مسیریابی دکمه‌های inline بر اساس جدول
+
+callback_data هر دکمه به شکل route:arg1:arg2 ساخته می‌شود. نام مسیر با یک جستجوی dict
+پیدا می‌شود و آرگومان‌ها یک بار به نوع ثبت شده (مثلا int) تبدیل می‌شوند. آرگومان‌ها از
+سمت راست جدا می‌شوند و اولین آرگومان بقیه متن را می‌گیرد، پس نام فیلم می‌تواند «:» یا
+«_» داشته باشد.
+
+مسیرهایی که کد عددی دارند و همه آرگومان‌هایشان عدد است به شکل فشرده ساخته می‌شوند:
+«~» و بعد base64 از یک بایت کد مسیر و آرگومان‌ها به صورت varint. این شکل معمولا زیر ۱۰
+بایت است و از سقف ۶۴ بایتی callback_data تلگرام رد نمی‌شود.
+
+دکمه‌های پیام‌های قدیمی که به شکل route_arg1_arg2 ساخته شده‌اند هم با پیدا کردن
+بلندترین نام مسیری که پیشوند داده است پشتیبانی می‌شوند.
+"""
+import base64
+import binascii
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ':'
+LEGACY_SEPARATOR = '_'
+COMPACT_MARKER = '~'
+# سقف طول callback_data در Bot API (بایت)
+MAX_DATA_LENGTH = 64
+
+
+class UnknownRoute(LookupError):
+    """callback_data با هیچ مسیر ثبت شده‌ای جور نیست"""
+
+
+def _encode_varint(value, out):
+    if value < 0:
+        raise ValueError(value)
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varints(payload, start):
+    values = []
+    value = shift = 0
+    for byte in payload[start:]:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("truncated varint")
+    return values
+
+
+def _as_int(arg):
+    """عدد صحیح نامنفی یا None"""
+    if isinstance(arg, int) and not isinstance(arg, bool) and arg >= 0:
+        return arg
+    if isinstance(arg, str) and arg.isascii() and arg.isdigit() and (arg == '0' or arg[0] != '0'):
+        return int(arg)
+    return None
+
+
+class Route:
+    __slots__ = ('name', 'handler', 'arg_types', 'code', 'answers')
+
+    def __init__(self, name, handler, arg_types, code=None, answers=False):
+        self.name = name
+        self.handler = handler
+        self.arg_types = arg_types
+        self.code = code
+        self.answers = answers
+
+    def convert(self, raw_args):
+        """تبدیل آرگومان‌ها به نوع ثبت شده؛ آرگومان‌های نیامده مقدار پیش‌فرض handler را می‌گیرند
+
+        نوع None یعنی بدون تبدیل: عدد در شکل فشرده و متن در شکل‌های دیگر.
+        """
+        return [raw if arg_type is None else arg_type(raw) for arg_type, raw in zip(self.arg_types, raw_args)]
+
+
+class RouteStats:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class CallbackRouter:
+    """جدول مسیرهای callback و اجرای handler هر مسیر با زمان‌سنجی"""
+
+    def __init__(self):
+        self._routes = {}
+        self._codes = {}
+        # طول‌های متمایز نام مسیرها، از بلند به کوتاه، برای پیدا کردن مسیر دکمه‌های قدیمی
+        self._name_lengths = []
+        self._hooks = []
+        self.stats = {}
+
+    def register(self, name, handler, *arg_types, code=None, answers=False):
+        """ثبت handler(update, context, *args) برای مسیر name؛ arg_types تابع تبدیل هر آرگومان یا None
+
+        code (۰ تا ۲۵۵) شکل فشرده دکمه‌ها را فعال می‌کند و نباید بعدا عوض شود،
+        چون دکمه‌های پیام‌های قبلی با همین کد ساخته شده‌اند.
+        answers یعنی handler خودش با متن دلخواه به callback پاسخ می‌دهد و dispatch
+        قبل از اجرای آن پاسخی نمی‌فرستد.
+        """
+        if SEPARATOR in name:
+            raise ValueError(f"route name cannot contain {SEPARATOR!r}: {name}")
+        route = Route(name, handler, arg_types, code, answers)
+        if code is not None:
+            if not 0 <= code <= 0xff or self._codes.get(code, route).name != name:
+                raise ValueError(f"invalid or duplicate route code {code} for {name}")
+            self._codes[code] = route
+        self._routes[name] = route
+        self._name_lengths = sorted({len(route) for route in self._routes}, reverse=True)
+        self.stats[name] = RouteStats()
+        return handler
+
+    def route(self, name, *arg_types):
+        """نسخه decorator از register"""
+        def decorator(handler):
+            return self.register(name, handler, *arg_types)
+        return decorator
+
+    def add_hook(self, hook):
+        """hook(route_name, elapsed_seconds, failed) بعد از اجرای هر مسیر صدا زده می‌شود"""
+        self._hooks.append(hook)
+
+    def pack(self, name, *args):
+        """ساخت callback_data برای مسیر name (فشرده اگر ممکن باشد)
+
+        اگر نتیجه از MAX_DATA_LENGTH بایت بلندتر شود ValueError؛ تلگرام کل پیام را رد می‌کرد.
+        """
+        route = self._routes[name]
+        if route.code is not None:
+            numbers = [_as_int(arg) for arg in args]
+            if None not in numbers:
+                payload = bytearray((route.code,))
+                for number in numbers:
+                    _encode_varint(number, payload)
+                data = COMPACT_MARKER + base64.urlsafe_b64encode(payload).decode().rstrip('=')
+                return self._checked(data)
+        return self._checked(SEPARATOR.join((name, *(str(arg) for arg in args))))
+
+    @staticmethod
+    def _checked(data):
+        if len(data.encode()) > MAX_DATA_LENGTH:
+            raise ValueError(f"callback data longer than {MAX_DATA_LENGTH} bytes: {data!r}")
+        return data
+
+    def _parse_compact(self, data):
+        encoded = data[len(COMPACT_MARKER):]
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        except (binascii.Error, ValueError) as error:
+            raise UnknownRoute(data) from error
+        route = self._codes.get(payload[0]) if payload else None
+        if route is None:
+            raise UnknownRoute(data)
+        # در شکل فشرده آرگومان‌ها عدد هستند و به نوع ثبت شده تبدیل می‌شوند
+        return route, route.convert(_decode_varints(payload, 1))
+
+    def parse(self, data):
+        """(Route، آرگومان‌های تبدیل شده) برای یک callback_data"""
+        if data.startswith(COMPACT_MARKER):
+            return self._parse_compact(data)
+        name, separator, rest = data.partition(SEPARATOR)
+        route = self._routes.get(name)
+        if separator and route is not None:
+            raw_args = rest.rsplit(SEPARATOR, len(route.arg_types) - 1) if route.arg_types else []
+            return route, route.convert(raw_args)
+        return self._parse_legacy(data)
+
+    def _parse_legacy(self, data):
+        for length in self._name_lengths:
+            route = self._routes.get(data[:length])
+            if route is None:
+                continue
+            rest = data[length:]
+            if not rest:
+                return route, []
+            if rest[0] != LEGACY_SEPARATOR or not route.arg_types:
+                continue
+            raw_args = rest[1:].rsplit(LEGACY_SEPARATOR, len(route.arg_types) - 1)
+            return route, route.convert(raw_args)
+        raise UnknownRoute(data)
+
+    async def dispatch(self, update, context, data, before=None):
+        """اجرای handler مسیر متناظر با data؛ در صورت نبود مسیر UnknownRoute
+
+        before (مثلا پاسخ خالی به callback) برای مسیرهایی که answers ندارند قبل از handler اجرا می‌شود.
+        """
+        try:
+            route, args = self.parse(data)
+        except ValueError as error:
+            raise UnknownRoute(data) from error
+        if before is not None and not route.answers:
+            await before()
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await route.handler(update, context, *args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats[route.name].add(elapsed)
+            logger.debug("callback %s %r took %.1f ms", route.name, args, elapsed * 1000)
+            for hook in self._hooks:
+                hook(route.name, elapsed, failed)
@@ -0,0 +1,125 @@
+"""ایندکس جستجوی n-gram برای دسته‌ها، آیتم‌ها و فیلم‌ها
+
+متن‌ها قبل از ایندکس شدن یکسان‌سازی می‌شوند (ی/ي، ک/ك، نیم‌فاصله، اعراب و ارقام)
+تا جستجو با کیبوردهای فارسی و عربی نتیجه یکسان بدهد. برای هر متن n-gramهای ۱ تا ۳
+حرفی نگه داشته می‌شود و هر جستجو فقط نامزدهای مشترک n-gramهای عبارت را بررسی می‌کند.
+"""
+import heapq
+import itertools
+import re
+
+NGRAM_SIZE = 3
+
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    '\u200c': '',  # نیم‌فاصله
+    '\u200f': '',
+    '\u200e': '',
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670\u0640]')  # اعراب و کشیده
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    """یکسان‌سازی متن فارسی برای جستجو"""
+    text = _DIACRITICS.sub('', text.translate(_CHAR_MAP))
+    return _SPACES.sub(' ', text).strip().lower()
+
+
+def _ngrams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SearchIndex:
+    """ایندکس معکوس n-gram با درج و حذف تکی
+
+    کلید هر سند یک tuple است که نوعش در اولین عضو آمده، مثلا ('item', cat_id, item_id).
+    postingها برای هر نوع جدا نگه داشته می‌شوند تا دسته‌ها و فیلم‌ها (که تعدادشان کم است)
+    همیشه کامل امتیازدهی شوند و برای آیتم‌ها فقط حداکثر SCORE_BUDGET نامزد بررسی شود.
+    """
+
+    # اولویت نوع نتیجه وقتی امتیاز تطابق برابر است
+    KIND_ORDER = {'category': 0, 'movie': 1, 'item': 2}
+    SCORE_BUDGET = 2000
+
+    def __init__(self):
+        self._texts = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _grams(self, text):
+        grams = set()
+        for size in range(1, NGRAM_SIZE + 1):
+            grams |= _ngrams(text, size)
+        return grams
+
+    def add(self, key, text):
+        """اضافه کردن یا جایگزینی متن یک سند"""
+        self.remove(key)
+        text = normalize(text)
+        self._texts[key] = text
+        postings = self._postings.setdefault(key[0], {})
+        for gram in self._grams(text):
+            postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        text = self._texts.pop(key, None)
+        if text is None:
+            return
+        postings = self._postings[key[0]]
+        for gram in self._grams(text):
+            keys = postings[gram]
+            keys.discard(key)
+            if not keys:
+                del postings[gram]
+
+    def _candidates(self, postings, grams):
+        """اسنادی که همه n-gramهای عبارت را دارند"""
+        sets = []
+        for gram in grams:
+            keys = postings.get(gram)
+            if not keys:
+                return set()
+            sets.append(keys)
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def search(self, query, limit=20):
+        """کلید اسناد منطبق، مرتب بر اساس کیفیت تطابق"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        grams = _ngrams(query, min(NGRAM_SIZE, len(query)))
+        ranked = []
+        for kind, postings in self._postings.items():
+            candidates = self._candidates(postings, grams)
+            if kind == 'item' and len(candidates) > self.SCORE_BUDGET:
+                # عبارت‌های خیلی کوتاه: فقط بخشی از آیتم‌ها امتیاز می‌گیرند
+                candidates = itertools.islice(candidates, self.SCORE_BUDGET)
+            kind_order = self.KIND_ORDER.get(kind, 9)
+            for key in candidates:
+                text = self._texts[key]
+                position = text.find(query)
+                if position < 0:
+                    continue
+                if text == query:
+                    score = 0
+                elif position == 0:
+                    score = 1
+                elif text[position - 1] == ' ':
+                    score = 2
+                else:
+                    score = 3
+                ranked.append((score, kind_order, len(text), text, key))
+        return [entry[4] for entry in heapq.nsmallest(limit, ranked, key=lambda entry: entry[:4])]
@@ -0,0 +1,196 @@
+"""قالب باینری snapshot داده‌ها با خواندن از طریق mmap
+
+ساختار فایل:
+
+    MAGIC
+    رکورد ۱، رکورد ۲، ...        هر رکورد: طول (uint32) + JSON فشرده UTF-8
+    رکورد ایندکس                 شمارنده‌ها، جای (offset) رکورد هر دسته و هر فیلم و خلاصه آن
+    offset رکورد ایندکس (uint64) + MAGIC
+
+هر دسته (با آیتم‌هایش) و هر فیلم (با نمره‌هایش) یک رکورد است. آیتم‌ها و نمره‌ها به
+صورت لیست مقادیر به ترتیب فیلدهای models ذخیره می‌شوند، بدون تکرار نام کلیدها. چون
+فایل با mmap باز می‌شود، یک دسته یا فیلم را می‌شود بدون خواندن بقیه فایل خواند.
+
+ایندکس کنار هر رکورد فیلدهای آن (بدون لیست) و خلاصه‌ای برای ایندکس‌های ربات دارد: تعداد
+آیتم‌های انجام شده و کل هر دسته، و نمره‌دهنده‌ها، نمره‌ها و آخرین تاریخ هر فیلم. با
+Snapshot.load_lazy ربات هنگام شروع فقط ایندکس را می‌خواند و آیتم‌ها یا نمره‌های هر دسته و
+فیلم با اولین دسترسی (LazyRecord) خوانده می‌شوند. snapshot قدیمی بدون خلاصه کامل خوانده می‌شود.
+"""
+import json
+import mmap
+import struct
+from functools import partial
+
+from models import Item, LazyRecord, Rating, to_json
+
+MAGIC = b'PNRSNAP\x01'
+_LENGTH = struct.Struct('<I')
+_FOOTER = struct.Struct('<Q')
+FOOTER_SIZE = _FOOTER.size + len(MAGIC)
+
+
+class SnapshotError(ValueError):
+    """فایل snapshot خراب یا از قالب دیگری است"""
+
+
+def _encode(value):
+    payload = json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=to_json).encode()
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def _item_row(item):
+    return item.to_row() if isinstance(item, Item) else Item(item).to_row()
+
+
+def _rating_row(rating):
+    return rating.to_row() if isinstance(rating, Rating) else Rating(rating).to_row()
+
+
+def _records(record, key):
+    # رکوردی که هنوز از snapshot قبلی خوانده نشده، برای نوشتن در حافظه نگه داشته نمی‌شود
+    return record.peek() if isinstance(record, LazyRecord) else record[key]
+
+
+def _fields(record, key):
+    # dict.items فیلدهای LazyRecord را بدون خواندن لیست آن می‌دهد
+    return {field: value for field, value in dict.items(record) if field != key}
+
+
+def encode_snapshot(data):
+    """محتوای فایل snapshot برای داده‌ها (همان ساختار wishlist_data.json)"""
+    chunks = [MAGIC]
+    offset = len(MAGIC)
+    categories = []
+    movies = []
+    for cat_id, category in data['categories'].items():
+        items = _records(category, 'items')
+        fields = _fields(category, 'items')
+        chunk = _encode(dict(fields, items=[_item_row(item) for item in items]))
+        stats = {'completed': sum(1 for item in items if item['completed']), 'total': len(items)}
+        categories.append([cat_id, offset, fields, stats])
+        chunks.append(chunk)
+        offset += len(chunk)
+    for movie_name, movie in data.get('movie_ratings', {}).items():
+        ratings = _records(movie, 'ratings')
+        fields = _fields(movie, 'ratings')
+        chunk = _encode(dict(fields, ratings=[_rating_row(rating) for rating in ratings]))
+        stats = {
+            'raters': [rating['user_id'] for rating in ratings],
+            'scores': [rating['rating'] for rating in ratings],
+            'last': max((rating['date'] for rating in ratings), default=None),
+        }
+        movies.append([movie_name, offset, fields, stats])
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    meta = {key: value for key, value in data.items() if key not in ('categories', 'movie_ratings')}
+    index = {'keys': list(data), 'meta': meta, 'categories': categories, 'movies': movies}
+    chunks.append(_encode(index))
+    chunks.append(_FOOTER.pack(offset) + MAGIC)
+    return b''.join(chunks)
+
+
+class Snapshot:
+    """خواندن یک فایل snapshot؛ رکوردها فقط هنگام درخواست از mmap خوانده و تبدیل می‌شوند"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as error:
+                raise SnapshotError(f"{path}: empty file") from error
+        try:
+            self._read_index()
+        except Exception:
+            self._map.close()
+            raise
+
+    def _read_index(self):
+        size = len(self._map)
+        if size < len(MAGIC) + FOOTER_SIZE or self._map[:len(MAGIC)] != MAGIC or self._map[-len(MAGIC):] != MAGIC:
+            raise SnapshotError(f"{self.path}: not a panirbot snapshot (or truncated)")
+        index_offset, = _FOOTER.unpack_from(self._map, size - FOOTER_SIZE)
+        index = self._record(index_offset)
+        self._keys = index['keys']
+        self.meta = index['meta']
+        self._category_entries = index['categories']
+        self._movie_entries = index['movies']
+        self._categories = {entry[0]: entry[1] for entry in self._category_entries}
+        self._movies = {entry[0]: entry[1] for entry in self._movie_entries}
+        # snapshotهای قبل از load_lazy فقط جای رکوردها را دارند
+        self.summarized = all(len(entry) == 4 for entry in self._category_entries + self._movie_entries)
+
+    def _record(self, offset):
+        try:
+            length, = _LENGTH.unpack_from(self._map, offset)
+            start = offset + _LENGTH.size
+            if start + length > len(self._map) - FOOTER_SIZE:
+                raise SnapshotError(f"{self.path}: record at {offset} overflows the file")
+            return json.loads(self._map[start:start + length])
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise SnapshotError(f"{self.path}: bad record at {offset}: {error}") from error
+
+    def category_ids(self):
+        return list(self._categories)
+
+    def movie_names(self):
+        return list(self._movies)
+
+    def read_category(self, cat_id):
+        """یک دسته با آیتم‌هایش (Item) یا None"""
+        offset = self._categories.get(cat_id)
+        if offset is None:
+            return None
+        category = self._record(offset)
+        category['items'] = [Item.from_row(row) for row in category['items']]
+        return category
+
+    def read_movie(self, movie_name):
+        """یک فیلم با نمره‌هایش (Rating) یا None"""
+        offset = self._movies.get(movie_name)
+        if offset is None:
+            return None
+        movie = self._record(offset)
+        movie['ratings'] = [Rating.from_row(row) for row in movie['ratings']]
+        return movie
+
+    def load(self):
+        """کل داده‌ها به همان ساختار wishlist_data.json"""
+        categories = {cat_id: self.read_category(cat_id) for cat_id in self._categories}
+        movies = {movie_name: self.read_movie(movie_name) for movie_name in self._movies}
+        return self._assemble(categories, movies)
+
+    def load_lazy(self, lock):
+        """مثل load ولی هر دسته و فیلم یک LazyRecord است که لیستش را با اولین دسترسی از فایل می‌خواند
+
+        فایل باید تا وقتی رکوردها استفاده می‌شوند باز بماند و خرابی یک رکورد هنگام خواندن همان
+        رکورد (SnapshotError) دیده می‌شود. snapshot بدون خلاصه‌ها مثل load کامل خوانده می‌شود.
+        """
+        if not self.summarized:
+            return self.load()
+        categories = {
+            cat_id: LazyRecord(fields, 'items', stats, partial(self.read_category, cat_id), lock)
+            for cat_id, _, fields, stats in self._category_entries
+        }
+        movies = {
+            movie_name: LazyRecord(fields, 'ratings', stats, partial(self.read_movie, movie_name), lock)
+            for movie_name, _, fields, stats in self._movie_entries
+        }
+        return self._assemble(categories, movies)
+
+    def _assemble(self, categories, movies):
+        sections = {'categories': categories, 'movie_ratings': movies}
+        # ترتیب کلیدها مثل فایل JSON اصلی می‌ماند
+        data = {key: sections[key] if key in sections else self.meta[key] for key in self._keys}
+        data.setdefault('categories', categories)
+        return data
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
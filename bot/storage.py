@@ -0,0 +1,1105 @@
+"""لایه ذخیره‌سازی داده‌های مشترک ربات
+
+هر تغییر روی داده‌ها به صورت یک رکورد کوچک (dict با کلید op) به backend داده می‌شود.
+backend تصمیم می‌گیرد که کل فایل را بازنویسی کند، رکورد را به ژورنال اضافه کند
+یا فقط سطرهای مربوط را در SQLite بنویسد.
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from models import LazyRecord, to_json
+from snapshot import Snapshot, encode_snapshot
+
+logger = logging.getLogger(__name__)
+
+# بعد از این تعداد رکورد، ژورنال در پس‌زمینه با یک snapshot فشرده می‌شود
+JOURNAL_COMPACT_EVERY = int(os.environ.get('PANIRBOT_JOURNAL_COMPACT_EVERY', '1000'))
+
+# تغییرات پشت سر هم حداکثر این مدت (میلی‌ثانیه) یا تا این تعداد جمع می‌شوند و یک‌جا نوشته می‌شوند
+# مقدار 0 یعنی ذخیره همزمان مثل قبل
+SAVE_DELAY_MS = int(os.environ.get('PANIRBOT_SAVE_DELAY_MS', '200'))
+SAVE_MAX_CHANGES = int(os.environ.get('PANIRBOT_SAVE_MAX_CHANGES', '100'))
+# نوشتن ناموفق حداکثر این تعداد بار تکرار می‌شود؛ فاصله تلاش‌ها از SAVE_RETRY_DELAY (ثانیه) هر بار دو برابر می‌شود
+SAVE_MAX_RETRIES = int(os.environ.get('PANIRBOT_SAVE_MAX_RETRIES', '5'))
+SAVE_RETRY_DELAY = 0.5
+SAVE_RETRY_MAX_DELAY = 30
+# هر کارگر cluster بعد از این تعداد تراکنش، رکوردهایی از لاگ تغییرات را که همه کارگرها خوانده‌اند پاک می‌کند
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+
+class DataLoadError(RuntimeError):
+    """داده‌های ذخیره شده خوانده نشدند؛ ربات نباید با داده‌های خالی شروع کند و آن‌ها را بازنویسی کند"""
+
+
+class DataSaveError(RuntimeError):
+    """تغییرات ثبت شده روی دیسک نوشته نشدند و فقط در حافظه هستند"""
+
+
+def write_atomic(path, content):
+    """نوشتن فایل (متن یا bytes) به صورت اتمیک (فایل موقت + rename)"""
+    tmp_path = f"{path}.tmp"
+    if isinstance(content, bytes):
+        f = open(tmp_path, 'wb')
+    else:
+        f = open(tmp_path, 'w', encoding='utf-8')
+    with f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _copy_record(record, key):
+    if isinstance(record, LazyRecord):
+        return record.copy()
+    return dict(record, **{key: list(record[key])})
+
+
+def copy_data(data):
+    """کپی سطحی داده‌ها برای نوشتن بیرون از قفل
+
+    فقط dictها و لیست‌ها کپی می‌شوند (به اندازه تعداد دسته‌ها و فیلم‌ها، نه آیتم‌ها)؛ رکوردهای
+    آیتم و نمره مشترک می‌مانند چون WishlistBot آن‌ها را در جا تغییر نمی‌دهد. دسته‌ها و فیلم‌هایی
+    که هنوز از snapshot خوانده نشده‌اند (LazyRecord) با کپی هم خوانده نمی‌شوند.
+    """
+    copy = dict(data)
+    copy['categories'] = {cat_id: _copy_record(category, 'items') for cat_id, category in data['categories'].items()}
+    if 'movie_ratings' in data:
+        copy['movie_ratings'] = {
+            movie_name: _copy_record(movie, 'ratings') for movie_name, movie in data['movie_ratings'].items()
+        }
+    if 'allowed_users' in data:
+        copy['allowed_users'] = set(data['allowed_users'])
+    return copy
+
+
+def dump_data(data):
+    """تبدیل داده‌ها به متن JSON با همان قالب فایل اصلی"""
+    return json.dumps(data, ensure_ascii=False, indent=2, default=to_json)
+
+
+class JsonStorage:
+    """ذخیره کل داده‌ها در یک فایل JSON - با هر تغییر کل فایل بازنویسی می‌شود"""
+
+    def load(self):
+        """بارگذاری داده‌ها؛ خروجی (داده یا None، تغییرات معوق)"""
+        if not os.path.exists(self.path):
+            return None, []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f), []
+
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+
+    def append(self, change, data):
+        """ثبت یک تغییر - در این حالت یعنی بازنویسی کل فایل"""
+        self.save(data)
+
+    def append_batch(self, changes, data):
+        """ثبت یک دسته تغییر با یک بار نوشتن کل فایل"""
+        self.save(data)
+
+    def save(self, data):
+        """ذخیره کامل داده‌ها؛ زیر lock فقط کپی سطحی گرفته می‌شود و تبدیل به JSON بیرون از آن است"""
+        with self.lock:
+            data = copy_data(data)
+        write_atomic(self.path, dump_data(data))
+
+    def close(self):
+        pass
+
+
+def _item_index(items, item_id):
+    """جای آیتم با این شناسه در لیست آیتم‌های یک دسته یا None"""
+    # آیتم‌ها به ترتیب شناسه هستند؛ داده‌های قدیمی شاید نباشند
+    index = bisect.bisect_left(items, int(item_id), key=lambda item: int(item['id']))
+    if index < len(items) and items[index]['id'] == item_id:
+        return index
+    return next((i for i, item in enumerate(items) if item['id'] == item_id), None)
+
+
+def replay_change(data, change):
+    """اعمال یک رکورد ژورنال روی داده‌های خوانده شده از فایل (بدون ایندکس‌های ربات)
+
+    همان نتیجه WishlistBot.apply_change را روی یک کپی جدا می‌سازد و مثل آن تکرارپذیر است.
+    """
+    op = change['op']
+    categories = data['categories']
+    if op == 'add_category':
+        cat_id = change['category_id']
+        if cat_id not in categories:
+            categories[cat_id] = {'name': change['name'], 'icon': change['icon'], 'items': []}
+            data['next_category_id'] = max(data['next_category_id'], int(cat_id) + 1)
+    elif op == 'delete_category':
+        categories.pop(change['category_id'], None)
+    elif op in ('add_item', 'toggle_item', 'delete_item'):
+        category = categories.get(change['category_id'])
+        if category is None:
+            return
+        items = category['items']
+        if op == 'add_item':
+            item = change['item']
+            if _item_index(items, item['id']) is None:
+                bisect.insort(items, dict(item), key=lambda it: int(it['id']))
+                data['next_item_id'] = max(data['next_item_id'], int(item['id']) + 1)
+            return
+        index = _item_index(items, change['item_id'])
+        if index is None:
+            return
+        if op == 'delete_item':
+            del items[index]
+        else:
+            item = items[index]
+            item['completed'] = change['completed']
+            item['last_modified_by'] = change['user_name']
+            item['last_modified_at'] = change['at']
+    elif op == 'add_movie_rating':
+        movies = data.setdefault('movie_ratings', {})
+        movie = movies.get(change['movie_name'])
+        if movie is None:
+            movie_id = change.get('movie_id') or data.get('next_movie_id', 1)
+            movie = movies[change['movie_name']] = {'id': movie_id, 'ratings': [], 'average': 0.0, 'total_ratings': 0}
+            data['next_movie_id'] = max(data.get('next_movie_id', 1), movie_id + 1)
+        elif change.get('movie_id') and change['movie_id'] < movie.get('id', change['movie_id']):
+            movie['id'] = change['movie_id']
+        ratings = movie['ratings']
+        rating = dict(change['rating'])
+        for index, previous in enumerate(ratings):
+            if previous['user_id'] == rating['user_id']:
+                ratings[index] = rating
+                break
+        else:
+            ratings.append(rating)
+        movie['total_ratings'] = len(ratings)
+        movie['average'] = sum(r['rating'] for r in ratings) / len(ratings)
+    elif op == 'delete_movie_rating':
+        data.get('movie_ratings', {}).pop(change['movie_name'], None)
+    elif op == 'allow_users':
+        data['allowed_users'] = set(data.get('allowed_users', ())) | set(change['user_ids'])
+    elif op == 'disallow_users':
+        data['allowed_users'] = set(data.get('allowed_users', ())) - set(change['user_ids'])
+    else:
+        raise ValueError(f"تغییر ناشناخته: {op}")
+
+
+class JournalStorage:
+    """ذخیره به صورت snapshot + ژورنال فقط-افزودنی (JSONL)
+
+    هر تغییر یک خط کوچک به ژورنال اضافه می‌کند، پس هزینه هر تغییر به حجم داده‌ها
+    وابسته نیست. هنگام بارگذاری، رکوردهای ژورنال روی snapshot اعمال می‌شوند و
+    هر JOURNAL_COMPACT_EVERY رکورد یک بار ژورنال کنار گذاشته می‌شود و یک thread جدا
+    snapshot جدید را از روی فایل‌ها (snapshot قبلی + همان ژورنال) می‌سازد، نه از داده‌های
+    ربات، پس تغییرات در این مدت منتظر قفل داده‌ها نمی‌مانند.
+    شماره ترتیبی (seq) هر رکورد باعث می‌شود اعمال دوباره یک رکورد ممکن نباشد.
+    """
+
+    def __init__(self, path, lock, compact_every=JOURNAL_COMPACT_EVERY):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.old_journal_path = f"{path}.journal.old"
+        self.lock = lock
+        self.compact_every = compact_every
+        self.seq = 0
+        self.records_since_compact = 0
+        self._file = None
+        self._compact_thread = None
+        # در هر لحظه فقط یک فشرده‌سازی (پس‌زمینه یا save)؛ تا پایان آن ژورنال دوباره کنار گذاشته
+        # نمی‌شود، پس فایل old فقط رکوردهایی را دارد که snapshot در حال نوشتن شامل می‌شود
+        self._compacting = threading.Lock()
+
+    def load(self):
+        """بارگذاری snapshot و رکوردهایی از ژورنال که هنوز در آن نیستند"""
+        data = self._read_snapshot(lazy=True)
+        snapshot_seq = data.get('journal_seq', 0) if data else 0
+        self.seq = snapshot_seq
+        changes = []
+        for path in (self.old_journal_path, self.journal_path):
+            for record in self._read_journal(path, repair=True):
+                if record['seq'] > self.seq:
+                    changes.append(record)
+                    self.seq = record['seq']
+        self.records_since_compact = len(changes)
+        return data, changes
+
+    def _read_snapshot(self, lazy=False):
+        """داده‌های snapshot یا None؛ lazy (فقط در SnapshotStorage) برای داده‌هایی که ربات نگه می‌دارد"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _encode_snapshot(self, data):
+        return dump_data(data)
+
+    def _read_journal(self, path, repair=False):
+        """خواندن رکوردهای یک فایل ژورنال
+
+        فقط خط آخر می‌تواند ناقص باشد (کرش وسط نوشتن) و نادیده گرفته می‌شود؛ با repair از فایل
+        هم بریده می‌شود تا رکوردهای بعدی به دنبال آن نوشته نشوند. خط خراب وسط فایل یعنی فایل
+        خراب است و DataLoadError می‌دهد.
+        """
+        if not os.path.exists(path):
+            return []
+        records = []
+        bad_line = None
+        valid_size = 0
+        line = b''
+        with open(path, 'rb') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                if bad_line is not None:
+                    raise DataLoadError(f"رکورد خراب در {path} خط {bad_line} (وسط ژورنال، نه خط آخر)")
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    bad_line = line_no
+                    continue
+                valid_size = f.tell()
+        if bad_line is not None:
+            logger.warning("رکورد ناقص آخر %s (خط %d) نادیده گرفته شد", path, bad_line)
+            if repair:
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_size)
+        elif repair and line and not line.endswith(b'\n'):
+            # رکورد آخر کامل است ولی پایان خطش نوشته نشده
+            with open(path, 'ab') as f:
+                f.write(b'\n')
+        return records
+
+    def _journal(self):
+        if self._file is None:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, change, data):
+        """اضافه کردن یک رکورد به ژورنال"""
+        self.append_batch([change], data)
+
+    def append_batch(self, changes, data):
+        """اضافه کردن چند رکورد به ژورنال با یک flush"""
+        with self.lock:
+            lines = []
+            for change in changes:
+                self.seq += 1
+                record = dict(change, seq=self.seq)
+                lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=to_json) + '\n')
+            f = self._journal()
+            f.write(''.join(lines))
+            f.flush()
+
+            self.records_since_compact += len(changes)
+            if self.records_since_compact >= self.compact_every:
+                self.compact_in_background()
+
+    def save(self, data):
+        """نوشتن فوری snapshot کامل از داده‌های حافظه و خالی کردن ژورنال"""
+        self._compact(data)
+
+    def compact_in_background(self):
+        """کنار گذاشتن ژورنال فعلی و ساخت snapshot از روی فایل‌ها در یک thread جدا (اگر در حال اجرا نباشد)"""
+        with self.lock:
+            if not self._compacting.acquire(blocking=False):
+                return
+            try:
+                self._rotate_journal()
+                self.records_since_compact = 0
+                self._compact_thread = threading.Thread(
+                    target=self._compact_files, args=(self.seq,), name="journal-compact", daemon=True
+                )
+                self._compact_thread.start()
+            except BaseException:
+                self._compacting.release()
+                raise
+
+    def _compact_files(self, seq):
+        """snapshot قبلی + رکوردهای ژورنال old تا seq، روی یک کپی خصوصی و بدون قفل داده‌ها"""
+        try:
+            data = self._read_snapshot()
+            if data is None:
+                logger.warning("snapshot پایه نیست؛ فشرده‌سازی ژورنال انجام نشد")
+                return
+            snapshot_seq = data.get('journal_seq', 0)
+            for record in self._read_journal(self.old_journal_path):
+                if snapshot_seq < record['seq'] <= seq:
+                    replay_change(data, record)
+            data['journal_seq'] = seq
+            write_atomic(self.path, self._encode_snapshot(data))
+            os.remove(self.old_journal_path)
+        except Exception:
+            logger.exception("خطا در فشرده‌سازی ژورنال؛ ژورنال قدیمی نگه داشته شد")
+        finally:
+            self._compacting.release()
+
+    def _compact(self, data):
+        """نوشتن snapshot جدید از داده‌های حافظه و کنار گذاشتن رکوردهای اعمال شده"""
+        # منتظر فشرده‌سازی پس‌زمینه؛ آن thread قفل داده‌ها را نمی‌گیرد، پس اینجا می‌شود قفل را داشت
+        with self._compacting:
+            with self.lock:
+                data = copy_data(data)
+                data['journal_seq'] = self.seq
+                self._rotate_journal()
+                self.records_since_compact = 0
+
+            # تبدیل و نوشتن روی دیسک بیرون از lock انجام می‌شود تا تغییرات جدید معطل نمانند
+            try:
+                write_atomic(self.path, self._encode_snapshot(data))
+            except OSError:
+                logger.exception("خطا در نوشتن snapshot؛ ژورنال قدیمی نگه داشته شد")
+                return
+            if os.path.exists(self.old_journal_path):
+                os.remove(self.old_journal_path)
+
+    def _rotate_journal(self):
+        """انتقال ژورنال فعلی به فایل old تا snapshot جدید نوشته شود"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not os.path.exists(self.journal_path):
+            return
+        if os.path.exists(self.old_journal_path):
+            # فشرده‌سازی قبلی ناموفق بوده؛ رکوردها به همان فایل old اضافه می‌شوند
+            with open(self.journal_path, 'r', encoding='utf-8') as src, \
+                    open(self.old_journal_path, 'a', encoding='utf-8') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.old_journal_path)
+
+    def close(self):
+        """بستن ژورنال و منتظر ماندن برای پایان فشرده‌سازی"""
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SnapshotStorage(JournalStorage):
+    """مثل JournalStorage ولی snapshot در قالب باینری snapshot.py نوشته و با mmap خوانده می‌شود
+
+    اگر هنوز snapshot یا ژورنالی نباشد، داده‌ها یک بار از فایل JSON قبلی (json_path) خوانده می‌شوند.
+    """
+
+    def __init__(self, path, lock, json_path=None, compact_every=JOURNAL_COMPACT_EVERY):
+        super().__init__(path, lock, compact_every)
+        self.json_path = json_path
+        # snapshotی که دسته‌ها و فیلم‌های خوانده نشده داده‌های ربات از آن خوانده می‌شوند؛ فشرده‌سازی
+        # فایل را با os.replace عوض می‌کند و این mmap همچنان فایل قبلی را می‌خواند
+        self._snapshot = None
+
+    def _read_snapshot(self, lazy=False):
+        if os.path.exists(self.path):
+            if not lazy:
+                with Snapshot(self.path) as snapshot:
+                    return snapshot.load()
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self._snapshot = Snapshot(self.path)
+            return self._snapshot.load_lazy(self.lock)
+        if self.json_path and os.path.exists(self.json_path) and not os.path.exists(self.journal_path):
+            logger.info("snapshot نیست؛ داده‌ها از %s خوانده می‌شوند", self.json_path)
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # فشرده‌سازی‌های بعدی snapshot را پایه می‌گیرند، نه فایل JSON
+            write_atomic(self.path, encode_snapshot(data))
+            return data
+        return None
+
+    def _encode_snapshot(self, data):
+        return encode_snapshot(data)
+
+    def close(self):
+        super().close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    icon TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    category_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    added_by TEXT,
+    last_modified_by TEXT,
+    last_modified_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_items_category_item ON items (category_id, item_id);
+CREATE TABLE IF NOT EXISTS ratings (
+    movie_name TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    rating INTEGER NOT NULL,
+    comment TEXT NOT NULL DEFAULT '',
+    user_name TEXT,
+    date TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ratings_movie_user ON ratings (movie_name, user_id);
+CREATE TABLE IF NOT EXISTS movies (
+    name TEXT PRIMARY KEY,
+    id INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS allowed_users (
+    user_id INTEGER PRIMARY KEY
+);
+"""
+
+ITEM_COLUMNS = ('text', 'completed', 'created_at', 'added_by', 'last_modified_by', 'last_modified_at')
+
+
+class SqliteStorage:
+    """ذخیره داده‌ها در SQLite (حالت WAL) - هر تغییر فقط سطرهای مربوط به خودش را می‌نویسد
+
+    فقط نوشتن سطری است: load همه سطرها را می‌خواند و ربات از داده‌های حافظه جواب می‌دهد،
+    پس حافظه و زمان شروع مثل حالت‌های دیگر با اندازه داده‌ها بزرگ می‌شوند.
+
+    ترتیب آیتم‌ها با item_id و ترتیب نمره‌ها با rowid حفظ می‌شود؛ اپدیت نمره یک کاربر
+    با ON CONFLICT انجام می‌شود تا جای آن در لیست تغییر نکند.
+    """
+
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+        # اتصال از thread ذخیره‌سازی هم استفاده می‌شود؛ دسترسی‌ها با lock ربات سریالی هستند
+        # چند پروسه (cluster.py) ممکن است هم‌زمان بنویسند؛ timeout منتظر آزاد شدن قفل پایگاه داده می‌ماند
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def load(self):
+        """ساخت داده‌های حافظه از جدول‌ها؛ پایگاه داده خالی یعنی None"""
+        meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        if not meta:
+            return None, []
+
+        data = {
+            'categories': {},
+            'next_category_id': meta.get('next_category_id', 1),
+            'next_item_id': meta.get('next_item_id', 1),
+            'next_movie_id': meta.get('next_movie_id', 1),
+            'movie_ratings': {}
+        }
+        for cat_id, name, icon in self.conn.execute('SELECT id, name, icon FROM categories ORDER BY id'):
+            data['categories'][str(cat_id)] = {'name': name, 'icon': icon, 'items': []}
+
+        rows = self.conn.execute(
+            f"SELECT category_id, item_id, {', '.join(ITEM_COLUMNS)} FROM items ORDER BY category_id, item_id"
+        )
+        for category_id, item_id, *values in rows:
+            category = data['categories'].get(str(category_id))
+            if category is None:
+                continue
+            item = {'id': str(item_id)}
+            for column, value in zip(ITEM_COLUMNS, values):
+                if column.startswith('last_modified') and value is None:
+                    continue
+                item[column] = value
+            item['completed'] = bool(item['completed'])
+            category['items'].append(item)
+
+        rows = self.conn.execute(
+            'SELECT movie_name, rating, comment, user_name, user_id, date FROM ratings ORDER BY rowid'
+        )
+        for movie_name, rating, comment, user_name, user_id, date in rows:
+            movie = data['movie_ratings'].setdefault(
+                movie_name, {'ratings': [], 'average': 0.0, 'total_ratings': 0}
+            )
+            movie['ratings'].append({
+                'rating': rating,
+                'comment': comment,
+                'user_name': user_name,
+                'user_id': user_id,
+                'date': date
+            })
+        # فیلم‌هایی که شناسه ذخیره شده ندارند هنگام ساخت ایندکس‌ها شناسه می‌گیرند
+        for movie_name, movie_id in self.conn.execute('SELECT name, id FROM movies'):
+            movie = data['movie_ratings'].get(movie_name)
+            if movie is not None:
+                movie['id'] = movie_id
+        for movie in data['movie_ratings'].values():
+            movie['total_ratings'] = len(movie['ratings'])
+            movie['average'] = sum(r['rating'] for r in movie['ratings']) / movie['total_ratings']
+        # سطر whitelist در meta یعنی کاربران مجاز به این پایگاه داده منتقل شده‌اند
+        if 'whitelist' in meta:
+            data['allowed_users'] = [user_id for user_id, in self.conn.execute('SELECT user_id FROM allowed_users')]
+        return data, []
+
+    def append(self, change, data):
+        """ثبت یک تغییر با چند دستور SQL در یک تراکنش"""
+        self.append_batch([change], data)
+
+    def append_batch(self, changes, data):
+        """ثبت چند تغییر در یک تراکنش"""
+        with self.lock, self.conn:
+            for change in changes:
+                self._write_change(change, data)
+
+    def _write_change(self, change, data):
+        op = change['op']
+        if op == 'add_category':
+            self.conn.execute(
+                'INSERT OR REPLACE INTO categories (id, name, icon) VALUES (?, ?, ?)',
+                (int(change['category_id']), change['name'], change['icon'])
+            )
+        elif op == 'delete_category':
+            cat_id = int(change['category_id'])
+            self.conn.execute('DELETE FROM items WHERE category_id = ?', (cat_id,))
+            self.conn.execute('DELETE FROM categories WHERE id = ?', (cat_id,))
+        elif op == 'add_item':
+            self._insert_item(change['category_id'], change['item'])
+        elif op == 'toggle_item':
+            self.conn.execute(
+                'UPDATE items SET completed = ?, last_modified_by = ?, last_modified_at = ? '
+                'WHERE category_id = ? AND item_id = ?',
+                (int(change['completed']), change['user_name'], change['at'],
+                 int(change['category_id']), int(change['item_id']))
+            )
+        elif op == 'delete_item':
+            self.conn.execute(
+                'DELETE FROM items WHERE category_id = ? AND item_id = ?',
+                (int(change['category_id']), int(change['item_id']))
+            )
+        elif op == 'add_movie_rating':
+            if 'movie_id' in change:
+                self._insert_movie(change['movie_name'], change['movie_id'])
+            self._upsert_rating(change['movie_name'], change['rating'])
+        elif op == 'delete_movie_rating':
+            self.conn.execute('DELETE FROM ratings WHERE movie_name = ?', (change['movie_name'],))
+            self.conn.execute('DELETE FROM movies WHERE name = ?', (change['movie_name'],))
+        elif op == 'allow_users':
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO allowed_users (user_id) VALUES (?)',
+                [(user_id,) for user_id in change['user_ids']]
+            )
+        elif op == 'disallow_users':
+            self.conn.executemany(
+                'DELETE FROM allowed_users WHERE user_id = ?', [(user_id,) for user_id in change['user_ids']]
+            )
+        else:
+            raise ValueError(f"تغییر ناشناخته: {op}")
+        self._write_meta(data)
+
+    def _insert_item(self, category_id, item):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO items (category_id, item_id, {', '.join(ITEM_COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (int(category_id), int(item['id']), item['text'], int(item['completed']),
+             item.get('created_at'), item.get('added_by'),
+             item.get('last_modified_by'), item.get('last_modified_at'))
+        )
+
+    def _insert_movie(self, movie_name, movie_id):
+        # دو پروسه‌ای که هم‌زمان برای یک فیلم شناسه ساخته‌اند روی کوچک‌ترین شناسه توافق می‌کنند
+        self.conn.execute(
+            'INSERT INTO movies (name, id) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET id = min(id, excluded.id)',
+            (movie_name, movie_id)
+        )
+
+    def _upsert_rating(self, movie_name, rating):
+        self.conn.execute(
+            'INSERT INTO ratings (movie_name, user_id, rating, comment, user_name, date) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (movie_name, user_id) DO UPDATE SET '
+            'rating = excluded.rating, comment = excluded.comment, '
+            'user_name = excluded.user_name, date = excluded.date',
+            (movie_name, rating['user_id'], rating['rating'], rating['comment'],
+             rating['user_name'], rating['date'])
+        )
+
+    def _write_meta(self, data):
+        # شمارنده‌ها فقط بالا می‌روند، حتی اگر پروسه دیگری مقدار بزرگ‌تری نوشته باشد
+        rows = [('next_category_id', data['next_category_id']), ('next_item_id', data['next_item_id']),
+                ('next_movie_id', data.get('next_movie_id', 1))]
+        if 'allowed_users' in data:
+            rows.append(('whitelist', 1))
+        self.conn.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)',
+            rows
+        )
+
+    def save(self, data):
+        """بازنویسی کامل جدول‌ها از روی داده‌های حافظه"""
+        with self.lock, self.conn:
+            self._write_all(data)
+
+    def _write_all(self, data):
+        self.conn.execute('DELETE FROM ratings')
+        self.conn.execute('DELETE FROM movies')
+        self.conn.execute('DELETE FROM items')
+        self.conn.execute('DELETE FROM categories')
+        self.conn.execute('DELETE FROM allowed_users')
+        for cat_id, category in data['categories'].items():
+            self.conn.execute(
+                'INSERT INTO categories (id, name, icon) VALUES (?, ?, ?)',
+                (int(cat_id), category['name'], category['icon'])
+            )
+            for item in category['items']:
+                self._insert_item(cat_id, item)
+        for movie_name, movie in data.get('movie_ratings', {}).items():
+            if 'id' in movie:
+                self._insert_movie(movie_name, movie['id'])
+            for rating in movie['ratings']:
+                self._upsert_rating(movie_name, rating)
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO allowed_users (user_id) VALUES (?)',
+            [(user_id,) for user_id in data.get('allowed_users', ())]
+        )
+        self._write_meta(data)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+SHARED_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    change TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_workers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    seq INTEGER NOT NULL
+);
+"""
+
+
+class SharedSqliteStorage(SqliteStorage):
+    """SqliteStorage برای چند پروسه روی یک پایگاه داده (cluster.py)؛ ترتیب تغییرات را SQLite تعیین می‌کند
+
+    هر تغییر در همان تراکنشی که سطرهایش را می‌نویسد با یک seq در جدول changes ثبت می‌شود.
+    WishlistBot هر تغییر را بین begin() و end() انجام می‌دهد: begin() قفل نوشتن پایگاه داده را
+    می‌گیرد (BEGIN IMMEDIATE) و تغییرات پروسه‌های دیگر را که هنوز اعمال نشده‌اند برمی‌گرداند، پس
+    بررسی‌ها روی آخرین داده‌ها انجام می‌شوند و همه پروسه‌ها تغییرات را به ترتیب seq اعمال می‌کنند.
+    read_changes() همین کار را بدون تراکنش نوشتن برای تغییرات پروسه‌های دیگر انجام می‌دهد.
+
+    نوشتن‌ها هم‌زمان هستند (بدون PersistScheduler)، چون seq باید قبل از پایان تراکنش معلوم باشد.
+    جای هر پروسه در لاگ در cluster_workers ثبت می‌شود تا رکوردهایی که همه خوانده‌اند پاک شوند.
+    """
+
+    def __init__(self, path, lock):
+        super().__init__(path, lock)
+        self.conn.executescript(SHARED_SQLITE_SCHEMA)
+        # آخرین seq اعمال شده در حافظه این پروسه
+        self.seq = 0
+        self.worker_id = None
+        self._begin_seq = 0
+        self._written = 0
+        self._commits = 0
+
+    def _last_seq(self):
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def load(self):
+        """خواندن جدول‌ها و seq متناظر در یک تراکنش، و ثبت این پروسه در cluster_workers"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                data, _ = super().load()
+                self.seq = self._last_seq()
+                self.worker_id = self.conn.execute(
+                    'INSERT INTO cluster_workers (seq) VALUES (?)', (self.seq,)
+                ).lastrowid
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+        return data, []
+
+    def _read_changes(self):
+        changes = []
+        for seq, change in self.conn.execute('SELECT seq, change FROM changes WHERE seq > ? ORDER BY seq', (self.seq,)):
+            changes.append(json.loads(change))
+            self.seq = seq
+        return changes
+
+    def read_changes(self):
+        """تغییراتی که بعد از آخرین seq اعمال شده ثبت شده‌اند، به ترتیب seq"""
+        with self.lock:
+            return self._read_changes()
+
+    def begin(self):
+        """شروع تراکنش نوشتن؛ خروجی تغییرات پروسه‌های دیگر که باید قبل از تغییر بعدی اعمال شوند"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._written = 0
+            try:
+                changes = self._read_changes()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self._begin_seq = self.seq
+            return changes
+
+    def append_batch(self, changes, data):
+        """نوشتن سطرهای تغییرات و ثبت آن‌ها در لاگ با seq بعدی؛ فقط بین begin() و end()"""
+        with self.lock:
+            if not self.conn.in_transaction:
+                raise RuntimeError("تغییرات پایگاه داده مشترک فقط بین begin() و end() نوشته می‌شوند")
+            for change in changes:
+                self._write_change(change, data)
+                record = json.dumps(change, ensure_ascii=False, separators=(',', ':'), default=to_json)
+                self.seq = self.conn.execute('INSERT INTO changes (change) VALUES (?)', (record,)).lastrowid
+                self._written += 1
+
+    def end(self):
+        """پایان تراکنش begin()؛ تغییرات نوشته شده ثبت می‌شوند"""
+        with self.lock:
+            if not self._written:
+                self.conn.rollback()
+                return
+            try:
+                self.conn.execute('UPDATE cluster_workers SET seq = ? WHERE id = ?', (self.seq, self.worker_id))
+                self._commits += 1
+                if self._commits % CHANGE_LOG_PRUNE_EVERY == 0:
+                    self.conn.execute('DELETE FROM changes WHERE seq <= (SELECT min(seq) FROM cluster_workers)')
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                # seqهای برگشت خورده به تغییرات بعدی پروسه‌های دیگر داده می‌شوند
+                self.seq = self._begin_seq
+                raise
+
+    def save(self, data):
+        """بازنویسی کامل جدول‌ها، فقط اگر از بارگذاری این پروسه تغییری در لاگ ثبت نشده باشد
+
+        تغییرات همیشه در تراکنش خودشان نوشته می‌شوند؛ این فقط برای اولین اجرا (داده‌های پیش‌فرض)
+        و شناسه‌های تازه فیلم‌های داده‌های قدیمی است. داده‌های حافظه‌ای که از پایگاه داده عقب‌تر
+        است روی تغییرات پروسه‌های دیگر نوشته نمی‌شود.
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._last_seq() == self.seq:
+                    self._write_all(data)
+                else:
+                    logger.warning("پایگاه داده مشترک تغییرات جدیدتری دارد؛ ذخیره کامل انجام نشد")
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def reset_log(self):
+        """پاک کردن لاگ تغییرات و جای کارگرها؛ فقط وقتی هیچ کارگری در حال اجرا نیست"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM changes')
+            self.conn.execute('DELETE FROM cluster_workers')
+
+    def close(self):
+        with self.lock:
+            if self.worker_id is not None:
+                with self.conn:
+                    self.conn.execute('DELETE FROM cluster_workers WHERE id = ?', (self.worker_id,))
+            self.conn.close()
+
+
+class PersistScheduler:
+    """زمان‌بندی ذخیره‌سازی در پس‌زمینه برای هر backend
+
+    تغییرات فقط در صف قرار می‌گیرند و thread ذخیره‌سازی هر delay_ms میلی‌ثانیه
+    (یا زودتر، با رسیدن به max_changes تغییر) همه را با یک append_batch می‌نویسد.
+    به این ترتیب event loop تلگرام منتظر دیسک نمی‌ماند و چند تغییر پشت سر هم
+    فقط یک بار نوشته می‌شوند. بهای آن این است که تغییری که به کاربر تایید شده تا delay_ms
+    (و اگر نوشتن خطا بدهد بیشتر) هنوز روی دیسک نیست و کرش پروسه در این فاصله آن را از بین می‌برد.
+
+    فقط همین thread در backend می‌نویسد؛ save() هم کارش را به آن می‌دهد و منتظر می‌ماند تا ترتیب
+    نوشتن (و seq ژورنال) همان ترتیب ثبت تغییرات بماند. نوشتن ناموفق با فاصله‌ای که هر بار دو برابر
+    می‌شود حداکثر max_retries بار تکرار می‌شود؛ بعد از آن به جای تغییرات کل داده‌ها ذخیره می‌شود.
+    close() تغییرات باقی‌مانده را ذخیره می‌کند و اگر نشود DataSaveError می‌دهد.
+    """
+
+    def __init__(self, backend, delay_ms=SAVE_DELAY_MS, max_changes=SAVE_MAX_CHANGES, max_retries=SAVE_MAX_RETRIES):
+        self.backend = backend
+        self.delay = delay_ms / 1000
+        self.max_changes = max_changes
+        self.max_retries = max_retries
+        self._pending = []
+        self._data = None
+        self._first_pending_at = None
+        # درخواست‌های save() به ترتیب رسیدن: [data, Event پایان، خطا]
+        self._saves = []
+        self._failures = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="persist-scheduler", daemon=True)
+        self._thread.start()
+
+    def load(self):
+        return self.backend.load()
+
+    def append(self, change, data):
+        """علامت‌گذاری داده‌ها به عنوان تغییر کرده؛ نوشتن بعدا انجام می‌شود"""
+        self.append_batch([change], data)
+
+    def append_batch(self, changes, data):
+        """چند تغییر با هم در صف؛ همه با یک append_batch در backend نوشته می‌شوند"""
+        with self._cond:
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.extend(changes)
+            self._data = data
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending or self._saves or self._closing):
+                    self._cond.wait()
+                # منتظر ماندن تا پایان پنجره تجمیع یا پر شدن دسته؛ save() منتظر نمی‌ماند
+                while not (self._closing or self._saves) and len(self._pending) < self.max_changes:
+                    remaining = self._first_pending_at + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closing and not self._pending and not self._saves:
+                    return
+                saves, self._saves = self._saves, []
+
+            if not self._write_pending():
+                with self._cond:
+                    if self._closing:
+                        # تلاش دوباره هنگام خاموش شدن فقط close() را معطل می‌کند؛ close() خطا می‌دهد
+                        error = DataSaveError(f"{len(self._pending)} تغییر ذخیره نشد")
+                        self._finish(saves + self._saves, error)
+                        self._saves = []
+                        return
+                    self._saves[:0] = saves
+                    delay = min(SAVE_RETRY_DELAY * 2 ** (self._failures - 1), SAVE_RETRY_MAX_DELAY)
+                    self._cond.wait_for(lambda: self._closing, delay)
+                continue
+            for request in saves:
+                try:
+                    self.backend.save(request[0])
+                except Exception as error:
+                    request[2] = error
+                request[1].set()
+
+    def _write_pending(self):
+        """نوشتن تغییرات صف؛ False یعنی نوشتن ناموفق بود و تغییرات برای تلاش دوباره در صف ماندند"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+            data = self._data
+        if not batch:
+            return True
+        try:
+            self.backend.append_batch(batch, data)
+        except Exception:
+            self._failures += 1
+            if self._failures <= self.max_retries and not self._closing:
+                logger.exception("خطا در ذخیره %d تغییر (تلاش %d)؛ دوباره تلاش می‌شود", len(batch), self._failures)
+                with self._cond:
+                    self._pending[:0] = batch
+                    self._first_pending_at = time.monotonic()
+                return False
+            # خطای تکرارشونده (مثلا رکوردی که به JSON تبدیل نمی‌شود): کل داده‌های حافظه جای این تغییرات را می‌گیرد
+            logger.critical("ذخیره %d تغییر بعد از %d تلاش ناموفق ماند؛ کل داده‌ها ذخیره می‌شود",
+                            len(batch), self._failures, exc_info=True)
+            try:
+                self.backend.save(data)
+            except Exception:
+                logger.critical("ذخیره کل داده‌ها هم ناموفق بود؛ %d تغییر فقط در حافظه است", len(batch), exc_info=True)
+                with self._cond:
+                    self._pending[:0] = batch
+                return False
+        self._failures = 0
+        return True
+
+    @staticmethod
+    def _finish(saves, error):
+        for request in saves:
+            request[2] = error
+            request[1].set()
+
+    def save(self, data):
+        """ذخیره کامل داده‌ها در thread ذخیره‌سازی بعد از تغییرات در صف؛ تا پایان آن منتظر می‌ماند
+
+        فراخواننده نباید قفل داده‌ها را داشته باشد؛ backendها هنگام نوشتن آن را می‌گیرند.
+        """
+        request = [data, threading.Event(), None]
+        with self._cond:
+            if self._closing:
+                raise DataSaveError("ذخیره‌سازی بسته شده است")
+            self._saves.append(request)
+            self._cond.notify()
+        request[1].wait()
+        if request[2] is not None:
+            raise request[2]
+
+    def close(self):
+        """توقف thread ذخیره‌سازی بعد از نوشتن تغییرات باقی‌مانده"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self.backend.close()
+        if self._pending:
+            logger.critical("%d تغییر هنگام خاموش شدن ذخیره نشد", len(self._pending))
+            raise DataSaveError(f"{len(self._pending)} تغییر هنگام خاموش شدن ذخیره نشد")
+
+
+class ObservedStorage:
+    """زمان‌سنجی عملیات‌های یک backend؛ observer(op, seconds, failed) بعد از هر عملیات صدا زده می‌شود"""
+
+    def __init__(self, backend, observer):
+        self.backend = backend
+        self.observer = observer
+
+    def _timed(self, op, *args):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return getattr(self.backend, op)(*args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.observer(op, time.perf_counter() - started, failed)
+
+    def load(self):
+        return self._timed('load')
+
+    def append(self, change, data):
+        return self._timed('append', change, data)
+
+    def append_batch(self, changes, data):
+        return self._timed('append_batch', changes, data)
+
+    def save(self, data):
+        return self._timed('save', data)
+
+    # فقط برای SharedSqliteStorage
+    def begin(self):
+        return self._timed('begin')
+
+    def end(self):
+        return self._timed('end')
+
+    def read_changes(self):
+        return self._timed('read_changes')
+
+    def close(self):
+        self.backend.close()
+
+
+def _file_storage(json_path, lock):
+    """backend فایلی داده‌ها: snapshot باینری اگر باشد، وگرنه فایل JSON با ژورنالش (اگر باشد)"""
+    snapshot_path = f"{os.path.splitext(json_path)[0]}.snap"
+    if os.path.exists(snapshot_path):
+        return SnapshotStorage(snapshot_path, lock)
+    return JournalStorage(json_path, lock)
+
+
+def has_file_data(json_path):
+    """آیا داده‌ای در حالت‌های json، journal یا snapshot ذخیره شده است"""
+    storage = _file_storage(json_path, threading.RLock())
+    return any(os.path.exists(path) for path in (storage.path, storage.journal_path, storage.old_journal_path))
+
+
+def read_file_data(json_path):
+    """همه داده‌های حالت‌های json، journal یا snapshot، با اعمال رکوردهای ژورنال"""
+    storage = _file_storage(json_path, threading.RLock())
+    try:
+        data, changes = storage.load()
+    finally:
+        storage.close()
+    if data is None:
+        raise DataLoadError(f"{storage.path} پیدا نشد")
+    for change in changes:
+        replay_change(data, change)
+    data.pop('journal_seq', None)
+    return data
+
+
+def migrate_json_to_sqlite(json_path, db_path, force=False):
+    """انتقال یک‌باره داده‌ها از فایل JSON قدیمی (یا snapshot و ژورنال آن) به پایگاه داده SQLite"""
+    data = read_file_data(json_path)
+    storage = SqliteStorage(db_path, threading.RLock())
+    try:
+        existing, _ = storage.load()
+        if existing is not None and not force:
+            raise SystemExit(f"❌ پایگاه داده {db_path} خالی نیست! برای بازنویسی از --force استفاده کنید.")
+        storage.save(data)
+    finally:
+        storage.close()
+    items = sum(len(category['items']) for category in data['categories'].values())
+    ratings = sum(len(movie['ratings']) for movie in data.get('movie_ratings', {}).values())
+    return len(data['categories']), items, ratings
+
+
+def create_storage(mode, path, lock, db_path=None, delay_ms=SAVE_DELAY_MS, observer=None):
+    """ساخت backend ذخیره‌سازی بر اساس حالت انتخاب شده (با زمان‌سنجی اگر observer داده شود)"""
+    if mode == 'json':
+        backend = JsonStorage(path, lock)
+    elif mode == 'journal':
+        backend = JournalStorage(path, lock)
+    elif mode == 'snapshot':
+        backend = SnapshotStorage(f"{os.path.splitext(path)[0]}.snap", lock, json_path=path)
+    elif mode == 'sqlite':
+        backend = SqliteStorage(db_path or f"{os.path.splitext(path)[0]}.db", lock)
+    elif mode == 'cluster':
+        backend = SharedSqliteStorage(db_path or f"{os.path.splitext(path)[0]}.db", lock)
+    else:
+        raise ValueError(f"حالت ذخیره‌سازی نامعتبر: {mode}")
+    if observer is not None:
+        backend = ObservedStorage(backend, observer)
+    if delay_ms > 0 and mode != 'cluster':
+        return PersistScheduler(backend, delay_ms)
+    return backend
+
+
+def convert_snapshot(source, target):
+    """تبدیل wishlist_data.json به snapshot باینری یا برعکس (بر اساس پسوند مقصد)"""
+    if source.endswith('.snap'):
+        with Snapshot(source) as snapshot:
+            data = snapshot.load()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    write_atomic(target, encode_snapshot(data) if target.endswith('.snap') else dump_data(data))
+    return os.path.getsize(source), os.path.getsize(target)
+
+
+def main():
+    """ابزار خط فرمان برای انتقال داده‌ها به SQLite و تبدیل snapshot"""
+    parser = argparse.ArgumentParser(description="PaNIrBot storage tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="انتقال wishlist_data.json (یا snapshot و ژورنال آن) به SQLite")
+    migrate.add_argument('json_path', nargs='?', default='wishlist_data.json')
+    migrate.add_argument('db_path', nargs='?', default='wishlist_data.db')
+    migrate.add_argument('--force', action='store_true', help="بازنویسی پایگاه داده غیرخالی")
+    convert = subparsers.add_parser('convert', help="تبدیل JSON به snapshot باینری (.snap) یا برعکس")
+    convert.add_argument('source')
+    convert.add_argument('target')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        source_size, target_size = convert_snapshot(args.source, args.target)
+        print(f"✅ {args.source} ({source_size:,} بایت) → {args.target} ({target_size:,} بایت)")
+    elif args.command == 'migrate':
+        categories, items, ratings = migrate_json_to_sqlite(args.json_path, args.db_path, args.force)
+        print(f"✅ {categories} دسته، {items} آیتم و {ratings} نمره به {args.db_path} منتقل شد.")
+
+
+if __name__ == '__main__':
+    main()
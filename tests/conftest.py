@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# ماژول‌های ربات همدیگر را از پوشه bot/ به صورت مستقیم import می‌کنند
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot'))
+
+
+@pytest.fixture
+def panirbot(tmp_path, monkeypatch):
+    """ماژول panirbot با فایل‌های داده در یک پوشه موقت (ربات سطح ماژول هم همان‌جا ساخته می‌شود)"""
+    monkeypatch.chdir(tmp_path)
+    import panirbot
+    return panirbot
+
+
+@pytest.fixture
+def wishlist(panirbot):
+    """یک WishlistBot تازه روی داده‌های خالی"""
+    bot = panirbot.WishlistBot()
+    yield bot
+    bot.close()
@@ -0,0 +1,27 @@
+from bulk import import_records
+
+
+def category(name):
+    return {'type': 'category', 'category': name, 'icon': '📁'}
+
+
+def item(name, text):
+    return {'type': 'item', 'category': name, 'text': text, 'added_by': 'ali',
+            'completed': False, 'created_at': '2024-01-02 10:00'}
+
+
+def test_import_reuses_categories_by_name(wishlist):
+    first = wishlist.add_category('بازی')
+    wishlist.add_category('بازی')
+    stats = import_records(wishlist, [category('بازی'), item('بازی', 'a'), item('سفر', 'b'), item('سفر', 'c')])
+    assert stats == {'categories': 1, 'items': 3, 'ratings': 0, 'skipped': 1}
+    assert [i['text'] for i in wishlist.data['categories'][first]['items']] == ['a']
+
+    # نام دسته‌های حذف شده از نقشه نام‌ها هم حذف می‌شود
+    wishlist.delete_category(first)
+    second = wishlist.find_category('بازی')
+    assert second not in (None, first)
+    wishlist.delete_category(second)
+    assert wishlist.find_category('بازی') is None
+    import_records(wishlist, [item('بازی', 'a')])
+    assert wishlist.find_category('بازی') not in (None, first, second)
@@ -0,0 +1,96 @@
+import json
+import random
+import threading
+
+import pytest
+
+from models import to_json
+
+
+@pytest.fixture
+def workers(panirbot, monkeypatch):
+    """دو WishlistBot روی یک پایگاه داده مشترک، مثل دو کارگر cluster.py"""
+    monkeypatch.setattr(panirbot, 'STORAGE_MODE', 'cluster')
+    bots = []
+    for index in range(2):
+        bot = panirbot.WishlistBot()
+        bot.set_id_stride(index, 2)
+        bots.append(bot)
+    yield bots
+    for bot in bots:
+        bot.close()
+
+
+def dump(bot):
+    return json.dumps(bot.data, ensure_ascii=False, sort_keys=True, default=to_json)
+
+
+def sync(bots):
+    for bot in bots:
+        bot.apply_remote_changes()
+
+
+def test_interleaved_delete_rate_and_toggles_converge(panirbot, workers):
+    first, second = workers
+    first.add_movie_rating("Matrix", 8, "", "a", 1)
+    cat_id = first.add_category("سفر")
+    first.add_item(cat_id, "x", "a")
+    item_id = first.data['categories'][cat_id]['items'][0]['id']
+    sync(workers)
+
+    # کارگر اول فیلم را حذف می‌کند و کارگر دوم، که هنوز خبر ندارد، به آن نمره می‌دهد
+    assert first.delete_movie_rating("Matrix")
+    assert second.add_movie_rating("Matrix", 6, "", "b", 2)
+    # دو تغییر وضعیت در یک کارگر و یکی در کارگر دیگر
+    assert first.toggle_item(cat_id, item_id, "a")
+    assert first.toggle_item(cat_id, item_id, "a")
+    assert second.toggle_item(cat_id, item_id, "b")
+    # compare-and-set روی آخرین وضعیت ثبت شده انجام می‌شود، نه وضعیت قدیمی حافظه کارگر
+    with pytest.raises(panirbot.StaleChange):
+        first.toggle_item(cat_id, item_id, "a", expected=False)
+    sync(workers)
+
+    assert dump(first) == dump(second)
+    assert [r['user_id'] for r in first.get_movie("Matrix")['ratings']] == [2]
+    assert first.get_item(cat_id, item_id)['completed'] is True
+    assert first.version('movie', 'Matrix') and second.version('category', cat_id)
+
+    reloaded = panirbot.WishlistBot()
+    try:
+        assert dump(reloaded) == dump(first)
+    finally:
+        reloaded.close()
+
+
+def test_concurrent_workers_end_with_identical_data(workers):
+    cat_id = workers[0].add_category("سفر")
+    for number in range(5):
+        workers[0].add_item(cat_id, f"item {number}", "a")
+    sync(workers)
+    item_ids = [item['id'] for item in workers[0].data['categories'][cat_id]['items']]
+
+    start = threading.Barrier(len(workers))
+
+    def run(bot, seed):
+        rng = random.Random(seed)
+        start.wait()
+        for _ in range(200):
+            action = rng.random()
+            if action < 0.4:
+                bot.toggle_item(cat_id, rng.choice(item_ids), "u")
+            elif action < 0.7:
+                bot.add_movie_rating(f"movie {rng.randrange(3)}", rng.randint(1, 10), "", "u", rng.randrange(4))
+            elif action < 0.8:
+                bot.delete_movie_rating(f"movie {rng.randrange(3)}")
+            else:
+                bot.apply_remote_changes()
+
+    threads = [threading.Thread(target=run, args=(bot, seed)) for seed, bot in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sync(workers)
+
+    assert dump(workers[0]) == dump(workers[1])
+    assert workers[0].get_movie_stats() == workers[1].get_movie_stats()
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+import storage
+from storage import DataLoadError, JournalStorage, replay_change
+
+
+def empty_data():
+    return {'categories': {}, 'next_category_id': 1, 'next_item_id': 1, 'next_movie_id': 1}
+
+
+def add_category(cat_id):
+    return {'op': 'add_category', 'category_id': str(cat_id), 'name': f"c{cat_id}", 'icon': '⭐'}
+
+
+def reload(path):
+    """داده‌ها همان‌طور که ربات بعد از اجرای دوباره می‌سازد"""
+    journal = JournalStorage(path, threading.RLock())
+    data, changes = journal.load()
+    journal.close()
+    for change in changes:
+        replay_change(data, change)
+    return data
+
+
+def write_journal(path, cat_ids):
+    """snapshot خالی و ژورنالی با یک رکورد برای هر دسته؛ مسیر فایل ژورنال"""
+    journal = JournalStorage(path, threading.RLock(), compact_every=100)
+    journal.save(empty_data())
+    for cat_id in cat_ids:
+        journal.append(add_category(cat_id), None)
+    journal.close()
+    return journal.journal_path
+
+
+def test_corrupt_last_line_is_truncated(tmp_path):
+    path = str(tmp_path / 'data.json')
+    journal_path = write_journal(path, [1, 2])
+    with open(journal_path, 'rb') as f:
+        valid = f.read()
+    # کرش وسط نوشتن رکورد سوم
+    with open(journal_path, 'ab') as f:
+        f.write(b'{"seq": 3, "op": "add_cat')
+
+    assert sorted(reload(path)['categories']) == ['1', '2']
+    with open(journal_path, 'rb') as f:
+        assert f.read() == valid
+
+    # رکوردهای بعدی بعد از آخرین رکورد سالم نوشته می‌شوند
+    journal = JournalStorage(path, threading.RLock(), compact_every=100)
+    journal.load()
+    journal.append(add_category(3), None)
+    journal.close()
+    assert sorted(reload(path)['categories']) == ['1', '2', '3']
+
+
+def test_last_line_without_newline_is_kept(tmp_path):
+    path = str(tmp_path / 'data.json')
+    journal_path = write_journal(path, [1, 2])
+    with open(journal_path, 'rb') as f:
+        content = f.read()
+    with open(journal_path, 'wb') as f:
+        f.write(content.rstrip(b'\n'))
+
+    assert sorted(reload(path)['categories']) == ['1', '2']
+    with open(journal_path, 'rb') as f:
+        assert f.read() == content
+
+
+def test_corrupt_middle_line_fails_to_load(tmp_path):
+    path = str(tmp_path / 'data.json')
+    journal_path = write_journal(path, [1, 2])
+    with open(journal_path, 'rb') as f:
+        first, second = f.read().splitlines(keepends=True)
+    with open(journal_path, 'wb') as f:
+        f.write(first + b'{"seq": 2, "op\n' + second)
+
+    journal = JournalStorage(path, threading.RLock())
+    with pytest.raises(DataLoadError):
+        journal.load()
+    journal.close()
+    # فایل خراب دست نمی‌خورد
+    with open(journal_path, 'rb') as f:
+        assert f.read().count(b'\n') == 3
+
+
+def test_compaction_overlapping_rotation_keeps_new_records(tmp_path, monkeypatch):
+    path = str(tmp_path / 'data.json')
+    journal = JournalStorage(path, threading.RLock(), compact_every=3)
+    journal.save(empty_data())
+    journal.append(add_category(1), None)
+
+    # save() وسط نوشتن snapshot می‌ماند تا رکوردهای بعدی یک فشرده‌سازی دیگر را راه بیندازند
+    writing, release = threading.Event(), threading.Event()
+    write_atomic = storage.write_atomic
+
+    def slow_write(target, content):
+        if not writing.is_set():
+            writing.set()
+            release.wait(5)
+        write_atomic(target, content)
+
+    monkeypatch.setattr(storage, 'write_atomic', slow_write)
+    data = reload(path)
+    saving = threading.Thread(target=journal.save, args=(data,))
+    saving.start()
+    assert writing.wait(5)
+    for cat_id in range(2, 6):
+        journal.append(add_category(cat_id), None)
+    release.set()
+    saving.join()
+    journal.close()
+
+    assert sorted(reload(path)['categories']) == ['1', '2', '3', '4', '5']
+
+
+def test_background_compaction_replays_into_snapshot(tmp_path):
+    path = str(tmp_path / 'data.json')
+    journal = JournalStorage(path, threading.RLock(), compact_every=2)
+    journal.save(empty_data())
+    for cat_id in range(1, 6):
+        journal.append(add_category(cat_id), None)
+    journal.close()
+
+    data = reload(path)
+    assert sorted(data['categories']) == ['1', '2', '3', '4', '5']
+    assert data['next_category_id'] == 6
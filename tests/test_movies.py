@@ -0,0 +1,35 @@
+def brute_force_unrated(bot, user_id):
+    return [name for name, _ in bot.get_movies_range('name') if not bot.get_user_movie_rating(name, user_id)]
+
+
+def test_unrated_movies_pages_skip_rated_movies(wishlist):
+    for number in range(12):
+        wishlist.add_movie_rating(f"movie {number:02}", 5, "", "a", 1 if number % 3 else 2)
+    wishlist.add_movie_rating("movie 04", 7, "", "b", 2)
+    wishlist.add_movie_rating("movie 04", 8, "", "b", 2)
+
+    for user_id in (1, 2, 3):
+        expected = brute_force_unrated(wishlist, user_id)
+        assert wishlist.count_unrated_movies(user_id) == len(expected)
+        pages = [wishlist.get_unrated_movies(user_id, start, start + 5) for start in range(0, 15, 5)]
+        assert sum(pages, []) == expected
+        assert wishlist.get_unrated_movies(user_id) == expected
+
+
+def test_unrated_movies_after_delete_and_reload(panirbot, wishlist):
+    wishlist.add_movie_rating("a", 5, "", "a", 1)
+    wishlist.add_movie_rating("b", 5, "", "a", 1)
+    wishlist.add_movie_rating("b", 6, "", "c", 3)
+    wishlist.delete_movie_rating("a")
+    assert wishlist.count_unrated_movies(1) == 0
+    assert wishlist.get_unrated_movies(3) == []
+    wishlist.add_movie_rating("c", 6, "", "c", 3)
+    assert wishlist.get_unrated_movies(1) == ["c"]
+
+    wishlist.close()
+    reloaded = panirbot.WishlistBot()
+    try:
+        assert reloaded.get_unrated_movies(1) == ["c"]
+        assert reloaded.count_unrated_movies(3) == 0
+    finally:
+        reloaded.close()
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import storage
+from storage import DataSaveError, PersistScheduler
+
+
+class FakeBackend:
+    """backend ساختگی که نوشتن‌ها را (با نام thread) ثبت می‌کند و می‌تواند خطا بدهد"""
+
+    def __init__(self, fail_append=False, fail_save=False):
+        self.fail_append = fail_append
+        self.fail_save = fail_save
+        self.writes = []
+
+    def append_batch(self, changes, data):
+        if self.fail_append:
+            raise TypeError("not serializable")
+        self.writes.append(('append', list(changes), threading.current_thread().name))
+
+    def save(self, data):
+        if self.fail_save:
+            raise OSError("disk full")
+        self.writes.append(('save', data, threading.current_thread().name))
+
+    def close(self):
+        pass
+
+
+def close_in_thread(scheduler):
+    errors = []
+
+    def run():
+        try:
+            scheduler.close()
+        except DataSaveError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "close() hung"
+    return errors
+
+
+def test_save_runs_on_scheduler_thread_after_pending_changes():
+    backend = FakeBackend()
+    scheduler = PersistScheduler(backend, delay_ms=10000)
+    scheduler.append({'op': 'x'}, {'v': 1})
+    scheduler.save({'v': 2})
+    scheduler.close()
+    assert [(kind, thread) for kind, _, thread in backend.writes] == [
+        ('append', 'persist-scheduler'), ('save', 'persist-scheduler')
+    ]
+
+
+def test_close_gives_up_loudly_when_writes_keep_failing():
+    backend = FakeBackend(fail_append=True, fail_save=True)
+    scheduler = PersistScheduler(backend, delay_ms=10000)
+    scheduler.append({'op': 'x'}, {'v': 1})
+    errors = close_in_thread(scheduler)
+    assert len(errors) == 1
+    with pytest.raises(DataSaveError):
+        scheduler.save({'v': 2})
+
+
+def test_repeated_failure_falls_back_to_full_save(monkeypatch):
+    monkeypatch.setattr(storage, 'SAVE_RETRY_DELAY', 0.01)
+    backend = FakeBackend(fail_append=True)
+    scheduler = PersistScheduler(backend, delay_ms=1, max_retries=2)
+    scheduler.append({'op': 'x'}, {'v': 1})
+    deadline = time.monotonic() + 5
+    while not backend.writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [kind for kind, _, _ in backend.writes] == ['save']
+    assert close_in_thread(scheduler) == []
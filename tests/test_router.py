@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from router import COMPACT_MARKER, MAX_DATA_LENGTH, CallbackRouter, UnknownRoute
+
+
+async def noop(update, context, *args):
+    return args
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    router.register("view_category", noop, str, int, code=2)
+    router.register("view", noop, str, code=3)
+    router.register("set_rating", noop, int, int, code=16)
+    router.register("sort_movies", noop, str)
+    return router
+
+
+@pytest.mark.parametrize("args", [(0, 0), (127, 128), (300, 2 ** 35), (1, 2 ** 63)])
+def test_compact_round_trip(router, args):
+    data = router.pack("set_rating", *args)
+    assert data.startswith(COMPACT_MARKER)
+    route, parsed = router.parse(data)
+    assert route.name == "set_rating"
+    assert parsed == list(args)
+
+
+def test_compact_converts_to_registered_types(router):
+    data = router.pack("view_category", "12", 3)
+    assert data.startswith(COMPACT_MARKER)
+    assert router.parse(data)[1] == ["12", 3]
+
+
+def test_non_numeric_args_use_text_form(router):
+    assert router.pack("view_category", "abc", 1) == "view_category:abc:1"
+    assert router.pack("view_category", "012", 1) == "view_category:012:1"
+    assert router.pack("sort_movies", "name") == "sort_movies:name"
+    assert router.parse("view_category:a:b:4")[1] == ["a:b", 4]
+
+
+@pytest.mark.parametrize("data", ["~", "~!!", "~" + "_w", "~AoA"])
+def test_bad_compact_data_is_unknown(router, data):
+    # کد ثبت نشده، base64 خراب یا varint ناقص
+    with pytest.raises(UnknownRoute):
+        asyncio.run(router.dispatch(None, None, data))
+
+
+def test_legacy_underscore_form(router):
+    # طولانی‌ترین نام مسیری که پیشوند است انتخاب می‌شود و اولین آرگومان «_» را نگه می‌دارد
+    route, args = router.parse("view_category_my_cat_5")
+    assert route.name == "view_category"
+    assert args == ["my_cat", 5]
+    route, args = router.parse("view_x")
+    assert route.name == "view"
+    assert args == ["x"]
+    with pytest.raises(UnknownRoute):
+        router.parse("viewer_1")
+
+
+def test_length_limit(router):
+    assert len(router.pack("set_rating", 2 ** 63, 2 ** 63)) <= MAX_DATA_LENGTH
+    assert router.pack("sort_movies", "x" * (MAX_DATA_LENGTH - len("sort_movies:")))
+    with pytest.raises(ValueError):
+        router.pack("sort_movies", "x" * MAX_DATA_LENGTH)
+    with pytest.raises(ValueError):
+        # حد بر حسب بایت است، نه تعداد حرف
+        router.pack("sort_movies", "ف" * 30)
+
+
+def test_dispatch_answers_only_routes_without_answers():
+    router = CallbackRouter()
+    router.register("screen", noop, int, code=1)
+    router.register("action", noop, int, code=2, answers=True)
+    answered = []
+
+    async def answer():
+        answered.append(True)
+
+    assert asyncio.run(router.dispatch(None, None, router.pack("screen", 5), before=answer)) == (5,)
+    assert answered == [True]
+    asyncio.run(router.dispatch(None, None, router.pack("action", 5), before=answer))
+    assert answered == [True]
+    assert router.stats["screen"].count == 1
+
+
+def test_args_without_converter_keep_their_form(router):
+    router.register("view_movie", noop, None, code=14)
+    assert router.parse(router.pack("view_movie", 7))[1] == [7]
+    assert router.parse("view_movie:1917")[1] == ["1917"]
+    assert router.parse("view_movie_Movie: Part 2")[1] == ["Movie: Part 2"]
@@ -0,0 +1,170 @@
+import json
+import struct
+import threading
+
+import pytest
+
+from models import LazyRecord, to_json
+from snapshot import MAGIC, Snapshot, SnapshotError, encode_snapshot
+
+
+def sample_data():
+    return {
+        'categories': {
+            '1': {'name': 'کتاب‌ها', 'icon': '📚', 'items': [
+                {'id': '1', 'text': 'a', 'completed': False, 'created_at': '2024-01-02 10:00', 'added_by': 'ali'},
+                {'id': '2', 'text': 'b: c', 'completed': True, 'created_at': '2024-01-02 10:05',
+                 'added_by': 'ali', 'last_modified_by': 'sara', 'last_modified_at': '2024-01-03 09:00'},
+            ]},
+            '2': {'name': 'خالی', 'icon': '📁', 'items': []},
+        },
+        'next_category_id': 3,
+        'movie_ratings': {
+            'Matrix': {'id': 1, 'average': 7.5, 'total_ratings': 2, 'ratings': [
+                {'rating': 8, 'comment': '', 'user_name': 'ali', 'user_id': 10, 'date': '2024-01-04 20:00'},
+                {'rating': 7, 'comment': 'خوب', 'user_name': 'sara', 'user_id': 11, 'date': '2024-01-05 21:00'},
+            ]},
+        },
+        'next_movie_id': 2,
+        'allowed_users': [10, 11],
+    }
+
+
+def dump(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=to_json)
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = tmp_path / 'data.snap'
+    path.write_bytes(encode_snapshot(sample_data()))
+    return path
+
+
+def test_round_trip(snapshot_path):
+    with Snapshot(str(snapshot_path)) as snapshot:
+        data = snapshot.load()
+        assert list(data) == list(sample_data())
+        assert dump(data) == dump(sample_data())
+        assert snapshot.category_ids() == ['1', '2']
+        assert snapshot.movie_names() == ['Matrix']
+        assert snapshot.read_movie('Matrix')['ratings'][1]['comment'] == 'خوب'
+        assert snapshot.read_category('2')['items'] == []
+        assert snapshot.read_category('3') is None
+        assert snapshot.read_movie('Other') is None
+
+
+def test_encode_is_stable_after_round_trip(snapshot_path):
+    with Snapshot(str(snapshot_path)) as snapshot:
+        assert encode_snapshot(snapshot.load()) == snapshot_path.read_bytes()
+
+
+@pytest.mark.parametrize('size', [0, 4, len(MAGIC), -1, -len(MAGIC) - 1])
+def test_truncated_file(snapshot_path, size):
+    content = snapshot_path.read_bytes()
+    snapshot_path.write_bytes(content[:size] if size >= 0 else content[:len(content) + size])
+    with pytest.raises(SnapshotError):
+        Snapshot(str(snapshot_path))
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / 'data.snap'
+    path.write_text(json.dumps(sample_data()))
+    with pytest.raises(SnapshotError):
+        Snapshot(str(path))
+
+
+def test_record_overflow(snapshot_path):
+    # طول رکورد اولین دسته بیشتر از باقی فایل
+    content = bytearray(snapshot_path.read_bytes())
+    struct.pack_into('<I', content, len(MAGIC), len(content))
+    snapshot_path.write_bytes(bytes(content))
+    with Snapshot(str(snapshot_path)) as snapshot:
+        with pytest.raises(SnapshotError, match='overflows'):
+            snapshot.read_category('1')
+        assert snapshot.read_movie('Matrix')['id'] == 1
+
+
+def test_bad_index_offset(snapshot_path):
+    content = bytearray(snapshot_path.read_bytes())
+    struct.pack_into('<Q', content, len(content) - len(MAGIC) - 8, len(content) * 2)
+    snapshot_path.write_bytes(bytes(content))
+    with pytest.raises(SnapshotError):
+        Snapshot(str(snapshot_path))
+
+
+def test_lazy_load_reads_records_on_access(snapshot_path):
+    with Snapshot(str(snapshot_path)) as snapshot:
+        data = snapshot.load_lazy(threading.RLock())
+        category = data['categories']['1']
+        movie = data['movie_ratings']['Matrix']
+        assert isinstance(category, LazyRecord) and not category.loaded
+        assert category['name'] == 'کتاب‌ها' and category.stats == {'completed': 1, 'total': 2}
+        assert movie['average'] == 7.5 and movie.stats['raters'] == [10, 11]
+        # کپی و نوشتن snapshot جدید رکوردها را نمی‌خوانند
+        copy = category.copy()
+        assert encode_snapshot(data) == snapshot_path.read_bytes()
+        assert not category.loaded and not copy.loaded
+
+        assert category['items'][1]['text'] == 'b: c'
+        assert category.loaded and not movie.loaded
+        assert dump(data) == dump(sample_data())
+
+
+def test_lazy_load_of_old_snapshot_reads_everything(snapshot_path, tmp_path):
+    # snapshot قدیمی: ایندکس فقط جای رکوردها را دارد
+    with Snapshot(str(snapshot_path)) as snapshot:
+        index_offset = len(snapshot_path.read_bytes()) - len(MAGIC) - 8
+        categories = [[cat_id, snapshot._categories[cat_id]] for cat_id in snapshot.category_ids()]
+        movies = [[name, snapshot._movies[name]] for name in snapshot.movie_names()]
+        index = {'keys': snapshot._keys, 'meta': snapshot.meta, 'categories': categories, 'movies': movies}
+    content = snapshot_path.read_bytes()
+    offset, = struct.unpack_from('<Q', content, index_offset)
+    payload = json.dumps(index, ensure_ascii=False).encode()
+    old_path = tmp_path / 'old.snap'
+    old_path.write_bytes(content[:offset] + struct.pack('<I', len(payload)) + payload + struct.pack('<Q', offset) + MAGIC)
+    with Snapshot(str(old_path)) as snapshot:
+        assert not snapshot.summarized
+        data = snapshot.load_lazy(threading.RLock())
+        assert not isinstance(data['categories']['1'], LazyRecord)
+        assert dump(data) == dump(sample_data())
+
+
+def test_bot_reads_snapshot_records_on_demand(panirbot, monkeypatch):
+    monkeypatch.setattr(panirbot, 'STORAGE_MODE', 'snapshot')
+    bot = panirbot.WishlistBot()
+    first, second = bot.add_category("سفر"), bot.add_category("بازی")
+    bot.add_item(first, "x", "a")
+    bot.add_item(second, "y", "a")
+    bot.add_movie_rating("Matrix", 8, "", "a", 1)
+    bot.add_movie_rating("Alien", 6, "", "a", 2)
+    # snapshot کامل (مثل فشرده‌سازی ژورنال)، تا بارگذاری بعدی رکوردی از ژورنال اعمال نکند
+    bot.save_data()
+    bot.close()
+
+    bot = panirbot.WishlistBot()
+    try:
+        categories, movies = bot.data['categories'], bot.data['movie_ratings']
+        assert not any(record.loaded for record in [*categories.values(), *movies.values()])
+        # آمارها، لیست‌ها و جستجو از خلاصه ایندکس snapshot
+        assert bot.item_counts(first) == (0, 1)
+        assert bot.get_unrated_movies(1) == ["Alien"]
+        assert bot.get_movie_stats()['distribution'] == {8: 1, 6: 1}
+        assert ('item', second, bot.partition_items(second, False, 5)[0]['id']) in bot.search("y")
+        assert not categories[first].loaded and categories[second].loaded
+
+        item_id = categories[first]['items'][0]['id']
+        assert bot.toggle_item(first, item_id, "b")
+        assert bot.item_counts(first) == (1, 1)
+        bot.add_movie_rating("Matrix", 4, "", "b", 2)
+        assert not movies["Alien"].loaded
+        assert bot.get_movie("Matrix")['average'] == 6
+        expected = dump(bot.data)
+    finally:
+        bot.close()
+
+    bot = panirbot.WishlistBot()
+    try:
+        assert dump(bot.data) == expected
+    finally:
+        bot.close()